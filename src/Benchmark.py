@@ -0,0 +1,156 @@
+import os, sys
+
+
+path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if not path in sys.path:
+    sys.path.insert(1, path)
+del path
+
+from argparse import ArgumentParser
+from json import dumps
+from multiprocessing import Pool
+import resource
+from time import time
+import numpy
+from src.LargeTopology import makeLargeTopology
+from src.Scenarios import makeSimulator
+from src.simulator.Clock import VirtualClock
+from src.simulator.RandomSimulator import RandomSimulator
+from src.simulator.TickFrame import TickFrame
+from src.simulator.scenarios.IndividualMachineFailureSimulator import IndividualMachineFailureSimulator
+from src.simulator.scenarios.RackFailureSimulator import RackFailureSimulator
+from src.simulator.scenarios.UnevenLoadSimulator import UnevenLoadSimulator
+
+__author__ = 'Roman'
+
+# Map from scenario name to the cluster simulator it runs
+clusterSimulators = {
+    'random': RandomSimulator,
+    'heterogeneous': RandomSimulator,
+    'uneven': UnevenLoadSimulator,
+    'individual': IndividualMachineFailureSimulator,
+    'rack': RackFailureSimulator
+}
+
+# Phases of a tick, in the order they run
+PHASES = ['events', 'stateChange', 'apply', 'mapReduce', 'serialization']
+
+MACHINES_PER_RACK = 40
+
+def makeUniformTopology(size):
+    """
+        Builds a topology of (about) 'size' machines, in racks of MACHINES_PER_RACK machines
+    """
+    racks = max(1, (size - 1) // (MACHINES_PER_RACK + 1))
+    return makeLargeTopology([MACHINES_PER_RACK, racks])
+
+def makeHeterogeneousTopology(size):
+    """
+        Builds a topology of (about) 'size' machines, in racks of very different sizes
+    """
+    machines = []
+    racks = []
+    while len(machines) < size:
+        rackNumber = len(racks) + 1
+        rack = {'name': 'rack%d' % rackNumber, 'children': []}
+        for machineNumber in xrange(1, numpy.random.randint(8, 2 * MACHINES_PER_RACK) + 1):
+            name = 'machine%d-%d' % (rackNumber, machineNumber)
+            machines.append(name)
+            rack['children'].append({'name': name})
+        racks.append(rack)
+
+    return {
+        'machines': machines,
+        'structure': {'name': 'master', 'children': racks}
+    }
+
+def timePhase(timings, phase, function, *args):
+    """
+        Calls the function, adding the time it took to the phase's timing
+    """
+    started = time()
+    result = function(*args)
+    timings[phase] += time() - started
+    return result
+
+def runBenchmark(scenario, size, ticks, vectorized, seed, eventsPerTick=None):
+    """
+        Runs a scenario on a cluster of the given size for a number of ticks, without waiting between ticks, and returns
+        the time spent in each phase of a tick, the peak RSS and the number of bytes sent per tick
+    """
+    clock = VirtualClock(0, seed)
+    topology = makeHeterogeneousTopology(size) if scenario == 'heterogeneous' else makeUniformTopology(size)
+
+    started = time()
+    simulator = makeSimulator(clusterSimulators[scenario], topology, clock, vectorized=vectorized, eventsPerTick=eventsPerTick)
+    setupTime = time() - started
+
+    clusterSimulator = simulator.getClusterSimulator()
+    mapReduceSimulator = simulator.getMapReduceSimulator()
+
+    timings = dict((phase, 0.0) for phase in PHASES)
+    encodedBytes = 0
+
+    # Same steps as DefaultSimulator.step & RandomSimulator.updates
+    for sequence in xrange(1, ticks + 1):
+        clock.sleep(1)
+
+        logEvents = timePhase(timings, 'events', clusterSimulator.generateLogEvents)
+        stateChange = timePhase(timings, 'stateChange', clusterSimulator.getStateChange, logEvents)
+        timePhase(timings, 'apply', clusterSimulator.applyChanges, stateChange)
+        timePhase(timings, 'stateChange', clusterSimulator.addVectorizedStateChanges, stateChange)
+        mapReduceUpdates = timePhase(timings, 'mapReduce', mapReduceSimulator.updates)
+        timePhase(timings, 'serialization', clusterSimulator.formatStateChange, stateChange)
+
+        log = {
+            'cluster': {'events': logEvents, 'stateChange': stateChange},
+            'mapReduce': mapReduceUpdates
+        }
+        frame = timePhase(timings, 'serialization', TickFrame, log, mapReduceSimulator.getTime(), sequence)
+        encodedBytes += len(frame.encoded)
+
+    # what a client joining at the end would cost
+    started = time()
+    snapshot = simulator.takeSnapshot()
+    snapshotTime = time() - started
+
+    return {
+        'scenario': scenario,
+        'machines': len(topology['machines']),
+        'vectorized': vectorized,
+        'eventsPerTick': eventsPerTick,
+        'ticks': ticks,
+        'setupSeconds': setupTime,
+        'phaseSeconds': timings,
+        'phaseMillisecondsPerTick': dict((phase, 1000 * timings[phase] / ticks) for phase in PHASES),
+        'ticksPerSecond': ticks / sum(timings.values()),
+        'bytesPerTick': encodedBytes / ticks,
+        'snapshotSeconds': snapshotTime,
+        'snapshotBytes': len(snapshot.state) + len(snapshot.topology),
+        'peakRssKilobytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    }
+
+def main():
+    parser = ArgumentParser(description='Measures how the simulation core scales with the size of the cluster')
+    parser.add_argument('--scenarios', default=','.join(sorted(clusterSimulators.keys())), help='comma separated scenarios to run')
+    parser.add_argument('--sizes', default='300,1000,10000,100000', help='comma separated numbers of machines')
+    parser.add_argument('--ticks', type=int, default=50, help='number of ticks to run each scenario for')
+    parser.add_argument('--vectorized', action='store_true', help='use the vectorized node state')
+    parser.add_argument('--events-per-tick', type=int, default=None, help='number of log events per tick (defaults to 1 to 4)')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    parser.add_argument('--output', default=None, help='file to write the results to (defaults to standard output)')
+    args = parser.parse_args()
+
+    output = open(args.output, 'w') if args.output else sys.stdout
+
+    # run each benchmark in a fresh process, so peak RSS is measured per benchmark
+    pool = Pool(processes=1, maxtasksperchild=1)
+    for size in [int(size) for size in args.sizes.split(',')]:
+        for scenario in args.scenarios.split(','):
+            result = pool.apply(runBenchmark, (scenario, size, args.ticks, args.vectorized, args.seed, args.events_per_tick))
+            output.write(dumps(result) + '\n')
+            output.flush()
+    pool.close()
+
+if __name__ == '__main__':
+    main()
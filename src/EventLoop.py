@@ -0,0 +1,116 @@
+import errno
+import heapq
+import itertools
+import select
+import traceback
+from time import time
+
+__author__ = 'Roman'
+
+# Events handlers are registered for (epoll uses the same values as poll)
+READ = select.POLLIN
+WRITE = select.POLLOUT
+ERROR = select.POLLERR | select.POLLHUP
+
+class EventLoop(object):
+    """
+        A single-threaded loop dispatching the readiness of sockets & pipes and timers to their handlers, using epoll
+        (or poll, where epoll is not available), so thousands of idle connections cost a file descriptor each instead
+        of a thread. Handlers have a handleEvent(events) method, called with the events the file descriptor is ready
+        for, and a close() method, called if handling an event fails.
+
+        Only the thread running the loop may use it: other threads hand work over to it through a pipe registered in
+        the loop (see EventServer.FrameBridge).
+    """
+
+    def __init__(self):
+        self.epoll = hasattr(select, 'epoll')
+        self.poller = select.epoll() if self.epoll else select.poll()
+
+        # map from file descriptor to its handler
+        self.handlers = {}
+
+        # heap of the pending timers, by deadline (then in the order they were added)
+        self.timers = []
+        self.timerOrder = itertools.count()
+
+        self.running = False
+
+    def register(self, fd, handler, events=READ):
+        self.handlers[fd] = handler
+        self.poller.register(fd, events)
+
+    def modify(self, fd, events):
+        self.poller.modify(fd, events)
+
+    def unregister(self, fd):
+        if self.handlers.pop(fd, None) is not None:
+            try:
+                self.poller.unregister(fd)
+            except (IOError, OSError, KeyError):
+                pass
+
+    def callLater(self, delay, callback):
+        """
+            Calls the given function (without arguments) after 'delay' seconds, returning the timer (see Timer.cancel)
+        """
+        timer = Timer(time() + delay, callback)
+        heapq.heappush(self.timers, (timer.deadline, next(self.timerOrder), timer))
+        return timer
+
+    def run(self):
+        """
+            Dispatches events until stop is called
+        """
+        self.running = True
+        while self.running:
+            timeout = self.timers[0][0] - time() if self.timers else None
+            if timeout is not None:
+                timeout = max(timeout, 0)
+
+            try:
+                if self.epoll:
+                    events = self.poller.poll(timeout if timeout is not None else -1)
+                else:
+                    events = self.poller.poll(timeout * 1000 if timeout is not None else None)
+            except (IOError, OSError, select.error), e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+
+            for fd, event in events:
+                handler = self.handlers.get(fd)
+                if handler is None:
+                    continue
+                try:
+                    handler.handleEvent(event)
+                except Exception:
+                    traceback.print_exc()
+                    handler.close()
+
+            now = time()
+            while self.timers and self.timers[0][0] <= now:
+                timer = heapq.heappop(self.timers)[2]
+                if timer.callback is not None:
+                    try:
+                        timer.callback()
+                    except Exception:
+                        traceback.print_exc()
+
+    def stop(self):
+        self.running = False
+
+
+class Timer(object):
+    """
+        A function to be called by the loop at a given time (see EventLoop.callLater)
+    """
+
+    __slots__ = ('deadline', 'callback')
+
+    def __init__(self, deadline, callback):
+        self.deadline = deadline
+        self.callback = callback
+
+    def cancel(self):
+        self.callback = None
@@ -0,0 +1,943 @@
+import os, sys
+
+
+path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if not path in sys.path:
+    sys.path.insert(1, path)
+del path
+
+from argparse import ArgumentParser
+from collections import deque
+import errno
+import fcntl
+import mimetypes
+import resource
+import socket
+import threading
+import traceback
+from json import dumps
+from urlparse import parse_qsl, urlsplit
+from src.EventLoop import ERROR, EventLoop, READ, WRITE
+from src.Scenarios import scenarios
+from src.SimulatorInterface import SIMULATOR_IDLE_TIMEOUT, applyReplayControl, framePiece, openReplay, parseSpeed, \
+    parseView, queryAtRisk, queryEvents, queryHistory, queryHistoryAt, queryRecordings, querySubtree, snapshotPieces, \
+    updateClientGauges
+from src.simulator.Compression import CompressedStream, compressPieces, joinPieces, negotiateEncoding
+from src.simulator.Instrumentation import instruments
+from src.simulator.SimulatorRegistry import SimulatorRegistry
+from src.simulator.TickFrame import TickFrame
+from src.simulator.TickRing import Resync
+
+__author__ = 'Roman'
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'static')
+
+# Bytes of events a streaming client may have waiting to be sent before it is not sent any more (it then falls behind,
+# and starts over from a snapshot once it catches up, see BaseSimulator.takeLogs)
+MAX_STREAM_BACKLOG = 4 * 1024 * 1024
+
+# Largest request (line & headers) accepted
+MAX_REQUEST_SIZE = 64 * 1024
+
+class EventServer(object):
+    """
+        A front end to the simulators serving the endpoints of SimulatorInterface used by the dashboard (index,
+        subscribe, changeSimulator, update & stream, the queries of the cluster's history, events & at risk nodes, and
+        replays) from a single thread, on an EventLoop: clients waiting for updates are held as Waiters instead of
+        blocking a thread each, so a single process holds thousands of dashboards. The little work that would block
+        the loop (opening & seeking replays) is done on threads of its own (see runInThread).
+
+        Simulator threads hand their frames over to the loop through a FrameBridge: whenever a simulator has new frames
+        (or adds or removes clients), the loop polls the clients waiting on it (see BaseSimulator.pollLogs), and answers
+        the ones with something to read. Encoded & compressed frames are shared with every client, as in
+        SimulatorInterface.
+    """
+
+    def __init__(self, loop, registry):
+        self.loop = loop
+        self.registry = registry
+        self.bridge = FrameBridge(loop, self.framesReady)
+
+        # map from clientId to the simulator it is using, and to the view of the cluster it subscribed with
+        self.clientSimulatorMap = {}
+        self.clientViewMap = {}
+        self.nextClientId = 1
+
+        # map from simulator to the clients waiting on it, and the simulators whose frames are handed to the loop
+        self.waiters = {}
+        self.watched = set()
+
+        # the simulators the registry lets go are forgotten on the loop's thread
+        registry.addRetireListener(lambda simulator: self.bridge.call(lambda: self.forgetSimulator(simulator)))
+
+        self.routes = {
+            '/': self.index,
+            '/index': self.index,
+            '/subscribe': self.subscribe,
+            '/changeSimulator': self.changeSimulator,
+            '/update': self.update,
+            '/stream': self.stream,
+            '/subtree': self.subtree,
+            '/atRisk': self.atRisk,
+            '/events': self.events,
+            '/history': self.history,
+            '/historyAt': self.historyAt,
+            '/recordings': self.recordings,
+            '/replay': self.replay,
+            '/seek': self.seek,
+            '/replaySpeed': self.replaySpeed,
+            '/metrics': self.metrics,
+            '/metricsJson': self.metricsJson
+        }
+        self.staticFiles = {}
+
+    def listen(self, host, port, backlog=4096):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((host, port))
+        self.socket.listen(backlog)
+        self.socket.setblocking(0)
+        self.loop.register(self.socket.fileno(), self, READ)
+
+    def handleEvent(self, events):
+        """
+            Accepts the pending connections
+        """
+        while True:
+            try:
+                connection, address = self.socket.accept()
+            except socket.error, e:
+                if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.ECONNABORTED, errno.EINTR):
+                    return
+                if e.args[0] in (errno.EMFILE, errno.ENFILE):
+                    print 'Out of file descriptors, not accepting connections'
+                    return
+                raise
+            HttpConnection(self, connection)
+
+    def close(self):
+        self.loop.unregister(self.socket.fileno())
+        self.socket.close()
+
+    def handle(self, request):
+        """
+            Answers a request (right away, or once its client has something to read)
+        """
+        route = self.routes.get(request.path)
+        if route is None:
+            if request.path.startswith('/static/'):
+                return self.static(request)
+            return request.respond('404 Not Found', 'text/plain', 'Not found')
+
+        try:
+            route(request)
+        except (KeyError, ValueError):
+            request.respond('400 Bad Request', 'text/plain', 'Bad request')
+
+    def index(self, request):
+        return self.static(request, 'index.html')
+
+    def static(self, request, name=None):
+        """
+            Serves a file of the static directory (kept in memory once read)
+        """
+        name = name or request.path[len('/static/'):]
+        path = os.path.abspath(os.path.join(STATIC_DIR, name))
+        if not path.startswith(os.path.abspath(STATIC_DIR) + os.sep) or not os.path.isfile(path):
+            return request.respond('404 Not Found', 'text/plain', 'Not found')
+
+        if path not in self.staticFiles:
+            self.staticFiles[path] = open(path, 'rb').read()
+        request.respond('200 OK', mimetypes.guess_type(path)[0] or 'application/octet-stream', self.staticFiles[path])
+
+    def subscribe(self, request):
+        """
+            Subscribes a client, see SimulatorInterface.subscribe
+        """
+        query = request.query
+        try:
+            view = parseView(query.get('depth'), query.get('roots'), query.get('nodes'), query.get('severities'),
+                             query.get('facilities'), query.get('format'))
+        except ValueError:
+            return request.respondJson({
+                'message': 'depth should be a non-negative integer, and cannot be combined with filters, '
+                           'and format should be json or columnar',
+                'successful': False
+            })
+
+        clientId = self.nextClientId
+        self.nextClientId += 1
+
+        # Assign this client the default simulator (built on the loop's thread if it is not running yet), and get the
+        # latest snapshot of the system state (the client gets every update after it)
+        simulator, snapshot = self.registry.addClient('random', clientId)
+        self.watch(simulator)
+        self.clientSimulatorMap[clientId] = simulator
+        self.clientViewMap[clientId] = view
+
+        request.respondPieces(snapshotPieces(snapshot, self.clientView(clientId, simulator), query.get('topologyTag'),
+                                             clientId=clientId))
+
+    def changeSimulator(self, request):
+        """
+            Changes the client to use a different simulator, see SimulatorInterface.changeSimulator
+        """
+        query = request.query
+        clientId = int(query['clientId'])
+        try:
+            view = parseView(query.get('depth'), query.get('roots'), query.get('nodes'), query.get('severities'),
+                             query.get('facilities'), query.get('format'))
+        except ValueError:
+            return request.respondJson({
+                'message': 'depth should be a non-negative integer, and cannot be combined with filters, '
+                           'and format should be json or columnar',
+                'successful': False
+            })
+
+        # client not subscribed, error
+        if clientId not in self.clientSimulatorMap:
+            return request.respondJson({
+                'message': 'clientId should be a valid integer client id',
+                'successful': False
+            })
+
+        # could not find name of simulator
+        if query['simulator'] not in scenarios:
+            return request.respondJson({
+                'message': 'unknown simulator',
+                'successful': False
+            })
+
+        # the requests still waiting on the previous simulator are told the client is no longer subscribed to it
+        self.clientSimulatorMap[clientId].removeClient(clientId)
+        simulator, snapshot = self.registry.addClient(query['simulator'], clientId)
+        self.watch(simulator)
+        self.clientSimulatorMap[clientId] = simulator
+        self.clientViewMap[clientId] = view
+
+        request.respondPieces(snapshotPieces(snapshot, self.clientView(clientId, simulator), query.get('topologyTag'),
+                                             successful=True))
+
+    def update(self, request):
+        """
+            Answers with the next updates of the client once there are some, see SimulatorInterface.update. Until then,
+            the request waits (without a thread) for its simulator to produce them.
+        """
+        query = request.query
+        clientId = int(query['clientId'])
+
+        # client not subscribed, error
+        simulator = self.clientSimulatorMap.get(clientId)
+        if simulator is None:
+            return request.respondJson({
+                'message': 'Not subscribed',
+                'successful': False
+            })
+
+        maxEvents = query.get('maxEvents')
+        coalesce = query.get('coalesce')
+        waiter = Waiter(request, simulator, clientId, self.clientView(clientId, simulator),
+                        max(int(maxEvents), 1) if maxEvents is not None else None,
+                        bool(coalesce and coalesce != 'false'))
+        waiter.topologyTag = query.get('topologyTag')
+        self.wait(waiter)
+
+        # with a batch, answer with the logs available once maxWaitMs passed, if any
+        if maxEvents is not None and not waiter.done:
+            maxWait = max(float(query.get('maxWaitMs', 0)), 0) / 1000.0
+            waiter.timer = self.loop.callLater(maxWait, lambda: self.expire(waiter))
+
+    def stream(self, request):
+        """
+            Streams the updates of the client as server-sent events, see SimulatorInterface.stream
+        """
+        query = request.query
+        clientId = int(query['clientId'])
+        lastSequence = request.headers.get('last-event-id', query.get('lastSequence'))
+
+        # client not subscribed, error
+        simulator = self.clientSimulatorMap.get(clientId)
+        if simulator is None:
+            return request.respondJson({
+                'message': 'Not subscribed',
+                'successful': False
+            })
+
+        snapshot = None
+        if lastSequence:
+            snapshot = simulator.resumeClient(clientId, int(lastSequence))
+
+        encoding = negotiateEncoding(request.headers.get('accept-encoding'))
+        headers = [('Content-Type', 'text/event-stream'), ('Cache-Control', 'no-cache'), ('Vary', 'Accept-Encoding')]
+        if encoding is not None:
+            headers.append(('Content-Encoding', encoding))
+        request.connection.startStream('200 OK', headers)
+
+        waiter = Waiter(request, simulator, clientId, self.clientView(clientId, simulator), None, False)
+        waiter.streaming = True
+        waiter.stream = CompressedStream(encoding) if encoding is not None else None
+        if waiter.stream is not None:
+            request.connection.write(waiter.stream.header())
+        if snapshot is not None:
+            self.sendSnapshot(waiter, snapshot, successful=True)
+        self.wait(waiter)
+
+    def subtree(self, request):
+        """
+            Returns the structure of a node of the client's cluster, see SimulatorInterface.subtree
+        """
+        simulator = self.clientSimulator(request)
+        if simulator is not None:
+            request.respondJson(querySubtree(simulator, request.query['node'], request.query.get('depth', 1)))
+
+    def atRisk(self, request):
+        """
+            Returns the most at risk nodes of the client's simulator, see SimulatorInterface.atRisk
+        """
+        simulator = self.clientSimulator(request)
+        if simulator is not None:
+            query = request.query
+            request.respondJson(queryAtRisk(simulator, query.get('ranking', 'predictedFailureTime'), query.get('k', 20)))
+
+    def events(self, request):
+        """
+            Pages through the log events of the client's simulator, see SimulatorInterface.events
+        """
+        simulator = self.clientSimulator(request)
+        if simulator is not None:
+            query = request.query
+            request.respondJson(queryEvents(simulator, query.get('node'), query.get('severity'), query.get('start'),
+                                            query.get('end'), query.get('before'), query.get('limit', 100)))
+
+    def history(self, request):
+        """
+            Returns the history of the metrics of the client's cluster, see SimulatorInterface.history
+        """
+        simulator = self.clientSimulator(request)
+        if simulator is not None:
+            query = request.query
+            request.respondJson(queryHistory(simulator, query.get('node'), query.get('metrics'), query.get('start'),
+                                             query.get('end'), query.get('resolution')))
+
+    def historyAt(self, request):
+        """
+            Returns the metrics of the client's cluster at a clock time, see SimulatorInterface.historyAt
+        """
+        simulator = self.clientSimulator(request)
+        if simulator is not None:
+            request.respondJson(queryHistoryAt(simulator, request.query['time'], request.query.get('node')))
+
+    def recordings(self, request):
+        request.respondJson(queryRecordings())
+
+    def replay(self, request):
+        """
+            Changes the client to replay a recording, see SimulatorInterface.replay. The recording is opened on a
+            thread of its own, as it is mapped and decoded up to the start time.
+        """
+        query = request.query
+        clientId = int(query['clientId'])
+
+        # client not subscribed, error
+        if clientId not in self.clientSimulatorMap:
+            return request.respondJson({
+                'message': 'clientId should be a valid integer client id',
+                'successful': False
+            })
+
+        recording, speed, time = query['recording'], query.get('speed', 1), query.get('time')
+
+        def openRecording():
+            try:
+                simulator = openReplay(recording, speed, time)
+            except ValueError, error:
+                message = str(error)
+                return lambda: request.respondJson({
+                    'message': message,
+                    'successful': False
+                })
+            return lambda: self.startReplay(request, clientId, simulator)
+        self.runInThread(request, openRecording)
+
+    def startReplay(self, request, clientId, simulator):
+        """
+            Moves the client over to its replay, once it is open
+        """
+        self.clientSimulatorMap[clientId].removeClient(clientId)
+        snapshot = simulator.addClient(clientId)
+        simulator.onIdle = self.replayIdle
+        self.watch(simulator)
+        self.clientSimulatorMap[clientId] = simulator
+        simulator.start()
+
+        # Respond with the snapshot the replay starts from (the client gets every update after it)
+        request.respondPieces(snapshotPieces(snapshot, successful=True, timestamp=simulator.getTimestamp()))
+
+    def replayIdle(self, replay):
+        """
+            Called by a replay whose client left (on the replay's thread): stops it, and has the loop forget it
+        """
+        self.bridge.call(lambda: self.forgetSimulator(replay))
+        return True
+
+    def seek(self, request):
+        """
+            Jumps the client's replay to a clock time, see SimulatorInterface.seek. Waits for the replay to jump on a
+            thread of its own.
+        """
+        simulator = self.clientSimulator(request)
+        if simulator is not None:
+            time = request.query.get('time')
+
+            def seekReplay():
+                response = applyReplayControl(simulator,
+                                              lambda replay: replay.seek(float(time) if time else replay.getTimestamp()))
+                return lambda: request.respondJson(response)
+            self.runInThread(request, seekReplay)
+
+    def replaySpeed(self, request):
+        """
+            Changes the speed of the client's replay, see SimulatorInterface.replaySpeed
+        """
+        simulator = self.clientSimulator(request)
+        if simulator is not None:
+            speed = request.query['speed']
+            request.respondJson(applyReplayControl(simulator, lambda replay: replay.setSpeed(parseSpeed(speed))))
+
+    def metrics(self, request):
+        """
+            Returns the operational metrics of the server, see SimulatorInterface.metrics
+        """
+        updateClientGauges(self.registry)
+        request.respond('200 OK', 'text/plain; version=0.0.4', instruments.text())
+
+    def metricsJson(self, request):
+        updateClientGauges(self.registry)
+        request.respondJson(instruments.json())
+
+    def clientSimulator(self, request):
+        """
+            Returns the simulator of the client of the request, answering that it is not subscribed if it is not (None)
+        """
+        simulator = self.clientSimulatorMap.get(int(request.query['clientId']))
+        if simulator is None:
+            request.respondJson({
+                'message': 'Not subscribed',
+                'successful': False
+            })
+        return simulator
+
+    def runInThread(self, request, work):
+        """
+            Runs work that would block the loop on a thread of its own, then has the loop call the function it returns
+            (to answer the request). The request is answered with an error if the work fails.
+        """
+        def run():
+            try:
+                done = work()
+            except Exception:
+                traceback.print_exc()
+                done = lambda: request.respond('500 Internal Server Error', 'text/plain', 'Internal error')
+            self.bridge.call(done)
+
+        thread = threading.Thread(target=run)
+        thread.setDaemon(True)
+        thread.start()
+
+    def clientView(self, clientId, simulator):
+        """
+            Returns the view of the cluster of the client, if its simulator supports it (see SimulatorInterface)
+        """
+        view = self.clientViewMap.get(clientId)
+        if view is not None and view.supports(simulator):
+            return view
+        return None
+
+    def watch(self, simulator):
+        """
+            Has the simulator hand its frames over to the loop
+        """
+        if simulator not in self.watched:
+            self.watched.add(simulator)
+            simulator.addListener(self.bridge.notify)
+
+    def unwatch(self, simulator):
+        if simulator in self.watched:
+            self.watched.discard(simulator)
+            simulator.removeListener(self.bridge.notify)
+
+    def forgetClient(self, clientId, simulator):
+        """
+            Drops a client its simulator no longer knows (it was pruned for being idle) from the maps, unless it moved
+            to another simulator or reconnected since. Returns whether the client is still subscribed.
+        """
+        if self.clientSimulatorMap.get(clientId) is simulator and not simulator.hasClient(clientId):
+            del self.clientSimulatorMap[clientId]
+            self.clientViewMap.pop(clientId, None)
+        return clientId in self.clientSimulatorMap
+
+    def forgetSimulator(self, simulator):
+        """
+            Stops watching a simulator that stopped, and drops the clients still mapped to it from the maps
+        """
+        self.unwatch(simulator)
+        for clientId, clientSimulator in self.clientSimulatorMap.items():
+            if clientSimulator is simulator:
+                del self.clientSimulatorMap[clientId]
+                self.clientViewMap.pop(clientId, None)
+
+    def wait(self, waiter):
+        """
+            Answers the request of the waiter if its client has something to read, and holds it until it does otherwise
+        """
+        self.check(waiter)
+        if not waiter.done:
+            self.waiters.setdefault(waiter.simulator, set()).add(waiter)
+            waiter.request.connection.waiter = waiter
+
+    def expire(self, waiter):
+        waiter.timer = None
+        waiter.expired = True
+        self.check(waiter)
+
+    def check(self, waiter):
+        """
+            Polls the waiter's client, answering its request (or streaming the updates) if it has something to read
+        """
+        if waiter.done:
+            return
+
+        connection = waiter.request.connection
+        if waiter.streaming:
+            if connection.outputSize > MAX_STREAM_BACKLOG:
+                return
+            self.streamLogs(waiter)
+            return
+
+        maxLogs = waiter.maxEvents or 1
+        minLogs = 1 if waiter.maxEvents is None or waiter.expired else maxLogs
+        logs = waiter.simulator.pollLogs(waiter.clientId, maxLogs, minLogs)
+        if logs == []:
+            return
+
+        self.release(waiter)
+        request, view = waiter.request, waiter.view
+        # client moved to another simulator, reconnected, or was pruned for being idle
+        if logs is None:
+            subscribed = self.forgetClient(waiter.clientId, waiter.simulator)
+            request.respondJson({
+                'message': 'Moved to another simulator' if subscribed else 'Not subscribed',
+                'successful': False
+            })
+
+        # the client fell too far behind, it has to start over from the latest snapshot
+        elif isinstance(logs, Resync):
+            request.respondPieces(snapshotPieces(logs.snapshot, view, waiter.topologyTag, successful=True, resync=True,
+                                                 skipped=logs.skipped))
+
+        # the frames were already encoded (and compressed) by the simulator thread, or for the client's view
+        elif waiter.maxEvents is None:
+            request.respondPieces([framePiece(logs[0], view)])
+        elif waiter.coalesce:
+            request.respondPieces([framePiece(TickFrame.coalesce(logs), view)])
+        else:
+            pieces = ['{"successful": true, "batch": true, "frames": [']
+            for frame in logs:
+                if len(pieces) > 1:
+                    pieces.append(', ')
+                pieces.append(framePiece(frame, view))
+            pieces.append(']}')
+            request.respondPieces(pieces)
+
+    def streamLogs(self, waiter):
+        logs = waiter.simulator.pollLogs(waiter.clientId, waiter.simulator.ring.capacity)
+
+        # client moved to another simulator, reconnected, or was pruned for being idle
+        if logs is None:
+            self.release(waiter)
+            subscribed = self.forgetClient(waiter.clientId, waiter.simulator)
+            waiter.send(['event: unsubscribed\ndata: %s\n\n' % dumps({'subscribed': subscribed})])
+            waiter.request.connection.endStream(waiter.stream.end() if waiter.stream is not None else '')
+
+        # client fell too far behind, it has to start over from the latest snapshot
+        elif isinstance(logs, Resync):
+            self.sendSnapshot(waiter, logs.snapshot, successful=True, resync=True, skipped=logs.skipped)
+
+        else:
+            for frame in logs:
+                waiter.send(['id: %d\ndata: ' % frame.sequence, framePiece(frame, waiter.view), '\n\n'])
+
+    def sendSnapshot(self, waiter, snapshot, **fields):
+        """
+            Sends a snapshot event to a stream, with the structure only if it changed since the last one sent
+        """
+        waiter.send(['event: snapshot\nid: %d\ndata: ' % snapshot.version] +
+                    snapshotPieces(snapshot, waiter.view, waiter.topologyTag, **fields) + ['\n\n'])
+        waiter.topologyTag = snapshot.encodedTopology.tag(waiter.view.key if waiter.view is not None else None)
+
+    def release(self, waiter):
+        """
+            Stops holding a waiter, once its request is answered (or its connection closed)
+        """
+        waiter.done = True
+        if waiter.timer is not None:
+            waiter.timer.cancel()
+            waiter.timer = None
+
+        waiting = self.waiters.get(waiter.simulator)
+        if waiting is not None:
+            waiting.discard(waiter)
+            if not waiting:
+                del self.waiters[waiter.simulator]
+        if waiter.request.connection.waiter is waiter:
+            waiter.request.connection.waiter = None
+
+    def framesReady(self, simulator):
+        """
+            Called on the loop's thread (see FrameBridge) once the simulator has new frames, or added or removed
+            clients: checks all the clients waiting on it
+        """
+        for waiter in list(self.waiters.get(simulator, ())):
+            self.check(waiter)
+
+    def connectionClosed(self, connection):
+        if connection.waiter is not None:
+            self.release(connection.waiter)
+
+
+class FrameBridge(object):
+    """
+        Hands the simulators over to the thread running the loop: simulator threads (and threads adding or removing
+        clients) call notify, as a listener of the simulator (see BaseSimulator.addListener), which wakes the loop up
+        through a pipe. The loop then calls onFrames with each simulator notified since it last woke up. Other threads
+        hand their results over the same way, with call.
+    """
+
+    def __init__(self, loop, onFrames):
+        self.loop = loop
+        self.onFrames = onFrames
+
+        self.readFd, self.writeFd = os.pipe()
+        for fd in (self.readFd, self.writeFd):
+            fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+        loop.register(self.readFd, self, READ)
+
+        # the simulators notified & the functions to call since the loop last woke up, and whether it was woken up since
+        self.pending = set()
+        self.calls = []
+        self.signaled = False
+        self.bridgeLock = threading.Lock()
+
+    def notify(self, simulator):
+        """
+            Tells the loop the simulator has something new for its clients (called from any thread)
+        """
+        self.bridgeLock.acquire()
+        self.pending.add(simulator)
+        signal = not self.signaled
+        self.signaled = True
+        self.bridgeLock.release()
+        if signal:
+            self.wake()
+
+    def call(self, callback):
+        """
+            Has the loop call the given function (without arguments) once it wakes up (called from any thread)
+        """
+        self.bridgeLock.acquire()
+        self.calls.append(callback)
+        signal = not self.signaled
+        self.signaled = True
+        self.bridgeLock.release()
+        if signal:
+            self.wake()
+
+    def wake(self):
+        try:
+            os.write(self.writeFd, 'x')
+        except OSError:
+            # the pipe is full, the loop is waking up anyway
+            pass
+
+    def handleEvent(self, events):
+        try:
+            os.read(self.readFd, 4096)
+        except OSError:
+            pass
+
+        self.bridgeLock.acquire()
+        pending, self.pending = self.pending, set()
+        calls, self.calls = self.calls, []
+        self.signaled = False
+        self.bridgeLock.release()
+
+        for simulator in pending:
+            self.onFrames(simulator)
+        for callback in calls:
+            try:
+                callback()
+            except Exception:
+                traceback.print_exc()
+
+    def close(self):
+        self.loop.unregister(self.readFd)
+        os.close(self.readFd)
+        os.close(self.writeFd)
+
+
+class Waiter(object):
+    """
+        A request waiting for the updates of its client: a long-poll for the next update (or batch of updates, once
+        maxEvents are available or the request expired), or a stream of server-sent events (whose 'stream' is the
+        CompressedStream of the response, or None if it is not compressed). The topologyTag is the one of the structure
+        the client has (see snapshotPieces).
+    """
+
+    __slots__ = ('request', 'simulator', 'clientId', 'view', 'maxEvents', 'coalesce', 'expired', 'timer', 'streaming',
+                 'stream', 'topologyTag', 'done')
+
+    def __init__(self, request, simulator, clientId, view, maxEvents, coalesce):
+        self.request = request
+        self.simulator = simulator
+        self.clientId = clientId
+        self.view = view
+        self.maxEvents = maxEvents
+        self.coalesce = coalesce
+        self.expired = False
+        self.timer = None
+        self.streaming = False
+        self.stream = None
+        self.topologyTag = None
+        self.done = False
+
+    def send(self, pieces):
+        """
+            Sends an event of the stream
+        """
+        if self.stream is None:
+            self.request.connection.write(joinPieces(pieces))
+        else:
+            self.request.connection.write(''.join(self.stream.write(piece) for piece in pieces))
+
+
+class Request(object):
+    """
+        A parsed HTTP request, answered with respond (see HttpConnection)
+    """
+
+    def __init__(self, connection, method, target, headers, body):
+        self.connection = connection
+        self.method = method
+        self.headers = headers
+
+        url = urlsplit(target)
+        self.path = url.path
+        self.query = dict(parse_qsl(url.query, True))
+        if body and 'application/x-www-form-urlencoded' in headers.get('content-type', ''):
+            self.query.update(parse_qsl(body, True))
+
+    def respond(self, status, contentType, body, headers=()):
+        self.connection.respond(status, [('Content-Type', contentType)] + list(headers), body)
+
+    def respondJson(self, response):
+        self.respond('200 OK', 'application/json', dumps(response))
+
+    def respondPieces(self, pieces):
+        """
+            Answers with the JSON response made of the given pieces, compressed if the client accepts it (see
+            SimulatorInterface.respond)
+        """
+        encoding = negotiateEncoding(self.headers.get('accept-encoding'))
+        if encoding is None:
+            self.respond('200 OK', 'application/json', joinPieces(pieces), [('Vary', 'Accept-Encoding')])
+        else:
+            self.respond('200 OK', 'application/json', compressPieces(pieces, encoding),
+                         [('Vary', 'Accept-Encoding'), ('Content-Encoding', encoding)])
+
+
+class HttpConnection(object):
+    """
+        A (keep-alive) HTTP/1.1 connection of a client, reading its requests one at a time, and writing the responses
+        without blocking
+    """
+
+    def __init__(self, server, connection):
+        self.server = server
+        self.loop = server.loop
+        self.socket = connection
+        self.socket.setblocking(0)
+        self.fd = connection.fileno()
+
+        self.input = ''
+        self.output = deque()
+        self.outputSize = 0
+        self.events = READ
+
+        # whether a request is being answered (the next one is only read once it is), whether to keep the connection
+        # open after it, the request waiting for updates, if any, and whether the connection was closed
+        self.busy = False
+        self.keepAlive = False
+        self.waiter = None
+        self.closed = False
+
+        self.loop.register(self.fd, self, READ)
+
+    def handleEvent(self, events):
+        if events & (READ | ERROR):
+            self.read()
+        if events & WRITE and not self.closed:
+            self.flush()
+
+    def read(self):
+        try:
+            data = self.socket.recv(65536)
+        except socket.error, e:
+            if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return
+            return self.close()
+
+        if not data:
+            return self.close()
+
+        self.input += data
+        self.parse()
+
+    def parse(self):
+        """
+            Handles the next request read, if it is complete and the previous one was answered
+        """
+        while not self.busy and not self.closed:
+            end = self.input.find('\r\n\r\n')
+            if end < 0:
+                if len(self.input) > MAX_REQUEST_SIZE:
+                    self.close()
+                return
+
+            lines = self.input[:end].split('\r\n')
+            try:
+                method, target, version = lines[0].split(' ', 2)
+            except ValueError:
+                return self.close()
+            headers = {}
+            for line in lines[1:]:
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+
+            length = int(headers.get('content-length') or 0)
+            if len(self.input) < end + 4 + length:
+                return
+            body = self.input[end + 4:end + 4 + length]
+            self.input = self.input[end + 4 + length:]
+
+            connection = headers.get('connection', '').lower()
+            self.keepAlive = connection == 'keep-alive' if version == 'HTTP/1.0' else connection != 'close'
+            self.busy = True
+            self.server.handle(Request(self, method, target, headers, body))
+
+    def respond(self, status, headers, body):
+        """
+            Writes the response to the current request, then handles the next one
+        """
+        lines = ['HTTP/1.1 %s' % status]
+        lines.extend('%s: %s' % header for header in headers)
+        lines.append('Content-Length: %d' % len(body))
+        lines.append('Connection: %s' % ('keep-alive' if self.keepAlive else 'close'))
+        self.write('\r\n'.join(lines) + '\r\n\r\n' + body)
+
+        self.busy = False
+        if not self.keepAlive:
+            self.flush()
+        else:
+            self.parse()
+
+    def startStream(self, status, headers):
+        """
+            Starts a response written as it goes, until endStream (the connection is then closed)
+        """
+        self.keepAlive = False
+        lines = ['HTTP/1.1 %s' % status]
+        lines.extend('%s: %s' % header for header in headers)
+        lines.append('Connection: close')
+        self.write('\r\n'.join(lines) + '\r\n\r\n')
+
+    def endStream(self, data=''):
+        self.busy = False
+        self.write(data)
+
+    def write(self, data):
+        if self.closed:
+            return
+        if data:
+            self.output.append(data)
+            self.outputSize += len(data)
+        self.flush()
+
+    def flush(self):
+        """
+            Writes as much of the output as the socket takes, waiting for it to be writable again if it does not take
+            everything
+        """
+        while self.output:
+            data = self.output[0]
+            try:
+                sent = self.socket.send(data)
+            except socket.error, e:
+                if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                    break
+                return self.close()
+
+            self.outputSize -= sent
+            if sent < len(data):
+                self.output[0] = data[sent:]
+                break
+            self.output.popleft()
+
+        if not self.output and not self.busy and not self.keepAlive:
+            return self.close()
+
+        events = READ | WRITE if self.output else READ
+        if events != self.events:
+            self.events = events
+            self.loop.modify(self.fd, events)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.loop.unregister(self.fd)
+        self.socket.close()
+        self.server.connectionClosed(self)
+
+
+def raiseFileLimit():
+    """
+        Raises the limit of open file descriptors as far as allowed (each connection takes one)
+    """
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or hard > soft:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        except (ValueError, resource.error):
+            pass
+    return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+
+
+def main():
+    parser = ArgumentParser(description='Serves the simulators to thousands of clients from a single thread')
+    parser.add_argument('--host', default='0.0.0.0', help='address to listen on')
+    parser.add_argument('--port', type=int, default=8080, help='port to listen on')
+    args = parser.parse_args()
+
+    print 'Up to %d open connections' % raiseFileLimit()
+
+    loop = EventLoop()
+    server = EventServer(loop, SimulatorRegistry(scenarios, SIMULATOR_IDLE_TIMEOUT))
+    server.listen(args.host, args.port)
+    print 'Serving on %s:%d' % (args.host, args.port)
+    try:
+        loop.run()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+import os, sys
+
+
+path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if not path in sys.path:
+    sys.path.insert(1, path)
+del path
+
+from argparse import ArgumentParser
+import gzip
+from time import time
+from src.Scenarios import scenarios
+from src.simulator.Clock import VirtualClock
+
+__author__ = 'Roman'
+
+def runHeadless(simulator, ticks, output):
+    """
+        Steps the simulator (which should follow a virtual clock) for the given number of ticks, as fast as possible,
+        writing its initial snapshot and then every tick to the output file (one JSON object per line).
+
+        Returns the number of ticks per second achieved.
+    """
+
+    snapshot = simulator.snapshot
+    output.write('{"sequence": %d, "time": %d, "currentState": %s, "structure": %s}\n' % (snapshot.version, snapshot.time, snapshot.state, snapshot.topology))
+
+    started = time()
+    for i in xrange(0, ticks):
+
+        # advances the virtual clock instead of waiting
+        simulator.tick()
+
+        frame = simulator.step()
+        output.write(frame.encoded)
+        output.write('\n')
+
+    elapsed = time() - started
+    return ticks / elapsed if elapsed > 0 else float('inf')
+
+def main():
+    parser = ArgumentParser(description='Runs a simulation faster than real time, writing its ticks to disk')
+    parser.add_argument('--scenario', default='random', choices=sorted(scenarios.keys()), help='simulator to run')
+    parser.add_argument('--ticks', type=int, default=1000, help='number of ticks to simulate')
+    parser.add_argument('--seed', type=int, default=None, help='random seed, for reproducible runs')
+    parser.add_argument('--start', type=float, default=None, help='simulated start time, in seconds since the epoch (defaults to now)')
+    parser.add_argument('--time-format', default='legacy', choices=['legacy', 'iso', 'epoch'], help='how times are written')
+    parser.add_argument('--events-per-tick', type=int, default=None, help='number of log events per tick (defaults to 1 to 4)')
+    parser.add_argument('--record', default=None, help='directory to record the ticks to, for replays (see Recorder)')
+    parser.add_argument('--output', default='ticks.json', help='file to write the ticks to (gzipped if it ends with .gz)')
+    args = parser.parse_args()
+
+    clock = VirtualClock(args.start, args.seed)
+    simulator = scenarios[args.scenario](clock, timeFormat=args.time_format, eventsPerTick=args.events_per_tick,
+                                         recordTo=args.record)
+
+    output = gzip.open(args.output, 'wb') if args.output.endswith('.gz') else open(args.output, 'w')
+    ticksPerSecond = runHeadless(simulator, args.ticks, output)
+    output.close()
+    simulator.stopRecording()
+
+    print "%d ticks of the '%s' scenario written to %s (%.1f ticks per second)" % (args.ticks, args.scenario, args.output, ticksPerSecond)
+
+if __name__ == '__main__':
+    main()
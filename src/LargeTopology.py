@@ -1,52 +1,261 @@
-from copy import deepcopy
-
-__author__ = 'Roman'
-
-id = 0
-
-def makeLargeTopology():
-    root = depth([10,10,10,5])
-    machines = traverse(root, [])
-
-    return {
-        'machines': machines,
-        'structure': root
-    }
-
-def traverse(node, array):
-    array.append(node['name'])
-
-    if '_children' in node:
-        for child in node['_children']:
-            traverse(child, array)
-
-    return array
-
-def depth(depths):
-    if len(depths) == 0:
-        return {'name': uniqueName()}
-
-    node = {
-        'name': uniqueName(),
-        'children': None, # hide all children at start
-        '_children': []
-    }
-
-    branch = depths.pop()
-    for i in xrange(0, branch):
-        node['_children'].append(depth(deepcopy(depths)))
-
-    return node
-
-def uniqueName():
-    global id
-    name = "%s%d" % ("machine", id)
-    id += 1
-    return name
-
-
-def main():
-    print makeLargeTopology()
-
-if __name__ == '__main__':
-    main()
\ No newline at end of file
+from collections import deque
+import os
+import numpy
+
+__author__ = 'Roman'
+
+# Number of children at each level of the default large topology, starting from the leaves
+DEFAULT_DEPTHS = [10, 10, 10, 5]
+
+class CompactTopology(object):
+    """
+        A tree topology stored as flat arrays, with the nodes numbered in breadth-first order: the children of node i
+        are the nodes firstChildren[i] .. firstChildren[i] + childCounts[i] - 1, and its parent is parents[i] (-1 for
+        the root). Node i is named prefix + str(i), so names never have to be stored (except for topologies built from
+        a nested structure, see fromStructure).
+
+        The nested structure clients display is only built for the parts of the tree they expand (see subtree).
+    """
+
+    def __init__(self, parents, childCounts, prefix='machine', names=None):
+        """
+            Wraps the parent & child count arrays of a tree numbered in breadth-first order, and the names of its nodes
+            (if they are not named after their index)
+        """
+
+        self.parents = parents
+        self.childCounts = childCounts
+        self.prefix = prefix
+
+        self.names = names
+        self.nameIndex = dict((name, index) for index, name in enumerate(names)) if names is not None else None
+
+        # children are stored contiguously, right after the children of the previous node
+        self.firstChildren = numpy.cumsum(childCounts) - childCounts + 1
+
+    @staticmethod
+    def generate(depths=None, prefix='machine'):
+        """
+            Builds a tree where every node is a machine. depths holds the number of children at each level of the tree,
+            starting from the leaves (the root has depths[-1] children)
+        """
+
+        # number of children of the nodes at each level, from the root down
+        branches = list(reversed(depths or DEFAULT_DEPTHS))
+
+        levelSizes = [1]
+        for branch in branches:
+            levelSizes.append(levelSizes[-1] * branch)
+        size = sum(levelSizes)
+
+        parents = numpy.empty(size, dtype=numpy.int32)
+        childCounts = numpy.zeros(size, dtype=numpy.int32)
+        parents[0] = -1
+
+        levelStart = 0
+        for level, branch in enumerate(branches):
+            levelEnd = levelStart + levelSizes[level]
+            childCounts[levelStart:levelEnd] = branch
+            parents[levelEnd:levelEnd + levelSizes[level + 1]] = numpy.repeat(numpy.arange(levelStart, levelEnd, dtype=numpy.int32), branch)
+            levelStart = levelEnd
+
+        return CompactTopology(parents, childCounts, prefix)
+
+    @staticmethod
+    def fromStructure(structure):
+        """
+            Numbers the nodes of a nested structure (like the ones in the topology files) in breadth-first order
+        """
+        names, parents, childCounts = [], [], []
+
+        nodes = deque([(structure, -1)])
+        while nodes:
+            node, parent = nodes.popleft()
+            index = len(names)
+            children = node.get('children') or node.get('_children') or []
+
+            names.append(node['name'])
+            parents.append(parent)
+            childCounts.append(len(children))
+            nodes.extend((child, index) for child in children)
+
+        return CompactTopology(numpy.array(parents, dtype=numpy.int32), numpy.array(childCounts, dtype=numpy.int32),
+                               names=names)
+
+    @staticmethod
+    def cached(depths=None, directory=None, prefix='machine'):
+        """
+            Loads the topology for these depths from the cache directory, generating (and caching) it if it is not there
+        """
+        depths = list(depths or DEFAULT_DEPTHS)
+        if directory is None:
+            return CompactTopology.generate(depths, prefix)
+
+        path = os.path.join(directory, 'topology-%s-%s.npz' % (prefix, '-'.join(str(branch) for branch in depths)))
+        if os.path.exists(path):
+            return CompactTopology.load(path)
+
+        topology = CompactTopology.generate(depths, prefix)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        topology.save(path)
+        return topology
+
+    def save(self, path):
+        """
+            Writes the topology to the given (.npz) file
+        """
+        numpy.savez(path, parents=self.parents, childCounts=self.childCounts, prefix=numpy.array(self.prefix))
+
+    @staticmethod
+    def load(path):
+        """
+            Reads a topology written by save
+        """
+        arrays = numpy.load(path)
+        return CompactTopology(arrays['parents'], arrays['childCounts'], str(arrays['prefix']))
+
+    def __len__(self):
+        return len(self.parents)
+
+    def name(self, index):
+        if self.names is not None:
+            return self.names[index]
+        return '%s%d' % (self.prefix, index)
+
+    def index(self, name):
+        """
+            Returns the index of the node with the given name, or None if there is no such node
+        """
+        if self.nameIndex is not None:
+            return self.nameIndex.get(name)
+        if not name.startswith(self.prefix) or not name[len(self.prefix):].isdigit():
+            return None
+        index = int(name[len(self.prefix):])
+        return index if index < len(self.parents) else None
+
+    def machines(self):
+        """
+            Returns the names of all the nodes, in breadth-first order
+        """
+        if self.names is not None:
+            return list(self.names)
+        prefix = self.prefix
+        return [prefix + str(index) for index in xrange(len(self.parents))]
+
+    def children(self, index):
+        """
+            Returns the indices of the children of the given node
+        """
+        first = int(self.firstChildren[index])
+        return xrange(first, first + int(self.childCounts[index]))
+
+    def descendants(self, index):
+        """
+            Returns the indices of the given node and of all its descendants. In breadth-first order, the descendants of
+            a node at each level of the tree are contiguous, so this takes one range per level.
+        """
+        ranges = []
+        first, last = index, index + 1
+        while first < last:
+            ranges.append(numpy.arange(first, last))
+            first, last = int(self.firstChildren[first]), int(self.firstChildren[last - 1] + self.childCounts[last - 1])
+        return numpy.concatenate(ranges)
+
+    def levelEnds(self):
+        """
+            Returns the index right after the last node of each level of the tree, from the root down (in breadth-first
+            order, the nodes up to any depth are the nodes before the end of that level)
+        """
+        ends = []
+        first, last = 0, 1
+        while first < last:
+            ends.append(last)
+            first, last = int(self.firstChildren[first]), int(self.firstChildren[last - 1] + self.childCounts[last - 1])
+        return numpy.array(ends, dtype=numpy.int64)
+
+    def preorder(self):
+        """
+            Returns the position of each node in depth-first (pre)order, and the size of its subtree: the subtree of node
+            i is the nodes at positions positions[i] .. positions[i] + sizes[i] - 1
+        """
+        ends = self.levelEnds()
+        size = len(self.parents)
+
+        # subtree sizes, from the leaves up
+        sizes = numpy.ones(size, dtype=numpy.int64)
+        for level in xrange(len(ends) - 1, 0, -1):
+            start, end = ends[level - 1], ends[level]
+            sizes += numpy.bincount(self.parents[start:end], weights=sizes[start:end], minlength=size).astype(numpy.int64)
+
+        # a node comes right after its parent and the subtrees of its previous siblings, from the root down
+        positions = numpy.zeros(size, dtype=numpy.int64)
+        for level in xrange(1, len(ends)):
+            start, end = ends[level - 1], ends[level]
+            parents = self.parents[start:end]
+            before = numpy.cumsum(sizes[start:end]) - sizes[start:end]
+            siblingsBefore = before - before[self.firstChildren[parents] - start]
+            positions[start:end] = positions[parents] + 1 + siblingsBefore
+
+        return positions, sizes
+
+    def subtree(self, index=0, depth=1, expanded=False):
+        """
+            Builds the nested structure of the given node, including its descendants up to 'depth' levels below it.
+            Like the rest of the large topology, internal nodes start collapsed ('children' is None, and '_children'
+            holds the children), unless the structure is built expanded. The children of the deepest nodes are not
+            included: their '_children' is None, and 'childCount' tells how many there are, to be fetched when the
+            client expands them.
+        """
+        childrenKey = 'children' if expanded else '_children'
+
+        root = self.node(index)
+        stack = [(root, index, depth)]
+        while stack:
+            node, index, depth = stack.pop()
+            if 'childCount' not in node:
+                continue
+
+            if depth > 0:
+                node[childrenKey] = []
+                for child in self.children(index):
+                    childNode = self.node(child)
+                    node[childrenKey].append(childNode)
+                    stack.append((childNode, child, depth - 1))
+
+        return root
+
+    def node(self, index):
+        """
+            Builds the (childless) structure of a single node
+        """
+        childCount = int(self.childCounts[index])
+        if childCount == 0:
+            return {'name': self.name(index)}
+
+        return {
+            'name': self.name(index),
+            'children': None, # hide all children at start
+            '_children': None,
+            'childCount': childCount
+        }
+
+
+def makeLargeTopology(depths=None):
+    """
+        Builds a tree topology, where every node is a machine. depths holds the number of children at each level of
+        the tree, starting from the leaves (the root has depths[-1] children)
+    """
+    topology = CompactTopology.generate(depths)
+
+    return {
+        'machines': topology.machines(),
+        'structure': topology.subtree(0, len(depths or DEFAULT_DEPTHS))
+    }
+
+
+def main():
+    print makeLargeTopology()
+
+if __name__ == '__main__':
+    main()
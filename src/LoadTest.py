@@ -0,0 +1,283 @@
+import os, sys
+
+
+path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if not path in sys.path:
+    sys.path.insert(1, path)
+del path
+
+from argparse import ArgumentParser
+import errno
+from json import dumps, loads
+import re
+import socket
+import subprocess
+from time import sleep, time
+import zlib
+import numpy
+from src.EventLoop import ERROR, EventLoop, READ, WRITE
+from src.EventServer import raiseFileLimit
+
+__author__ = 'Roman'
+
+SEQUENCE = re.compile(r'"sequence": (\d+)')
+
+class LoadTest(object):
+    """
+        Holds thousands of dashboards on a server from a single thread (see EventLoop): 'active' dashboards long-poll
+        every update, like the visualization does, while 'idle' ones (e.g. background tabs) subscribe, then keep a
+        long-poll batching many updates waiting on the server. Measures how late each active dashboard gets each tick,
+        compared to the first dashboard that got it.
+    """
+
+    def __init__(self, loop, host, port, idle, active, idleBatch, rate):
+        self.loop = loop
+        self.host = host
+        self.port = port
+        self.idle = idle
+        self.active = active
+        self.idleBatch = idleBatch
+        self.rate = rate
+
+        self.dashboards = []
+        self.connected = 0
+        self.subscribed = 0
+        self.updates = 0
+        self.batches = 0
+        self.resyncs = 0
+        self.errors = 0
+
+        # time the first dashboard got each tick, and how late every other active dashboard got it
+        self.firstReceived = {}
+        self.lags = []
+
+    def start(self):
+        """
+            Opens the connections of the dashboards, 'rate' per second (active ones first)
+        """
+        kinds = [True] * self.active + [False] * self.idle
+        batch = max(1, self.rate // 10)
+
+        def openBatch(start):
+            for active in kinds[start:start + batch]:
+                self.dashboards.append(Dashboard(self, active))
+            if start + batch < len(kinds):
+                self.loop.callLater(0.1, lambda: openBatch(start + batch))
+        openBatch(0)
+
+    def received(self, body, now):
+        """
+            Records when an active dashboard got a tick
+        """
+        match = SEQUENCE.search(body)
+        if match is None:
+            return
+        sequence = int(match.group(1))
+        first = self.firstReceived.setdefault(sequence, now)
+        self.lags.append(now - first)
+
+    def report(self):
+        lags = numpy.array(self.lags) * 1000 if self.lags else numpy.zeros(1)
+        self.lags = []
+        return {
+            'connected': self.connected,
+            'subscribed': self.subscribed,
+            'updates': self.updates,
+            'batches': self.batches,
+            'resyncs': self.resyncs,
+            'errors': self.errors,
+            'lagMs': {
+                'p50': round(numpy.percentile(lags, 50), 1),
+                'p99': round(numpy.percentile(lags, 99), 1),
+                'max': round(lags.max(), 1)
+            }
+        }
+
+
+class Dashboard(object):
+    """
+        A client of the server: subscribes, then long-polls the updates over a single keep-alive connection
+    """
+
+    def __init__(self, test, active):
+        self.test = test
+        self.loop = test.loop
+        self.active = active
+        self.clientId = None
+
+        self.input = ''
+        self.output = ''
+        self.closed = False
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setblocking(0)
+        self.fd = self.socket.fileno()
+        self.connecting = True
+        self.socket.connect_ex((test.host, test.port))
+        self.loop.register(self.fd, self, READ | WRITE)
+
+    def request(self, path):
+        self.output = 'GET %s HTTP/1.1\r\nHost: %s\r\nAccept-Encoding: gzip\r\n\r\n' % (path, self.test.host)
+        self.flush()
+
+    def handleEvent(self, events):
+        if self.connecting:
+            if self.socket.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) != 0:
+                return self.fail()
+            self.connecting = False
+            self.test.connected += 1
+            self.request('/subscribe')
+            return
+
+        if events & (READ | ERROR):
+            self.read()
+        if events & WRITE and not self.closed:
+            self.flush()
+
+    def flush(self):
+        try:
+            sent = self.socket.send(self.output)
+        except socket.error, e:
+            if e.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return self.fail()
+            sent = 0
+        self.output = self.output[sent:]
+        self.loop.modify(self.fd, READ | WRITE if self.output else READ)
+
+    def read(self):
+        try:
+            data = self.socket.recv(65536)
+        except socket.error, e:
+            if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return
+            return self.fail()
+        if not data:
+            return self.fail()
+
+        self.input += data
+        end = self.input.find('\r\n\r\n')
+        if end < 0:
+            return
+        headers = dict((name.strip().lower(), value.strip()) for name, _, value in
+                       (line.partition(':') for line in self.input[:end].split('\r\n')[1:]))
+        length = int(headers.get('content-length', 0))
+        if len(self.input) < end + 4 + length:
+            return
+
+        body = self.input[end + 4:end + 4 + length]
+        self.input = self.input[end + 4 + length:]
+        if headers.get('content-encoding') == 'gzip':
+            body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+        self.respond(body)
+
+    def respond(self, body):
+        now = time()
+        if self.clientId is None:
+            response = loads(body)
+            if 'clientId' not in response:
+                return self.fail()
+            self.clientId = response['clientId']
+            self.test.subscribed += 1
+        elif '"resync": true' in body:
+            self.test.resyncs += 1
+        elif self.active:
+            self.test.updates += 1
+            self.test.received(body, now)
+        else:
+            self.test.batches += 1
+
+        if self.active:
+            self.request('/update?clientId=%d' % self.clientId)
+        else:
+            self.request('/update?clientId=%d&maxEvents=%d&maxWaitMs=3600000' % (self.clientId, self.test.idleBatch))
+
+    def fail(self):
+        self.test.errors += 1
+        self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if not self.connecting:
+            self.test.connected -= 1
+        self.loop.unregister(self.fd)
+        self.socket.close()
+
+
+def serverStatus(pid):
+    """
+        Returns the resident memory (in kilobytes), the number of threads and the CPU seconds used by a process (Linux
+        only)
+    """
+    status = {}
+    for line in open('/proc/%d/status' % pid):
+        name, _, value = line.partition(':')
+        if name in ('VmRSS', 'Threads'):
+            status[name] = int(value.split()[0])
+    fields = open('/proc/%d/stat' % pid).read().rsplit(')', 1)[1].split()
+    cpu = (int(fields[11]) + int(fields[12])) / float(os.sysconf('SC_CLK_TCK'))
+    return {'rssKilobytes': status.get('VmRSS'), 'threads': status.get('Threads'), 'cpuSeconds': round(cpu, 1)}
+
+def waitForServer(host, port, timeout=30):
+    deadline = time() + timeout
+    while time() < deadline:
+        try:
+            socket.create_connection((host, port), 1).close()
+            return True
+        except socket.error:
+            sleep(0.2)
+    return False
+
+def main():
+    parser = ArgumentParser(description='Holds thousands of idle & active dashboards on an EventServer')
+    parser.add_argument('--host', default='127.0.0.1', help='address of the server')
+    parser.add_argument('--port', type=int, default=8081, help='port of the server')
+    parser.add_argument('--spawn', action='store_true', help='start the server (and report its memory, threads & CPU)')
+    parser.add_argument('--idle', type=int, default=5000, help='number of idle dashboards')
+    parser.add_argument('--active', type=int, default=1000, help='number of active dashboards')
+    parser.add_argument('--idle-batch', type=int, default=45, help='number of updates idle dashboards wait for')
+    parser.add_argument('--rate', type=int, default=500, help='number of dashboards connecting per second')
+    parser.add_argument('--duration', type=float, default=60, help='seconds to run for, once every dashboard connected')
+    parser.add_argument('--interval', type=float, default=5, help='seconds between reports')
+    args = parser.parse_args()
+
+    raiseFileLimit()
+
+    server = None
+    if args.spawn:
+        server = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'EventServer.py'),
+                                   '--host', args.host, '--port', str(args.port)], stdout=open(os.devnull, 'w'))
+        if not waitForServer(args.host, args.port):
+            server.kill()
+            sys.exit('The server did not start')
+
+    loop = EventLoop()
+    test = LoadTest(loop, args.host, args.port, args.idle, args.active, args.idle_batch, args.rate)
+    test.start()
+
+    started = time()
+    end = started + float(args.idle + args.active) / args.rate + args.duration
+
+    def report():
+        result = test.report()
+        result['elapsed'] = round(time() - started, 1)
+        if server is not None:
+            result['server'] = serverStatus(server.pid)
+        print dumps(result)
+        sys.stdout.flush()
+
+        if time() >= end:
+            loop.stop()
+        else:
+            loop.callLater(args.interval, report)
+    loop.callLater(args.interval, report)
+
+    try:
+        loop.run()
+    finally:
+        if server is not None:
+            server.terminate()
+
+if __name__ == '__main__':
+    main()
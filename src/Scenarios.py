@@ -0,0 +1,76 @@
+import os
+from json import load
+from src.LargeTopology import CompactTopology
+from src.simulator.Clock import realClock
+from src.simulator.DefaultSimulator import DefaultSimulator
+from src.simulator.RandomSimulator import RandomSimulator
+from src.simulator.Recording import Recorder
+from src.simulator.mapReduce.MapReduceSimulator import MapReduceSimulator
+from src.simulator.scenarios.IndividualMachineFailureSimulator import IndividualMachineFailureSimulator
+from src.simulator.scenarios.RackFailureSimulator import RackFailureSimulator
+from src.simulator.scenarios.UnevenLoadSimulator import UnevenLoadSimulator
+
+__author__ = 'Roman'
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'static')
+
+# How simulators send times to clients, unless told otherwise (see TimeFormatter)
+TIME_FORMAT = 'legacy'
+
+# Where generated topologies are cached between runs
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'cache')
+
+def loadTopology(fileName):
+    """
+        Loads one of the topologies shipped with the static content
+    """
+    return load(open(os.path.join(STATIC_DIR, 'data', fileName)))
+
+def makeSimulator(clusterSimulatorClass, topology, clock, **options):
+    """
+        Builds a simulator for the given topology, using the given cluster simulator, and the given clock for everything.
+        With a 'recordTo' directory, every tick of the simulator is recorded there (see Recorder).
+    """
+    snapshotInterval = options.pop('snapshotInterval', 1)
+    recordTo = options.pop('recordTo', None)
+    historyCapacities = options.pop('historyCapacities', None)
+    options.setdefault('timeFormat', TIME_FORMAT)
+    if isinstance(topology, CompactTopology):
+        machines, structure = topology.machines(), topology
+    else:
+        machines, structure = topology['machines'], topology['structure']
+
+    simulator = DefaultSimulator(clusterSimulatorClass(machines, clock=clock, **options), structure,
+                                 MapReduceSimulator(machines, clock, options['timeFormat']), snapshotInterval, clock,
+                                 historyCapacities)
+    if recordTo is not None:
+        simulator.record(Recorder(recordTo))
+    return simulator
+
+def randomSimulator(clock=realClock, **options):
+    return makeSimulator(RandomSimulator, loadTopology('topology.json'), clock, **options)
+
+def heterogeneousSimulator(clock=realClock, **options):
+    return makeSimulator(RandomSimulator, loadTopology('heterogeneousTopology.json'), clock, **options)
+
+def largeClusterSimulator(clock=realClock, **options):
+    return makeSimulator(RandomSimulator, CompactTopology.cached(directory=CACHE_DIR), clock, vectorized=True, snapshotInterval=5, **options)
+
+def unevenLoadSimulator(clock=realClock, **options):
+    return makeSimulator(UnevenLoadSimulator, loadTopology('topology.json'), clock, **options)
+
+def individualFailureSimulator(clock=realClock, **options):
+    return makeSimulator(IndividualMachineFailureSimulator, loadTopology('topology.json'), clock, **options)
+
+def rackFailureSimulator(clock=realClock, **options):
+    return makeSimulator(RackFailureSimulator, loadTopology('topology.json'), clock, **options)
+
+# Map from scenario name to the function building its simulator (given the clock to use, and simulator options)
+scenarios = {
+    'random': randomSimulator,
+    'heterogeneous': heterogeneousSimulator,
+    'largeCluster': largeClusterSimulator,
+    'uneven': unevenLoadSimulator,
+    'individual': individualFailureSimulator,
+    'rack': rackFailureSimulator
+}
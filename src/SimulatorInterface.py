@@ -6,22 +6,26 @@ if not path in sys.path:
     sys.path.insert(1, path)
 del path
 
-from copy import deepcopy
-import threading
+from time import strftime, time
+from types import GeneratorType
 import cherrypy
-from json import dumps, load
-from src.simulator.RandomSimulator import RandomSimulator
-from src.simulator.mapReduce.MapReduceSimulator import MapReduceSimulator
-from src.simulator.scenarios.UnevenLoadSimulator import UnevenLoadSimulator
-from src.simulator.DefaultSimulator import DefaultSimulator
-from src.simulator.scenarios.RackFailureSimulator import RackFailureSimulator
-from src.simulator.scenarios.IndividualMachineFailureSimulator import IndividualMachineFailureSimulator
-from src.LargeTopology import makeLargeTopology
+from json import dumps
+from src.Scenarios import scenarios
+from src.simulator.AtRiskIndex import AtRiskIndex
+from src.simulator.ClusterView import ColumnarView, DepthView, FilterView
+from src.simulator.Compression import CompressedStream, compressPieces, joinPieces, negotiateEncoding
+from src.simulator.Instrumentation import LOCK_WAITS, SIZE_BUCKETS, TimedLock, instruments
+from src.simulator.MetricsHistory import MetricsHistory
+from src.simulator.Recording import listRecordings
+from src.simulator.ReplaySimulator import ReplaySimulator
+from src.simulator.SimulatorRegistry import SimulatorRegistry
+from src.simulator.TickFrame import TickFrame
+from src.simulator.TickRing import Resync
 
 __author__ = 'roman'
 
 # Index of log messages for each thread
-serverLock = threading.Lock()
+serverLock = TimedLock(LOCK_WAITS.labels(lock='server'))
 
 # Global counter to allow us to assign unique ids to new clients
 nextClientId = 1
@@ -29,26 +33,456 @@ nextClientId = 1
 # Global map from clientId to the simulator they are currently using
 clientSimulatorMap = {}
 
+# Global map from clientId to the view of the cluster they subscribed with (see ClusterView), for the clients that did
+clientViewMap = {}
+
+# Seconds a simulator without clients stays paused before it is torn down
+SIMULATOR_IDLE_TIMEOUT = 300
+
+# Where recordings are kept, and whether the simulators of the scenarios record every tick they produce there
+RECORDINGS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'recordings')
+RECORD = False
+
+# Seconds a replay without clients stays paused before it is torn down
+REPLAY_IDLE_TIMEOUT = 60
+
+# Metrics of the endpoints, and of the clients of the running simulators (updated when the metrics are read)
+ENDPOINT_LATENCY = instruments.histogram('theius_endpoint_seconds', 'Time spent answering requests',
+                                         ('endpoint', 'scenario'))
+RESPONSE_BYTES = instruments.histogram('theius_response_bytes', 'Size of the responses (as sent, compressed or not)',
+                                       ('endpoint', 'scenario'), SIZE_BUCKETS)
+STREAMED_BYTES = instruments.counter('theius_streamed_bytes_total', 'Bytes sent to streaming clients', ('scenario',))
+RESPONSE_ENCODING = instruments.histogram('theius_response_encode_seconds',
+                                          'Time spent assembling & compressing responses out of encoded pieces',
+                                          ('encoding',))
+CLIENTS = instruments.gauge('theius_clients', 'Clients subscribed to each running simulator', ('scenario',))
+WAITING_CLIENTS = instruments.gauge('theius_waiting_clients', 'Clients waiting for the next tick', ('scenario',))
+CLIENT_LAG_MAX = instruments.gauge('theius_client_lag_max_ticks', 'Most ticks a client has yet to read', ('scenario',))
+CLIENT_LAG_MEAN = instruments.gauge('theius_client_lag_mean_ticks', 'Mean number of ticks clients have yet to read',
+                                    ('scenario',))
+
+def instrumented(endpoint):
+    """
+      Observes how long an endpoint takes to answer, and the size of its responses, labeled with the scenario of the
+        client (the bytes of streams are counted as they are sent)
+    """
+    def decorate(handler):
+        def instrumentedHandler(self, *args, **kwargs):
+            started = time()
+            response = handler(self, *args, **kwargs)
+            scenario = requestScenario(kwargs.get('clientId'))
+            ENDPOINT_LATENCY.labels(endpoint=endpoint, scenario=scenario).observe(time() - started)
+
+            if isinstance(response, GeneratorType):
+                return countStreamed(response, STREAMED_BYTES.labels(scenario=scenario))
+            RESPONSE_BYTES.labels(endpoint=endpoint, scenario=scenario).observe(len(response or ''))
+            return response
+
+        instrumentedHandler.__name__ = handler.__name__
+        instrumentedHandler.__doc__ = handler.__doc__
+        return instrumentedHandler
+    return decorate
+
+def requestScenario(clientId):
+    """
+      Returns the scenario of the simulator of the client of the request ('none' for requests without a client)
+    """
+    scenario = getattr(cherrypy.request, 'scenario', None)
+    if scenario is not None:
+        return scenario
+    try:
+        simulator = clientSimulatorMap.get(int(clientId))
+    except (TypeError, ValueError):
+        simulator = None
+    return simulator.scenario if simulator is not None else 'none'
+
+def countStreamed(chunks, counter):
+    for chunk in chunks:
+        counter.increment(len(chunk))
+        yield chunk
+
+def updateClientGauges(registry):
+    """
+      Sets the gauges of the clients of the running simulators of the given registry (simulators that stopped are reset)
+    """
+    for gauge in (CLIENTS, WAITING_CLIENTS, CLIENT_LAG_MAX, CLIENT_LAG_MEAN):
+        for labels, metric in gauge.metrics():
+            metric.set(0)
+
+    for name, simulator in registry.runningSimulators():
+        lags = simulator.clientLags()
+        CLIENTS.labels(scenario=name).set(len(lags))
+        WAITING_CLIENTS.labels(scenario=name).set(sum(1 for lag, waiting in lags if waiting))
+        if lags:
+            CLIENT_LAG_MAX.labels(scenario=name).set(max(lag for lag, waiting in lags))
+            CLIENT_LAG_MEAN.labels(scenario=name).set(sum(lag for lag, waiting in lags) / float(len(lags)))
+
+def recorded(name, factory):
+    """
+      Wraps a scenario's factory, so each simulator it builds records to a new recording, named after the scenario and
+        the time the simulator was started
+    """
+    return lambda: factory(recordTo=os.path.join(RECORDINGS_DIR, '%s-%s' % (name, strftime('%Y%m%d-%H%M%S'))))
+
+def forgetClient(clientId, simulator):
+    """
+      Drops a client its simulator no longer knows (it was pruned for not asking for updates, see
+        BaseSimulator.removeIdleClients) from the maps, unless it moved to another simulator or reconnected since.
+        Returns whether the client is still subscribed.
+    """
+    serverLock.acquire()
+    if clientSimulatorMap.get(clientId) is simulator and not simulator.hasClient(clientId):
+        del clientSimulatorMap[clientId]
+        clientViewMap.pop(clientId, None)
+    subscribed = clientId in clientSimulatorMap
+    serverLock.release()
+    return subscribed
+
+def forgetSimulator(simulator):
+    """
+      Drops the clients still mapped to a simulator that stopped (they are no longer subscribed) from the maps
+    """
+    serverLock.acquire()
+    for clientId, clientSimulator in clientSimulatorMap.items():
+        if clientSimulator is simulator:
+            del clientSimulatorMap[clientId]
+            clientViewMap.pop(clientId, None)
+    serverLock.release()
+
+# The simulators of the scenarios clients are watching, started on demand
+if RECORD:
+    registry = SimulatorRegistry(dict((name, recorded(name, factory)) for name, factory in scenarios.iteritems()), SIMULATOR_IDLE_TIMEOUT)
+else:
+    registry = SimulatorRegistry(scenarios, SIMULATOR_IDLE_TIMEOUT)
+registry.addRetireListener(forgetSimulator)
+
+def parseSpeed(speed):
+    """
+      Parses the speed of a replay: a multiple of the recorded pace, or 'max' (None) to replay as fast as possible
+    """
+    if speed == 'max':
+        return None
+    speed = float(speed)
+    if speed <= 0:
+        raise ValueError('speed should be positive')
+    return speed
+
+def parseList(values):
+    """
+      Parses a comma separated list of names
+    """
+    return [value for value in (values or '').split(',') if value]
+
+def parseView(depth=None, roots=None, nodes=None, severities=None, facilities=None, format=None):
+    """
+      Parses the view of the cluster a client subscribes with: the depth of the tree it is rendered at, or the subtrees
+        & nodes it displays and the severities & facilities of the log events it shows (None for the whole cluster).
+        The 'columnar' format sends the metrics of the nodes as columns (see ColumnarView), except at a depth of the
+        tree, where nodes only hold aggregates anyway.
+    """
+    if format not in (None, '', 'json', 'columnar'):
+        raise ValueError('unknown format')
+
+    filters = [parseList(values) for values in (roots, nodes, severities, facilities)]
+    if depth is not None and depth != '':
+        depth = int(depth)
+        if depth < 0 or any(filters):
+            raise ValueError('depth should not be negative, nor combined with filters')
+        return DepthView(depth)
+
+    view = FilterView(*filters) if any(filters) else None
+    if format == 'columnar':
+        return ColumnarView(view)
+    return view
+
+def clientView(clientId, simulator):
+    """
+      Returns the view of the cluster the client subscribed with, if its simulator supports it (None for the whole
+        cluster)
+    """
+    serverLock.acquire()
+    view = clientViewMap.get(clientId)
+    serverLock.release()
+    return view if view is not None and view.supports(simulator) else None
+
+def framePiece(frame, view):
+    """
+      Returns the pre-encoded response for a tick, for clients of the given view of the cluster, as a piece of a
+        response whose compressed version is kept by the frame (see CompressedStream.write)
+    """
+    if view is None:
+        return frame.encoded, frame.chunks, None
+    return frame.view(view), frame.chunks, view.key
+
+def snapshotPieces(snapshot, view=None, topologyTag=None, **fields):
+    """
+      Builds the pieces of the JSON response for a client joining a simulator, embedding the snapshot's pre-encoded
+        state & structure (for the given view of the cluster), whose compressed versions are kept by the snapshot.
+
+      The structure is left out if the client already has it, i.e. if it sent the 'topologyTag' of its structure and
+        the structure did not change since (see EncodedTopology.tag).
+    """
+    state, topology = (snapshot.state, snapshot.topology) if view is None else snapshot.view(view)
+    key = view.key if view is not None else None
+    encodedTopology = snapshot.encodedTopology
+    fields['sequence'] = snapshot.version
+    fields['time'] = snapshot.time
+    fields['topologyTag'] = encodedTopology.tag(key)
+
+    pieces = ['%s, "currentState": ' % dumps(fields)[:-1], (state, snapshot.chunks, (key, 'state'))]
+    if topologyTag != fields['topologyTag']:
+        pieces += [', "structure": ', (topology, encodedTopology.chunks, key)]
+    pieces.append('}')
+    return pieces
+
+def respond(pieces):
+    """
+      Returns the response made of the given pieces, compressed if the client accepts it (the pieces shared between
+        clients are only compressed once, see CompressedStream)
+    """
+    encoding = negotiateEncoding(cherrypy.request.headers.get('Accept-Encoding'))
+    cherrypy.response.headers['Vary'] = 'Accept-Encoding'
+
+    started = time()
+    if encoding is None:
+        response = joinPieces(pieces)
+    else:
+        cherrypy.response.headers['Content-Encoding'] = encoding
+        response = compressPieces(pieces, encoding)
+    RESPONSE_ENCODING.labels(encoding=encoding or 'identity').observe(time() - started)
+    return response
+
+def snapshotResponse(snapshot, view=None, topologyTag=None, **fields):
+    """
+      Builds the JSON response for a client joining a simulator (see snapshotPieces)
+    """
+    return respond(snapshotPieces(snapshot, view, topologyTag, **fields))
+
+def querySubtree(simulator, node, depth=1):
+    """
+      Returns the response of the subtree endpoint for the given simulator (see SimulatorInterface.subtree, the
+        query functions below are shared with the endpoints of EventServer)
+    """
+    structure = simulator.subtree(node, min(max(int(depth), 1), 3))
+    if structure is None:
+        return {
+            'message': 'unknown node',
+            'successful': False
+        }
+
+    return {
+        'structure': structure,
+        'successful': True
+    }
+
+def queryAtRisk(simulator, ranking='predictedFailureTime', k=20):
+    """
+      Returns the response of the atRisk endpoint for the given simulator (see SimulatorInterface.atRisk)
+    """
+    if ranking not in AtRiskIndex.RANKINGS:
+        return {
+            'message': 'ranking should be one of ' + ', '.join(sorted(AtRiskIndex.RANKINGS)),
+            'successful': False
+        }
+
+    return {
+        'nodes': simulator.atRisk(ranking, min(max(int(k), 1), 1000)),
+        'successful': True
+    }
+
+def queryEvents(simulator, node=None, severity=None, start=None, end=None, before=None, limit=100):
+    """
+      Returns the response of the events endpoint for the given simulator (see SimulatorInterface.events)
+    """
+    try:
+        start = float(start) if start else None
+        end = float(end) if end else None
+        before = int(before) if before else None
+        limit = min(max(int(limit), 1), 1000)
+    except ValueError:
+        return {
+            'message': 'start, end, before and limit should be numbers',
+            'successful': False
+        }
+
+    events, cursor = simulator.queryEvents(node or None, severity or None, start, end, before, limit)
+    return {
+        'events': events,
+        'before': cursor,
+        'successful': True
+    }
+
+def queryHistory(simulator, node=None, metrics=None, start=None, end=None, resolution=None):
+    """
+      Returns the response of the history endpoint for the given simulator (see SimulatorInterface.history)
+    """
+    try:
+        start = float(start) if start else None
+        end = float(end) if end else None
+        resolution = int(resolution) if resolution else None
+    except ValueError:
+        return {
+            'message': 'start, end and resolution should be numbers',
+            'successful': False
+        }
+
+    metrics = metrics.split(',') if metrics else None
+    if metrics is not None and not set(metrics).issubset(MetricsHistory.METRICS):
+        return {
+            'message': 'metrics should be among ' + ', '.join(MetricsHistory.METRICS),
+            'successful': False
+        }
+
+    if resolution is not None and resolution not in MetricsHistory.RESOLUTIONS:
+        return {
+            'message': 'resolution should be one of ' + ', '.join(str(r) for r in MetricsHistory.RESOLUTIONS),
+            'successful': False
+        }
+
+    history = simulator.metricsSeries(node or None, metrics, start, end, resolution)
+    if history is None:
+        return {
+            'message': 'unknown node, or no history',
+            'successful': False
+        }
+
+    resolution, times, series = history
+    return {
+        'resolution': resolution,
+        'times': times,
+        'series': series,
+        'successful': True
+    }
+
+def queryHistoryAt(simulator, time, node=None):
+    """
+      Returns the response of the historyAt endpoint for the given simulator (see SimulatorInterface.historyAt)
+    """
+    try:
+        time = float(time)
+    except ValueError:
+        return {
+            'message': 'time should be a number',
+            'successful': False
+        }
+
+    sample = simulator.metricsAt(time, node or None)
+    if sample is None:
+        return {
+            'message': 'unknown node, or no history at that time',
+            'successful': False
+        }
+
+    sampleTime, nodes = sample
+    return {
+        'time': sampleTime,
+        'nodes': nodes,
+        'successful': True
+    }
+
+def queryRecordings():
+    return {
+        'recordings': listRecordings(RECORDINGS_DIR),
+        'successful': True
+    }
+
+def openReplay(recording, speed=1, time=None):
+    """
+      Opens the replay of a recording (see SimulatorInterface.replay), not started yet. Raises a ValueError with the
+        message for the client if it cannot be replayed.
+    """
+    try:
+        speed = parseSpeed(speed)
+        time = float(time) if time else None
+    except ValueError:
+        raise ValueError("speed should be a positive number or 'max', and time a number")
+
+    directory = os.path.join(RECORDINGS_DIR, recording)
+    if os.path.basename(recording) != recording or not os.path.isdir(directory):
+        raise ValueError('unknown recording')
+
+    simulator = ReplaySimulator(directory, speed, time)
+
+    # the replay stops once its client has left for REPLAY_IDLE_TIMEOUT seconds
+    simulator.idleTimeout = REPLAY_IDLE_TIMEOUT
+    simulator.onIdle = retireReplay
+    simulator.setDaemon(True)
+    return simulator
+
+def retireReplay(replay):
+    """
+      Called by a replay that has been idle for REPLAY_IDLE_TIMEOUT seconds: forgets its clients, and lets it stop
+    """
+    forgetSimulator(replay)
+    return True
+
+def applyReplayControl(simulator, control):
+    """
+      Applies a seek or speed change to a replay, returning the response of the endpoint (see
+        SimulatorInterface.controlReplay)
+    """
+
+    # client not replaying a recording, error
+    if not isinstance(simulator, ReplaySimulator):
+        return {
+            'message': 'Not replaying',
+            'successful': False
+        }
+
+    try:
+        control(simulator)
+    except ValueError:
+        return {
+            'message': "time should be a number, and speed a positive number or 'max'",
+            'successful': False
+        }
+
+    return {
+        'successful': True
+    }
+
 class SimulatorInterface(object):
     """
       Provides a web interface for log trace simulations
     """
 
     @cherrypy.expose
-    def index(self):
+    @instrumented('index')
+    def index(self, **query):
         """
-          Just return the static HTML content
+          Just return the static HTML content (the query string is read by the page, see subscribeFilter in data.js)
         """
         return open(os.path.join(STATIC_DIR, 'index.html')).read()
 
 
     @cherrypy.expose
-    def subscribe(self):
+    @instrumented('subscribe')
+    def subscribe(self, depth=None, roots=None, nodes=None, severities=None, facilities=None, format=None,
+                  topologyTag=None):
         """
           Subscribes a client to subscribe for log updates, returning the client's assigned id,
           and information about the current state of the cluster
+
+          With depth, the client only gets the cluster down to that depth of its tree, each node holding the aggregates
+            of its subtree (see DepthView). With (comma separated) roots and nodes, it only gets the subtrees of those
+            roots and those nodes, and with severities and facilities, only the log events of those (see FilterView).
+            With format 'columnar', the metrics of the nodes changed at each tick are sent as columns (see ColumnarView).
+
+          Clients that already have the structure of the cluster (e.g. from a previous subscription) send its
+            'topologyTag', and only get the structure again if it changed (see snapshotPieces).
+
+          Responses are gzip or deflate compressed for clients that accept it (see respond).
         """
 
+        try:
+            view = parseView(depth, roots, nodes, severities, facilities, format)
+        except ValueError:
+            return dumps({
+                'message': 'depth should be a non-negative integer, and cannot be combined with filters, '
+                           'and format should be json or columnar',
+                'successful': False
+            })
+
         serverLock.acquire()
 
         # Get this client's id
@@ -56,32 +490,40 @@ class SimulatorInterface(object):
         clientId = nextClientId
         nextClientId += 1
 
-        # Assign this client the default simulator
-        simulator = randomSimulator
-        clientSimulatorMap[clientId] = simulator
-        simulator.addClient(clientId)
+        serverLock.release()
 
-        # Get the current system state
-        currentState = deepcopy(simulator.state())
-        currentStructure = deepcopy(simulator.topology())
+        # Assign this client the default simulator, and get the latest snapshot of the system state (the client gets
+        # every update after it)
+        simulator, snapshot = registry.addClient('random', clientId)
 
+        serverLock.acquire()
+        clientSimulatorMap[clientId] = simulator
+        clientViewMap[clientId] = view
         serverLock.release()
+        cherrypy.request.scenario = simulator.scenario
 
         # Respond with client's id
         cherrypy.response.headers['Content-Type'] = 'application/json'
-        return dumps({
-            'clientId': clientId,
-            'currentState': currentState,
-            'structure': currentStructure
-        })
+        return snapshotResponse(snapshot, clientView(clientId, simulator), topologyTag, clientId=clientId)
 
     @cherrypy.expose
-    def changeSimulator(self, clientId, simulator):
+    @instrumented('changeSimulator')
+    def changeSimulator(self, clientId, simulator, depth=None, roots=None, nodes=None, severities=None, facilities=None,
+                        format=None, topologyTag=None):
         """
-            Changes the client to use a different simulator
+            Changes the client to use a different simulator (with the given view of the cluster, see subscribe)
         """
         clientId = int(clientId)
 
+        try:
+            view = parseView(depth, roots, nodes, severities, facilities, format)
+        except ValueError:
+            return dumps({
+                'message': 'depth should be a non-negative integer, and cannot be combined with filters, '
+                           'and format should be json or columnar',
+                'successful': False
+            })
+
         serverLock.acquire()
 
         # client not subscribed, error
@@ -92,60 +534,218 @@ class SimulatorInterface(object):
                 'successful': False
             })
 
-        if simulator == "random":
-            clientSimulatorMap[clientId].removeClient(clientId)
-            clientSimulatorMap[clientId] = randomSimulator
-            clientSimulatorMap[clientId].addClient(clientId)
+        # could not find name of simulator
+        if simulator not in scenarios:
+            serverLock.release()
+            return dumps({
+                'message': 'unknown simulator',
+                'successful': False
+            })
 
-        elif simulator == "heterogeneous":
-            clientSimulatorMap[clientId].removeClient(clientId)
-            clientSimulatorMap[clientId] = heterogeneousSimulator
-            clientSimulatorMap[clientId].addClient(clientId)
+        clientSimulatorMap[clientId].removeClient(clientId)
+        clientSimulatorMap[clientId], snapshot = registry.addClient(simulator, clientId)
+        clientViewMap[clientId] = view
+        clientSimulator = clientSimulatorMap[clientId]
+        serverLock.release()
 
-        elif simulator == "largeCluster":
-            clientSimulatorMap[clientId].removeClient(clientId)
-            clientSimulatorMap[clientId] = largeClusterSimulator
-            clientSimulatorMap[clientId].addClient(clientId)
+        # Respond with the latest snapshot of the system state (the client gets every update after it)
+        cherrypy.response.headers['Content-Type'] = 'application/json'
+        return snapshotResponse(snapshot, clientView(clientId, clientSimulator), topologyTag, successful=True)
 
-        elif simulator == "uneven":
-            clientSimulatorMap[clientId].removeClient(clientId)
-            clientSimulatorMap[clientId] = unevenLoadSimulator
-            clientSimulatorMap[clientId].addClient(clientId)
+    @cherrypy.expose
+    @instrumented('update')
+    def update(self, clientId, maxEvents=None, maxWaitMs=0, coalesce=False, topologyTag=None):
+        """
+          Updates the client with the latest set of messages added by the log simulator
+            (blocks until the SimulatorThread hits the semaphore for this client)
 
-        elif simulator == "individual":
-            clientSimulatorMap[clientId].removeClient(clientId)
-            clientSimulatorMap[clientId] = individualFailureSimulator
-            clientSimulatorMap[clientId].addClient(clientId)
+          With maxEvents, returns a batch of all the available ticks (at most maxEvents of them), waiting up to
+            maxWaitMs milliseconds for more ticks to be available. With coalesce, the batch is merged into a single tick.
 
-        elif simulator == "rack":
-            clientSimulatorMap[clientId].removeClient(clientId)
-            clientSimulatorMap[clientId] = rackFailureSimulator
-            clientSimulatorMap[clientId].addClient(clientId)
+          A client too far behind gets a fresh snapshot instead, without the structure if it did not change since the
+            one of the given 'topologyTag' (see snapshotPieces).
+        """
+        clientId = int(clientId)
 
-        # could not find name of simulator
+        serverLock.acquire()
+
+        # client not subscribed, error
+        if clientId not in clientSimulatorMap:
+            serverLock.release()
+            return dumps({
+                'message': 'Not subscribed',
+                'successful': False
+            })
+
+        # obtain client's simulator
+        simulator = clientSimulatorMap[clientId]
+        serverLock.release()
+
+        # wait for data to be available
+        if maxEvents is None:
+            frames = simulator.getNextLog(clientId)
         else:
+            frames = simulator.getNextLogs(clientId, max(int(maxEvents), 1), max(float(maxWaitMs), 0) / 1000.0)
+
+        # client moved to another simulator, reconnected, or was pruned for being idle
+        if frames is None:
+            return dumps({
+                'message': 'Moved to another simulator' if forgetClient(clientId, simulator) else 'Not subscribed',
+                'successful': False
+            })
+
+        cherrypy.response.headers['Content-Type'] = 'application/json'
+        view = clientView(clientId, simulator)
+
+        # the client fell too far behind, it has to start over from the latest snapshot
+        if isinstance(frames, Resync):
+            return snapshotResponse(frames.snapshot, view, topologyTag, successful=True, resync=True,
+                                    skipped=frames.skipped)
+
+        # the frames were already encoded by the simulator thread (or for the client's view), just send them out (each
+        # frame is compressed once as well, only coalesced frames are encoded & compressed per request)
+        if maxEvents is None:
+            return respond([framePiece(frames, view)])
+        elif coalesce and coalesce != 'false':
+            return respond([framePiece(TickFrame.coalesce(frames), view)])
+
+        pieces = ['{"successful": true, "batch": true, "frames": [']
+        for frame in frames:
+            if len(pieces) > 1:
+                pieces.append(', ')
+            pieces.append(framePiece(frame, view))
+        pieces.append(']}')
+        return respond(pieces)
+
+    @cherrypy.expose
+    @instrumented('stream')
+    def stream(self, clientId, lastSequence=None):
+        """
+          Streams the latest updates of the client's simulator over a single connection, as server-sent events (one
+            'message' event per tick, with the tick's sequence number as the event id).
+
+          A client reconnecting with the sequence number of the last tick it received (as 'lastSequence', or the
+            Last-Event-ID header) resumes right after it. If that tick is too old, it first gets a 'snapshot' event
+            with the full state to start over from (the structure is only sent again if it changed since the last
+            snapshot of the stream).
+
+          For clients that accept it, the whole stream is a single gzip or deflate compressed response, each event
+            being flushed as it is sent (see CompressedStream).
+        """
+        clientId = int(clientId)
+        lastSequence = cherrypy.request.headers.get('Last-Event-ID', lastSequence)
+
+        serverLock.acquire()
+
+        # client not subscribed, error
+        if clientId not in clientSimulatorMap:
             serverLock.release()
             return dumps({
-                'message': 'unknown simulator',
+                'message': 'Not subscribed',
                 'successful': False
             })
 
-        # Get the current system state
-        currentState = deepcopy(clientSimulatorMap[clientId].state())
-        currentStructure = deepcopy(clientSimulatorMap[clientId].topology())
+        simulator = clientSimulatorMap[clientId]
+        serverLock.release()
+
+        snapshot = None
+        if lastSequence:
+            snapshot = simulator.resumeClient(clientId, int(lastSequence))
+
+        cherrypy.response.headers['Content-Type'] = 'text/event-stream'
+        cherrypy.response.headers['Cache-Control'] = 'no-cache'
+        cherrypy.response.headers['Vary'] = 'Accept-Encoding'
+        view = clientView(clientId, simulator)
+
+        encoding = negotiateEncoding(cherrypy.request.headers.get('Accept-Encoding'))
+        compressedStream = CompressedStream(encoding) if encoding is not None else None
+        if encoding is not None:
+            cherrypy.response.headers['Content-Encoding'] = encoding
+
+        def event(pieces):
+            if compressedStream is None:
+                return joinPieces(pieces)
+            return ''.join(compressedStream.write(piece) for piece in pieces)
+
+        def events():
+            if compressedStream is not None:
+                yield compressedStream.header()
+
+            # the tag of the last structure sent in the stream
+            topologyTag = None
+            if snapshot is not None:
+                yield event(['event: snapshot\nid: %d\ndata: ' % snapshot.version] +
+                            snapshotPieces(snapshot, view, successful=True) + ['\n\n'])
+                topologyTag = snapshot.encodedTopology.tag(view.key if view is not None else None)
+
+            while True:
+                frame = simulator.getNextLog(clientId)
+
+                # client moved to another simulator, reconnected, or was pruned for being idle
+                if frame is None:
+                    subscribed = forgetClient(clientId, simulator)
+                    yield event(['event: unsubscribed\ndata: %s\n\n' % dumps({'subscribed': subscribed})])
+                    if compressedStream is not None:
+                        yield compressedStream.end()
+                    return
+
+                # client fell too far behind, it has to start over from the latest snapshot
+                if isinstance(frame, Resync):
+                    yield event(['event: snapshot\nid: %d\ndata: ' % frame.snapshot.version] +
+                                snapshotPieces(frame.snapshot, view, topologyTag, successful=True, resync=True,
+                                               skipped=frame.skipped) + ['\n\n'])
+                    topologyTag = frame.snapshot.encodedTopology.tag(view.key if view is not None else None)
+                    continue
+
+                yield event(['id: %d\ndata: ' % frame.sequence, framePiece(frame, view), '\n\n'])
+
+        return events()
+    stream._cp_config = {'response.stream': True}
+
+    @cherrypy.expose
+    @instrumented('topology')
+    def topology(self, clientId):
+        """
+          Returns the structure of the client's simulator (for its view of the cluster), as of its latest snapshot. The
+            hash of the structure is sent as its ETag (and as 'topologyTag' with every snapshot), so clients sending it
+            back in If-None-Match only download the structure again once it changed.
+        """
+        clientId = int(clientId)
+
+        serverLock.acquire()
 
+        # client not subscribed, error
+        if clientId not in clientSimulatorMap:
+            serverLock.release()
+            return dumps({
+                'message': 'Not subscribed',
+                'successful': False
+            })
+
+        simulator = clientSimulatorMap[clientId]
         serverLock.release()
-        return  dumps({
-            'successful': True,
-            'currentState': currentState,
-            'structure': currentStructure
-        })
+
+        snapshot = simulator.snapshot
+        view = clientView(clientId, simulator)
+        topology = snapshot.topology if view is None else snapshot.view(view)[1]
+        key = view.key if view is not None else None
+
+        tag = '"%s"' % snapshot.encodedTopology.tag(key)
+        cherrypy.response.headers['ETag'] = tag
+        cherrypy.response.headers['Cache-Control'] = 'no-cache'
+        if tag in [match.strip() for match in cherrypy.request.headers.get('If-None-Match', '').split(',')]:
+            cherrypy.response.status = 304
+            return ''
+
+        cherrypy.response.headers['Content-Type'] = 'application/json'
+        return respond([(topology, snapshot.encodedTopology.chunks, key)])
 
     @cherrypy.expose
-    def update(self, clientId):
+    @instrumented('subtree')
+    def subtree(self, clientId, node, depth=1):
         """
-          Updates the client with the latest set of messages added by the log simulator
-            (blocks until the SimulatorThread hits the semaphore for this client)
+          Returns the structure of a node of the client's cluster, with its descendants up to 'depth' levels below it
+            (for the parts of large topologies that are only sent to clients when they expand them)
         """
         clientId = int(clientId)
 
@@ -159,25 +759,214 @@ class SimulatorInterface(object):
                 'successful': False
             })
 
-        # obtain client's simulator
         simulator = clientSimulatorMap[clientId]
         serverLock.release()
 
-        # wait for data to be available
-        logData = simulator.getNextLog(clientId)
+        cherrypy.response.headers['Content-Type'] = 'application/json'
+        return dumps(querySubtree(simulator, node, depth))
+
+    @cherrypy.expose
+    @instrumented('atRisk')
+    def atRisk(self, clientId, ranking='predictedFailureTime', k=20):
+        """
+          Returns the k most at risk nodes of the client's current simulator, by soonest predicted failure
+            ('predictedFailureTime'), lowest health ('health') or highest probability of a FATAL event
+            ('fatalProbability')
+        """
+        clientId = int(clientId)
+
+        serverLock.acquire()
+
+        # client not subscribed, error
+        if clientId not in clientSimulatorMap:
+            serverLock.release()
+            return dumps({
+                'message': 'Not subscribed',
+                'successful': False
+            })
+
+        simulator = clientSimulatorMap[clientId]
+        serverLock.release()
+
+        cherrypy.response.headers['Content-Type'] = 'application/json'
+        return dumps(queryAtRisk(simulator, ranking, k))
+
+    @cherrypy.expose
+    @instrumented('events')
+    def events(self, clientId, node=None, severity=None, start=None, end=None, before=None, limit=100):
+        """
+          Pages through the log events of the client's current simulator, newest first. Events can be filtered by node,
+            severity and time range (in seconds since the epoch). Pass the returned 'before' cursor to get the next page.
+        """
+        clientId = int(clientId)
+
+        serverLock.acquire()
+
+        # client not subscribed, error
+        if clientId not in clientSimulatorMap:
+            serverLock.release()
+            return dumps({
+                'message': 'Not subscribed',
+                'successful': False
+            })
+
+        simulator = clientSimulatorMap[clientId]
+        serverLock.release()
+
+        cherrypy.response.headers['Content-Type'] = 'application/json'
+        return dumps(queryEvents(simulator, node, severity, start, end, before, limit))
+
+    @cherrypy.expose
+    @instrumented('history')
+    def history(self, clientId, node=None, metrics=None, start=None, end=None, resolution=None):
+        """
+          Returns the history of the metrics of a node of the client's cluster and its descendants (of the whole cluster
+            by default), between two clock times (in seconds since the epoch, defaults to the last hour). 'metrics' is
+            a comma separated list of metrics (defaults to all of them). Samples are taken every tick (resolution 0),
+            or over buckets of 10, 60 or 600 seconds; the resolution is picked to fit the time range unless one is
+            given. Each sample has the min, mean & max over the nodes (and over the ticks of its bucket).
+        """
+        clientId = int(clientId)
+
+        serverLock.acquire()
+
+        # client not subscribed, error
+        if clientId not in clientSimulatorMap:
+            serverLock.release()
+            return dumps({
+                'message': 'Not subscribed',
+                'successful': False
+            })
+
+        simulator = clientSimulatorMap[clientId]
+        serverLock.release()
+
+        cherrypy.response.headers['Content-Type'] = 'application/json'
+        return dumps(queryHistory(simulator, node, metrics, start, end, resolution))
 
-        if logData is None:
+    @cherrypy.expose
+    @instrumented('historyAt')
+    def historyAt(self, clientId, time, node=None):
+        """
+          Returns the metrics of every node of the client's cluster (or of a node and its descendants) at a clock time
+            (in seconds since the epoch), in the format of the cluster state, from the finest history still holding it
+        """
+        clientId = int(clientId)
+
+        serverLock.acquire()
+
+        # client not subscribed, error
+        if clientId not in clientSimulatorMap:
+            serverLock.release()
             return dumps({
                 'message': 'Not subscribed',
                 'successful': False
             })
 
-        return dumps({
-            'cluster' : logData['cluster'],
-            'mapReduce': logData['mapReduce'],
-            'time': simulator.getTime(),
-            'successful': True
-        })
+        simulator = clientSimulatorMap[clientId]
+        serverLock.release()
+
+        cherrypy.response.headers['Content-Type'] = 'application/json'
+        return dumps(queryHistoryAt(simulator, time, node))
+
+    @cherrypy.expose
+    @instrumented('recordings')
+    def recordings(self):
+        """
+          Lists the recordings that can be replayed, with the clock times (in seconds since the epoch) of their first
+            and last keyframes
+        """
+        cherrypy.response.headers['Content-Type'] = 'application/json'
+        return dumps(queryRecordings())
+
+    @cherrypy.expose
+    @instrumented('replay')
+    def replay(self, clientId, recording, speed=1, time=None):
+        """
+          Changes the client to replay a recording, from the given clock time (defaults to the start of the recording),
+            at 'speed' times the recorded pace (or as fast as possible, with 'max'). Each client gets its own replay,
+            which it controls with seek and replaySpeed.
+        """
+        clientId = int(clientId)
+
+        serverLock.acquire()
+        subscribed = clientId in clientSimulatorMap
+        serverLock.release()
+
+        # client not subscribed, error
+        if not subscribed:
+            return dumps({
+                'message': 'clientId should be a valid integer client id',
+                'successful': False
+            })
+
+        # opening the recording maps it and decodes the ticks up to the start time, which must not hold up the other
+        # endpoints
+        try:
+            simulator = openReplay(recording, speed, time)
+        except ValueError, error:
+            return dumps({
+                'message': str(error),
+                'successful': False
+            })
+
+        serverLock.acquire()
+        clientSimulatorMap[clientId].removeClient(clientId)
+        snapshot = simulator.addClient(clientId)
+        clientSimulatorMap[clientId] = simulator
+        simulator.start()
+        serverLock.release()
+
+        # Respond with the snapshot the replay starts from (the client gets every update after it)
+        cherrypy.response.headers['Content-Type'] = 'application/json'
+        return snapshotResponse(snapshot, successful=True, timestamp=simulator.getTimestamp())
+
+    @cherrypy.expose
+    @instrumented('seek')
+    def seek(self, clientId, time=None):
+        """
+          Jumps the client's replay to the given clock time (defaults to the time it is at). The client's updates then
+            start over with a fresh snapshot (a resync).
+        """
+        return self.controlReplay(clientId, lambda replay: replay.seek(float(time) if time else replay.getTimestamp()))
+
+    @cherrypy.expose
+    @instrumented('replaySpeed')
+    def replaySpeed(self, clientId, speed):
+        """
+          Changes the speed of the client's replay, a multiple of the recorded pace, or 'max'
+        """
+        return self.controlReplay(clientId, lambda replay: replay.setSpeed(parseSpeed(speed)))
+
+    def controlReplay(self, clientId, control):
+        """
+          Applies a seek or speed change to the client's replay
+        """
+        clientId = int(clientId)
+
+        serverLock.acquire()
+        simulator = clientSimulatorMap.get(clientId)
+        serverLock.release()
+
+        return dumps(applyReplayControl(simulator, control))
+
+    @cherrypy.expose
+    def metrics(self):
+        """
+          Returns the operational metrics of the server (see Instrumentation), in the Prometheus text format
+        """
+        updateClientGauges(registry)
+        cherrypy.response.headers['Content-Type'] = 'text/plain; version=0.0.4'
+        return instruments.text()
+
+    @cherrypy.expose
+    def metricsJson(self):
+        """
+          Returns the operational metrics of the server as JSON
+        """
+        updateClientGauges(registry)
+        cherrypy.response.headers['Content-Type'] = 'application/json'
+        return dumps(instruments.json())
 
 
 # Server configuration
@@ -189,33 +978,8 @@ config = {
     }
 }
 
-# Start the server
-cherrypy.tree.mount(SimulatorInterface(), '/', config=config)
-cherrypy.engine.start()
-
-# Start the default simulator
-networkTopology = load(open(os.path.join(STATIC_DIR, 'data/topology.json')))
-randomSimulator = DefaultSimulator(RandomSimulator(networkTopology['machines']), networkTopology['structure'], MapReduceSimulator(networkTopology['machines']))
-randomSimulator.start()
-
-# Start the heterogeneous cluster simulator
-heterogeneousNetworkTopology = load(open(os.path.join(STATIC_DIR, 'data/heterogeneousTopology.json')))
-heterogeneousSimulator = DefaultSimulator(RandomSimulator(heterogeneousNetworkTopology['machines']), heterogeneousNetworkTopology['structure'], MapReduceSimulator(heterogeneousNetworkTopology['machines']))
-heterogeneousSimulator.start()
-
-# Start the large topology cluster simulator
-largeClusterTopology = makeLargeTopology()
-largeClusterSimulator = DefaultSimulator(RandomSimulator(largeClusterTopology['machines']), largeClusterTopology['structure'], MapReduceSimulator(largeClusterTopology['machines']))
-largeClusterSimulator.start()
-
-# Start the uneven CPU load simulator
-unevenLoadSimulator = DefaultSimulator(UnevenLoadSimulator(networkTopology['machines']), networkTopology['structure'], MapReduceSimulator(networkTopology['machines']))
-unevenLoadSimulator.start()
-
-# Start the Individual Nodes prone to failure Simulator
-individualFailureSimulator = DefaultSimulator(IndividualMachineFailureSimulator(networkTopology['machines']), networkTopology['structure'], MapReduceSimulator(networkTopology['machines']))
-individualFailureSimulator.start()
-
-#Start the One rack prone to failure simulator
-rackFailureSimulator = DefaultSimulator(RackFailureSimulator(networkTopology['machines']), networkTopology['structure'], MapReduceSimulator(networkTopology['machines']))
-rackFailureSimulator.start()
\ No newline at end of file
+# Start the server (simulators are started when their first client subscribes)
+if __name__ == '__main__':
+    cherrypy.tree.mount(SimulatorInterface(), '/', config=config)
+    cherrypy.engine.start()
+    cherrypy.engine.block()
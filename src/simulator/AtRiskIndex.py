@@ -0,0 +1,102 @@
+from heapq import heappush, heappop, heapify
+import threading
+
+__author__ = 'Roman'
+
+class AtRiskIndex(object):
+    """
+        Keeps the nodes of a cluster ranked by how at risk they are (soonest predicted failure, lowest health, highest
+        probability of a FATAL event), so the most at risk nodes can be found without scanning the cluster.
+
+        Each ranking is a heap of (key, node name) entries. Changing a node's key pushes a new entry and leaves the old
+        one in the heap: entries whose key is no longer the node's current key are stale, and are skipped by queries
+        (the heap is rebuilt once stale entries outnumber current ones). Updated by the simulator thread, queried by
+        the server threads.
+    """
+
+    # Map from ranking name to the function giving a node's key (lowest first) from its state
+    RANKINGS = {
+        'predictedFailureTime': lambda node: node['predictedFailureTime'],
+        'health': lambda node: node['health'],
+        'fatalProbability': lambda node: -node['predictedSeverityProbabilities']['FATAL']
+    }
+
+    # State properties the rankings depend on
+    PROPERTIES = ('predictedFailureTime', 'health', 'predictedSeverityProbabilities')
+
+    def __init__(self):
+        self.heaps = dict((ranking, []) for ranking in self.RANKINGS)
+
+        # map from ranking name to the current key of each node
+        self.keys = dict((ranking, {}) for ranking in self.RANKINGS)
+
+        self.indexLock = threading.Lock()
+
+    def update(self, nodeStates):
+        """
+            Updates the keys of the given nodes, given a map from node name to its (current) state
+        """
+        self.indexLock.acquire()
+
+        for ranking, keyFunction in self.RANKINGS.iteritems():
+            heap = self.heaps[ranking]
+            keys = self.keys[ranking]
+            for nodeName, node in nodeStates.iteritems():
+                key = keyFunction(node)
+                if keys.get(nodeName) != key:
+                    keys[nodeName] = key
+                    heappush(heap, (key, nodeName))
+
+            if len(heap) > 2 * len(keys) + 64:
+                self.rebuild(ranking)
+
+        self.indexLock.release()
+
+    def remove(self, nodeName):
+        """
+            Removes a node from every ranking (its entries become stale)
+        """
+        self.indexLock.acquire()
+        for keys in self.keys.itervalues():
+            keys.pop(nodeName, None)
+        self.indexLock.release()
+
+    def rebuild(self, ranking):
+        """
+            Drops the stale entries of a ranking (with the indexLock held)
+        """
+        heap = [(key, nodeName) for nodeName, key in self.keys[ranking].iteritems()]
+        heapify(heap)
+        self.heaps[ranking] = heap
+
+    def top(self, ranking, k):
+        """
+            Returns the k most at risk nodes for the given ranking, most at risk first, as pairs of node name and map
+            from ranking name to the node's key.
+
+            Walks the heap best-first from its root, only ever looking at the children of the entries it returns (or
+            skips as stale), so this takes O(k log k) when few entries are stale, whatever the size of the cluster.
+        """
+        self.indexLock.acquire()
+
+        heap = self.heaps[ranking]
+        keys = self.keys[ranking]
+
+        nodes = []
+        returned = set()
+        frontier = [(heap[0], 0)] if heap else []
+        while frontier and len(nodes) < k:
+            (key, nodeName), position = heappop(frontier)
+
+            # a node whose key changed back to an older value has several current entries
+            if keys.get(nodeName) == key and nodeName not in returned:
+                returned.add(nodeName)
+                nodes.append((nodeName, dict((name, self.keys[name][nodeName]) for name in self.keys)))
+
+            for child in (2 * position + 1, 2 * position + 2):
+                if child < len(heap):
+                    heappush(frontier, (heap[child], child))
+
+        self.indexLock.release()
+        return nodes
+
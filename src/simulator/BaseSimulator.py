@@ -1,8 +1,15 @@
-from Queue import Queue
 import threading
+from time import time
+from src.simulator.Instrumentation import LOCK_WAITS, TimedLock, instruments
+from src.simulator.TickRing import TickRing, ClientCursor, Resync
 
 __author__ = 'Roman'
 
+RESYNCS = instruments.counter('theius_client_resyncs_total',
+                              'Clients that fell too far behind and started over from a snapshot', ('scenario',))
+PRUNED_CLIENTS = instruments.counter('theius_clients_pruned_total',
+                                     'Clients dropped for not asking for updates for too long', ('scenario',))
+
 class BaseSimulator(threading.Thread):
     """
         This is an Abstract Class
@@ -11,64 +18,260 @@ class BaseSimulator(threading.Thread):
         should not have to worry about locks
     """
 
-    def __init__(self):
+    def __init__(self, historySize=50):
         """
-            Initializes the simulator
+            Initializes the simulator, keeping the last 'historySize' frames for clients to read from
         """
 
         threading.Thread.__init__(self)
 
-        # map from clientId to information about the client (see addClient for more information)
+        # the name of the scenario this simulator runs, for its metrics (see Instrumentation)
+        self.scenario = 'unknown'
+
+        # map from clientId to the client's cursor into the ring of frames (see addClient for more information)
         self.clientMap = {}
 
-        # a lock for this class
-        self.simulatorLock = threading.Lock()
+        # a lock for this class, the condition clients wait on for new frames, and the one the simulator waits on for
+        # clients when it has none
+        self.simulatorLock = TimedLock(LOCK_WAITS.labels(lock='simulator'))
+        self.newFrame = threading.Condition(self.simulatorLock)
+        self.clientsChanged = threading.Condition(self.simulatorLock)
+
+        # the latest frames produced, shared by all clients
+        self.ring = TickRing(historySize)
+
+        # the latest snapshot of the simulator
+        self.snapshot = None
+
+        # the aggregates of the subtrees of the cluster, for clients subscribed at a depth of its tree (None if the
+        # simulator does not keep them, see SubtreeAggregates), and the index of its subtrees, for clients only watching
+        # parts of it (None if the simulator does not support it, see SubtreeIndex)
+        self.aggregates = None
+        self.subtreeIndex = None
+
+        # functions called with the simulator whenever waiting clients may have something new to read (a log, or being
+        # removed), for readers that do not block on getNextLog (see addListener)
+        self.listeners = []
 
     def getNextLog(self, clientId):
         """
             Given a clientId, this method returns the next log for that client.
             Note: This method is blocking, and will only return once a log is available
+
+            A client so far behind that its next log is no longer kept gets a Resync (with the latest snapshot) instead.
+            Returns None if the client is not (or no longer) subscribed.
         """
         self.simulatorLock.acquire()
 
-        if clientId in self.clientMap:
+        cursor = self.clientMap.get(clientId)
+        if cursor is None:
+            self.simulatorLock.release()
+            return None
+
+        # wait for data (the condition releases the simulatorLock while waiting)
+        cursor.waiting += 1
+        while self.clientMap.get(clientId) is cursor and cursor.sequence >= self.ring.lastSequence:
+            self.newFrame.wait()
+        cursor.waiting -= 1
+        cursor.lastSeen = time()
+
+        if self.clientMap.get(clientId) is not cursor:
+            self.simulatorLock.release()
+            return None
+
+        if self.ring.contains(cursor.sequence + 1):
+            cursor.sequence += 1
+            log = self.ring.get(cursor.sequence)
+        else:
+            log = Resync(self.snapshot.version - cursor.sequence, self.snapshot)
+            cursor.sequence = self.snapshot.version
+            RESYNCS.labels(scenario=self.scenario).increment()
+
+        self.simulatorLock.release()
+        return log
+
+    def getNextLogs(self, clientId, maxLogs, maxWait=0):
+        """
+            Given a clientId, this method returns the list of the next logs for that client, at most 'maxLogs' of them.
+            Note: This method is blocking, and will only return once a log is available. It then waits for up to
+            'maxWait' seconds (since the call) for 'maxLogs' logs to be available.
+
+            Like getNextLog, returns a Resync if the client fell too far behind, and None if it is not subscribed.
+        """
+        deadline = time() + maxWait
+
+        self.simulatorLock.acquire()
+
+        cursor = self.clientMap.get(clientId)
+        if cursor is None:
+            self.simulatorLock.release()
+            return None
+
+        # wait for data (the condition releases the simulatorLock while waiting)
+        cursor.waiting += 1
+        while self.clientMap.get(clientId) is cursor:
+            available = self.ring.lastSequence - cursor.sequence
+            remaining = deadline - time()
+            if available >= maxLogs or (available > 0 and remaining <= 0):
+                break
+            self.newFrame.wait(remaining if available > 0 else None)
+        cursor.waiting -= 1
+        cursor.lastSeen = time()
+
+        if self.clientMap.get(clientId) is not cursor:
+            self.simulatorLock.release()
+            return None
+
+        logs = self.takeLogs(cursor, maxLogs)
+
+        self.simulatorLock.release()
+        return logs
 
-            queue = self.clientMap[clientId]
+    def pollLogs(self, clientId, maxLogs, minLogs=1):
+        """
+            Like getNextLogs, but never blocks: returns the list of the next logs for that client (at most 'maxLogs' of
+            them) if at least 'minLogs' are available, and an empty list otherwise. Readers polling clients are told
+            when to poll again by the listeners of the simulator (see addListener).
+        """
+        self.simulatorLock.acquire()
 
-            # wait for data (semaphore will release when data is available)
-            # note that we don't want to wait with the simulatorLock locked
+        cursor = self.clientMap.get(clientId)
+        if cursor is None:
             self.simulatorLock.release()
-            return queue.get()
+            return None
+        cursor.lastSeen = time()
+
+        available = self.ring.lastSequence - cursor.sequence
+        if available <= 0 or (available < minLogs and self.ring.contains(cursor.sequence + 1)):
+            self.simulatorLock.release()
+            return []
+
+        logs = self.takeLogs(cursor, maxLogs)
 
         self.simulatorLock.release()
-        return None
+        return logs
+
+    def takeLogs(self, cursor, maxLogs):
+        """
+            Moves the client's cursor past its next logs (at most 'maxLogs' of them), returning them, or a Resync if they
+            are no longer kept (the simulatorLock must be held)
+        """
+        if self.ring.contains(cursor.sequence + 1):
+            lastSequence = min(self.ring.lastSequence, cursor.sequence + maxLogs)
+            logs = [self.ring.get(sequence) for sequence in xrange(cursor.sequence + 1, lastSequence + 1)]
+            cursor.sequence = lastSequence
+        else:
+            logs = Resync(self.snapshot.version - cursor.sequence, self.snapshot)
+            cursor.sequence = self.snapshot.version
+            RESYNCS.labels(scenario=self.scenario).increment()
+        return logs
 
     def addClient(self, clientId):
         """
-            adds a client to this simulator
+            adds a client to this simulator, returning the latest snapshot of the simulator. The client will receive
+            every frame produced after that snapshot, so there is no gap between the snapshot and its first update.
         """
         self.simulatorLock.acquire()
-        self.clientMap[clientId] = Queue();
+
+        snapshot = self.snapshot
+        self.clientMap[clientId] = ClientCursor(snapshot.version)
+
+        # wake up any reader still waiting for this client on a previous connection, and the simulator if it was paused
+        self.wakeClients()
+        self.clientsChanged.notifyAll()
+
         self.simulatorLock.release()
+        return snapshot
 
-    def addLog(self, log):
+    def resumeClient(self, clientId, lastSequence):
         """
-            adds a log to this simulator
+            (re)adds a client that already has every frame up to 'lastSequence', so it receives the frames after it.
+            If those frames are no longer available, the client starts over from the latest snapshot, which is
+            returned (otherwise, returns None).
         """
         self.simulatorLock.acquire()
 
-        toRemove = []
-        for clientId in self.clientMap:
-            queue = self.clientMap[clientId]
-            queue.put(log)
+        if self.ring.contains(lastSequence + 1) or lastSequence == self.ring.lastSequence:
+            self.clientMap[clientId] = ClientCursor(lastSequence)
+            snapshot = None
+        else:
+            snapshot = self.snapshot
+            self.clientMap[clientId] = ClientCursor(snapshot.version)
 
-            if queue.qsize() > 25:
-                toRemove.append(clientId)
+        # wake up any reader still waiting for this client on a previous connection, and the simulator if it was paused
+        self.wakeClients()
+        self.clientsChanged.notifyAll()
 
         self.simulatorLock.release()
+        return snapshot
+
+    def addLog(self, log, snapshot=None):
+        """
+            adds a log to this simulator, optionally publishing a new snapshot taken right after that log
+        """
+        self.simulatorLock.acquire()
+
+        self.ring.append(log)
+        if snapshot is not None:
+            self.snapshot = snapshot
+
+        # wake up the clients waiting for this log
+        self.wakeClients()
 
-        for clientId in toRemove:
-            self.removeClient(clientId)
+        self.simulatorLock.release()
+
+    def publishSnapshot(self, snapshot):
+        """
+            publishes a new snapshot, taken right after the latest log, for clients joining from now on
+        """
+        self.simulatorLock.acquire()
+        self.snapshot = snapshot
+        self.simulatorLock.release()
+
+    def restart(self, snapshot):
+        """
+            starts the stream of logs over from the given snapshot (e.g. after jumping to another point in time): the
+            logs kept so far are dropped, and every client gets a Resync with the snapshot as its next log
+        """
+        self.simulatorLock.acquire()
+
+        self.ring = TickRing(self.ring.capacity)
+        self.snapshot = snapshot
+
+        # put every client before the first log, which is not in the ring
+        for cursor in self.clientMap.itervalues():
+            cursor.sequence = -1
+        self.wakeClients()
+
+        self.simulatorLock.release()
+
+    def addListener(self, listener):
+        """
+            adds a function to call (from the simulator thread, or the thread adding or removing clients) with this
+            simulator whenever the clients waiting on it may have something new to read. Listeners are called with the
+            simulatorLock held, so they should only hand the simulator over to the thread reading the logs.
+        """
+        self.simulatorLock.acquire()
+        self.listeners.append(listener)
+        self.simulatorLock.release()
+
+    def removeListener(self, listener):
+        """
+            removes a function added by addListener
+        """
+        self.simulatorLock.acquire()
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+        self.simulatorLock.release()
+
+    def wakeClients(self):
+        """
+            wakes up the clients waiting for logs, blocked in getNextLog(s) or told by the listeners (the simulatorLock
+            must be held)
+        """
+        self.newFrame.notifyAll()
+        for listener in self.listeners:
+            listener(self)
 
     def removeClient(self, clientId):
         """
@@ -77,10 +280,64 @@ class BaseSimulator(threading.Thread):
         self.simulatorLock.acquire()
 
         if clientId in self.clientMap:
-            self.clientMap[clientId].put(None);
             del self.clientMap[clientId]
+            self.wakeClients()
+
+        self.simulatorLock.release()
+
+    def removeIdleClients(self, maxIdle):
+        """
+            removes the clients that have not asked for logs for more than 'maxIdle' seconds (clients that went away
+            without unsubscribing)
+        """
+        self.simulatorLock.acquire()
+
+        oldest = time() - maxIdle
+        for clientId in self.clientMap.keys():
+            cursor = self.clientMap[clientId]
+            if cursor.waiting == 0 and cursor.lastSeen < oldest:
+                del self.clientMap[clientId]
+                PRUNED_CLIENTS.labels(scenario=self.scenario).increment()
+
+        self.simulatorLock.release()
+
+    def clientLags(self):
+        """
+            returns the number of logs each client has yet to read, and whether it is waiting for logs
+        """
+        self.simulatorLock.acquire()
+        lastSequence = self.ring.lastSequence
+        lags = [(lastSequence - cursor.sequence, cursor.waiting > 0) for cursor in self.clientMap.itervalues()]
+        self.simulatorLock.release()
+        return lags
+
+    def hasClient(self, clientId):
+        """
+            whether the given client is subscribed to this simulator
+        """
+        return clientId in self.clientMap
+
+    def hasClients(self):
+        """
+            whether any client is subscribed to this simulator
+        """
+        return len(self.clientMap) > 0
+
+    def waitForClients(self, timeout=None):
+        """
+            blocks until at least one client is subscribed to this simulator, or 'timeout' seconds have passed
+            (if not None). Returns whether there are clients.
+        """
+        self.simulatorLock.acquire()
+
+        if len(self.clientMap) == 0:
+            deadline = time() + timeout if timeout is not None else None
+            while len(self.clientMap) == 0 and (deadline is None or time() < deadline):
+                self.clientsChanged.wait(deadline - time() if deadline is not None else None)
 
+        hasClients = len(self.clientMap) > 0
         self.simulatorLock.release()
+        return hasClients
 
     def run(self):
         """
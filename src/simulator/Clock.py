@@ -0,0 +1,62 @@
+from datetime import datetime
+import random
+from time import sleep, time
+import numpy
+
+__author__ = 'Roman'
+
+class RealClock(object):
+    """
+        The wall clock: simulators following it produce ticks in real time
+    """
+
+    def time(self):
+        """
+            Current time, in seconds since the epoch
+        """
+        return time()
+
+    def now(self):
+        """
+            Current time, as a datetime
+        """
+        return datetime.now()
+
+    def sleep(self, seconds):
+        """
+            Waits for the given number of seconds
+        """
+        sleep(seconds)
+
+
+class VirtualClock(RealClock):
+    """
+        A simulated clock, which only moves forward when simulators sleep (without actually waiting), so a simulation
+        runs as fast as the CPU allows.
+
+        Seeding the clock also seeds the random number generators used by the simulators, so a simulation run from a
+        given seed and start time is reproducible.
+    """
+
+    def __init__(self, start=None, seed=None):
+        """
+            Creates a clock starting at 'start' (in seconds since the epoch, defaults to the current time)
+        """
+        self.current = time() if start is None else start
+
+        if seed is not None:
+            random.seed(seed)
+            numpy.random.seed(seed)
+
+    def time(self):
+        return self.current
+
+    def now(self):
+        return datetime.fromtimestamp(self.current)
+
+    def sleep(self, seconds):
+        self.current += seconds
+
+
+# The clock used by simulators unless told otherwise
+realClock = RealClock()
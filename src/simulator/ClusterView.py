@@ -0,0 +1,350 @@
+from base64 import b64encode
+from bisect import bisect_right
+from collections import OrderedDict
+from json import dumps
+import threading
+import numpy
+
+__author__ = 'Roman'
+
+# Number of selections of subtrees & nodes a SubtreeIndex keeps, the least recently used ones being dropped (filters
+# are chosen by clients, so there can be any number of them)
+MAX_SELECTIONS = 256
+
+class DepthView(object):
+    """
+        The view of the cluster of clients subscribed at a given depth of its tree, for level-of-detail rendering of
+        huge clusters: they only get the nodes down to that depth, each holding the aggregates of its whole subtree (see
+        SubtreeAggregates), and each tick only the aggregates that changed instead of the machines' state changes.
+
+        Frames and snapshots encode each view the first time one of its clients needs it, and share that encoding
+        between all of them (see TickFrame.view and Snapshot.view). The topology of a view is only encoded once per
+        version of the simulator's topology (see EncodedTopology).
+    """
+
+    def __init__(self, depth):
+        self.depth = depth
+        self.key = ('depth', depth)
+
+    def supports(self, simulator):
+        return simulator.aggregates is not None
+
+    def encodeFrame(self, frame):
+        return frame.encode({
+            'events': frame.log['cluster']['events'],
+            'stateChange': {},
+            'aggregates': frame.aggregates.records(self.depth)
+        })
+
+    def encodeState(self, snapshot):
+        return '{"cluster": %s, "mapReduce": %s}' % (dumps(snapshot.aggregates.records(self.depth)), snapshot.mapReduceState)
+
+    def encodeTopology(self, snapshot):
+        return '{"cluster": %s, "mapReduce": %s}' % (dumps(snapshot.aggregates.structure(self.depth)), snapshot.mapReduceTopology)
+
+
+class FilterView(object):
+    """
+        The view of the cluster of clients that only display part of it (e.g. a wall display watching a single rack, or
+        the view of a single machine): the subtrees of the given roots and the given nodes (along with their ancestors,
+        so they still hang from the root of the cluster), and only the log events of the given severities & facilities.
+        Empty filters let everything through.
+
+        Each tick's state changes are sorted by subtree once (see SubtreeIndex), so the changes of a view are a few
+        slices of them, and each view is encoded once for all its clients (see TickFrame.view and Snapshot.view).
+    """
+
+    def __init__(self, roots=(), nodes=(), severities=(), facilities=()):
+        self.roots = tuple(sorted(set(roots)))
+        self.nodes = tuple(sorted(set(nodes)))
+        self.severities = frozenset(severities)
+        self.facilities = frozenset(facilities)
+        self.key = ('filter', self.roots, self.nodes, tuple(sorted(self.severities)), tuple(sorted(self.facilities)))
+
+    def supports(self, simulator):
+        return simulator.subtreeIndex is not None
+
+    def includesEvent(self, event):
+        return ((not self.severities or event['severity'] in self.severities) and
+                (not self.facilities or event['facility'] in self.facilities))
+
+    def encodeFrame(self, frame):
+        return frame.encode(self.clusterUpdates(frame))
+
+    def clusterUpdates(self, frame):
+        """
+            Returns the cluster updates of the given frame for this view
+        """
+        subtreeIndex = frame.subtreeIndex
+        starts, ends = subtreeIndex.selection(self.roots, self.nodes)
+        positions, names = frame.partition()
+
+        filterEvents = self.severities or self.facilities
+        stateChange = {}
+        for start, end in zip(starts, ends):
+            for name in names[numpy.searchsorted(positions, start):numpy.searchsorted(positions, end)]:
+                nodeChange = frame.log['cluster']['stateChange'][name]
+                if filterEvents and 'events' in nodeChange:
+                    nodeChange = dict(nodeChange)
+                    nodeChange['events'] = [event for event in nodeChange['events'] if self.includesEvent(event)]
+                    if not nodeChange['events']:
+                        del nodeChange['events']
+                stateChange[name] = nodeChange
+
+        events = [event for event in frame.log['cluster']['events']
+                  if self.includesEvent(event) and subtreeIndex.contains(starts, ends, event['location'])]
+
+        return {
+            'events': events,
+            'stateChange': stateChange
+        }
+
+    def encodeState(self, snapshot):
+        subtreeIndex = snapshot.subtreeIndex
+        nodes = subtreeIndex.nodes(*subtreeIndex.selection(self.roots, self.nodes))
+
+        clusterState = snapshot.clusterState
+        names = [subtreeIndex.topology.name(index) for index in nodes.tolist()]
+        state = dict((name, clusterState[name]) for name in names if name in clusterState)
+        return '{"cluster": %s, "mapReduce": %s}' % (dumps(state), snapshot.mapReduceState)
+
+    def encodeTopology(self, snapshot):
+        subtreeIndex = snapshot.subtreeIndex
+        nodes = subtreeIndex.nodes(*subtreeIndex.selection(self.roots, self.nodes))
+        return '{"cluster": %s, "mapReduce": %s}' % (dumps(subtreeIndex.structure(nodes)), snapshot.mapReduceTopology)
+
+
+class ColumnarView(object):
+    """
+        Sends the usage statistics, health & severity probabilities changed at each tick as columns, instead of one JSON
+        object per node repeating the property names: for each metric, the ids of the nodes that changed (their index in
+        the 'nodeNames' of the snapshot) as a uint32 array, and their values as a float32 array, both base64 encoded.
+        The other changes (events, failure times) are sent as usual. Wraps the filtered view of the client, if any, in
+        which case 'nodeNames' only lists the nodes of that view (in depth-first order, see SubtreeIndex.numbering).
+    """
+
+    METRICS = ('cpuUsage', 'memoryUsage', 'contextSwitchRate', 'health')
+    SEVERITIES = ('FATAL', 'ERROR', 'WARN', 'INFO')
+
+    def __init__(self, inner=None):
+        self.inner = inner
+        self.key = ('columnar', inner.key if inner is not None else None)
+
+    def supports(self, simulator):
+        return simulator.subtreeIndex is not None and (self.inner is None or self.inner.supports(simulator))
+
+    def encodeFrame(self, frame):
+        subtreeIndex = frame.subtreeIndex
+        if self.inner is None:
+            cluster, nodeId = frame.log['cluster'], subtreeIndex.topology.index
+        else:
+            cluster = self.inner.clusterUpdates(frame)
+            nodeId = subtreeIndex.numbering(*subtreeIndex.selection(self.inner.roots, self.inner.nodes))
+        stateChange, columns = self.columns(cluster['stateChange'], nodeId)
+        return frame.encode({
+            'events': cluster['events'],
+            'stateChange': stateChange,
+            'columns': columns
+        })
+
+    def encodeState(self, snapshot):
+        subtreeIndex = snapshot.subtreeIndex
+        if self.inner is None:
+            return '%s, "nodeNames": %s}' % (snapshot.state[:-1], dumps(subtreeIndex.names))
+
+        nodes = subtreeIndex.nodes(*subtreeIndex.selection(self.inner.roots, self.inner.nodes))
+        names = [subtreeIndex.topology.name(index) for index in nodes.tolist()]
+        return '%s, "nodeNames": %s}' % (snapshot.view(self.inner)[0][:-1], dumps(names))
+
+    def encodeTopology(self, snapshot):
+        return snapshot.view(self.inner)[1] if self.inner is not None else snapshot.topology
+
+    def columns(self, stateChange, nodeId):
+        """
+            Splits a state change into the columns of the metrics changed, and the rest of the changes, given the
+            function giving the id of a node from its name (None for nodes without one)
+        """
+        ids = dict((metric, []) for metric in self.METRICS + self.SEVERITIES)
+        values = dict((metric, []) for metric in self.METRICS + self.SEVERITIES)
+
+        rest = {}
+        for name, nodeChange in stateChange.iteritems():
+            node = nodeId(name)
+            if node is None:
+                rest[name] = nodeChange
+                continue
+
+            otherChanges = {}
+            for entryName, value in nodeChange.iteritems():
+                if entryName in ids:
+                    ids[entryName].append(node)
+                    values[entryName].append(value)
+                elif entryName == 'predictedSeverityProbabilities':
+                    for severity, probability in value.iteritems():
+                        ids[severity].append(node)
+                        values[severity].append(probability)
+                else:
+                    otherChanges[entryName] = value
+            if otherChanges:
+                rest[name] = otherChanges
+
+        columns = {}
+        for metric, metricIds in ids.iteritems():
+            if metricIds:
+                columns[metric] = {
+                    'nodes': b64encode(numpy.array(metricIds, dtype='<u4').tostring()),
+                    'values': b64encode(numpy.array(values[metric], dtype='<f4').tostring())
+                }
+        return rest, columns
+
+
+class SubtreeIndex(object):
+    """
+        The nodes of a cluster numbered in depth-first order, where the subtree of every node is a contiguous range of
+        positions. The state changes of a tick are sorted by position once (see partition), and the changes of any set
+        of subtrees are then a few slices of them.
+    """
+
+    def __init__(self, topology):
+        """
+            Numbers the nodes of the given CompactTopology
+        """
+        self.topology = topology
+        self.names = [topology.name(index) for index in xrange(len(topology))]
+        self.positions, self.sizes = topology.preorder()
+
+        # the node at each position
+        self.order = numpy.argsort(self.positions)
+
+        # map from the (known) roots & nodes of a filter to the ranges of positions it selects, least recently used
+        # first (see selection)
+        self.selections = OrderedDict()
+        self.selectionLock = threading.Lock()
+
+    def position(self, name):
+        """
+            Returns the position of the named node, or -1 if there is no such node
+        """
+        index = self.topology.index(name)
+        return int(self.positions[index]) if index is not None else -1
+
+    def partition(self, stateChange):
+        """
+            Returns the positions of the nodes changed by a state change, sorted, and the names of the nodes at those
+            positions
+        """
+        names = stateChange.keys()
+        positions = numpy.array([self.position(name) for name in names], dtype=numpy.int64)
+        order = numpy.argsort(positions)
+        return positions[order], [names[index] for index in order.tolist()]
+
+    def selection(self, roots, nodes):
+        """
+            Returns the ranges of positions holding the subtrees of the given roots, the given nodes, and all their
+            ancestors, as the sorted lists of the starts & ends of the ranges (the whole cluster if there are neither
+            roots nor nodes). Unknown nodes are left out, the root of the cluster is always in.
+        """
+        wholeCluster = not roots and not nodes
+        known = self.topology.index
+        roots = tuple(name for name in roots if known(name) is not None)
+        nodes = tuple(name for name in nodes if known(name) is not None)
+        key = (wholeCluster, roots, nodes)
+
+        self.selectionLock.acquire()
+        selection = self.selections.pop(key, None)
+        if selection is not None:
+            self.selections[key] = selection
+        self.selectionLock.release()
+        if selection is not None:
+            return selection
+
+        ranges = [(0, 1)]
+        if wholeCluster:
+            ranges.append((0, len(self.positions)))
+
+        parents = self.topology.parents
+        for names, subtree in ((roots, True), (nodes, False)):
+            for name in names:
+                index = self.topology.index(name)
+                position = int(self.positions[index])
+                ranges.append((position, position + (int(self.sizes[index]) if subtree else 1)))
+
+                index = int(parents[index])
+                while index >= 0:
+                    position = int(self.positions[index])
+                    ranges.append((position, position + 1))
+                    index = int(parents[index])
+
+        # merge the overlapping & adjacent ranges
+        starts, ends = [], []
+        for start, end in sorted(ranges):
+            if ends and start <= ends[-1]:
+                ends[-1] = max(ends[-1], end)
+            else:
+                starts.append(start)
+                ends.append(end)
+
+        selection = starts, ends
+        self.selectionLock.acquire()
+        self.selections[key] = selection
+        if len(self.selections) > MAX_SELECTIONS:
+            self.selections.popitem(last=False)
+        self.selectionLock.release()
+        return selection
+
+    def contains(self, starts, ends, name):
+        """
+            Whether the named node is in the given ranges of positions
+        """
+        position = self.position(name)
+        found = bisect_right(starts, position) - 1
+        return found >= 0 and position < ends[found]
+
+    def numbering(self, starts, ends):
+        """
+            Returns the function giving the index of the named node among the nodes in the given ranges of positions,
+            in the order returned by nodes (None if it is not in them)
+        """
+        offsets = [0]
+        for start, end in zip(starts, ends):
+            offsets.append(offsets[-1] + end - start)
+
+        def number(name):
+            position = self.position(name)
+            found = bisect_right(starts, position) - 1
+            if position < 0 or found < 0 or position >= ends[found]:
+                return None
+            return offsets[found] + position - starts[found]
+        return number
+
+    def nodes(self, starts, ends):
+        """
+            Returns the nodes in the given ranges of positions, in depth-first order
+        """
+        if not starts:
+            return numpy.zeros(0, dtype=numpy.int64)
+        return self.order[numpy.concatenate([numpy.arange(start, end) for start, end in zip(starts, ends)])]
+
+    def structure(self, nodes):
+        """
+            Builds the nested structure of the given nodes (in depth-first order, including all their ancestors). Nodes
+            without any of their children in it are leaves.
+        """
+        names = self.topology.name
+        root = None
+
+        # the nodes the next one may be a child of, with the position right after their subtree
+        stack = []
+        for index in nodes.tolist():
+            position = int(self.positions[index])
+            while stack and position >= stack[-1][1]:
+                stack.pop()
+
+            node = {'name': names(index)}
+            if stack:
+                stack[-1][0].setdefault('children', []).append(node)
+            else:
+                root = node
+            stack.append((node, position + int(self.sizes[index])))
+
+        return root
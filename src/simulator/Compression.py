@@ -0,0 +1,106 @@
+import struct
+import time
+import zlib
+
+__author__ = 'Roman'
+
+# Content codings clients may accept, in order of preference
+ENCODINGS = ('gzip', 'deflate')
+
+def negotiateEncoding(acceptEncoding):
+    """
+        Picks the content coding of a response from the Accept-Encoding header of the request (None for no compression)
+    """
+    accepted = {}
+    for coding in (acceptEncoding or '').split(','):
+        parts = coding.strip().split(';')
+        quality = 1.0
+        for parameter in parts[1:]:
+            name, _, value = parameter.strip().partition('=')
+            if name == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[parts[0].strip().lower()] = quality
+
+    for encoding in ENCODINGS:
+        if accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return None
+
+def compressChunk(text):
+    """
+        Compresses a piece of a response on its own, as deflate blocks that can be followed by the blocks of any other
+        piece (the compressor is flushed to a byte boundary, and never refers back to other pieces)
+    """
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(text) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+def cachedChunk(chunks, key, text):
+    """
+        Returns the compressed piece of a response kept in the given cache under the given key, compressing it the first
+        time it is needed. Frames & snapshots keep the compressed pieces of their responses, so each is compressed once
+        whatever the number of clients it is sent to.
+    """
+    chunk = chunks.get(key)
+    if chunk is None:
+        chunk = chunks[key] = compressChunk(text)
+    return chunk
+
+
+class CompressedStream(object):
+    """
+        Builds a gzip or deflate (zlib) encoded response out of pieces compressed on their own (see compressChunk): only
+        the checksum of the whole response is computed per response, the pieces shared by several responses are only
+        compressed once (see cachedChunk)
+    """
+
+    # the final (empty) deflate block
+    END = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS).flush(zlib.Z_FINISH)
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        self.checksum = zlib.crc32('') if encoding == 'gzip' else zlib.adler32('')
+        self.size = 0
+
+    def header(self):
+        if self.encoding == 'gzip':
+            return '\x1f\x8b\x08\x00' + struct.pack('<I', int(time.time())) + '\x00\xff'
+        return '\x78\x9c'
+
+    def write(self, piece):
+        """
+            Returns the compressed piece, given as its text, or as the text and the cache & key of its compressed chunk
+        """
+        if isinstance(piece, tuple):
+            text, chunks, key = piece
+            chunk = cachedChunk(chunks, key, text)
+        else:
+            text, chunk = piece, compressChunk(piece)
+
+        if self.encoding == 'gzip':
+            self.checksum = zlib.crc32(text, self.checksum)
+        else:
+            self.checksum = zlib.adler32(text, self.checksum)
+        self.size += len(text)
+        return chunk
+
+    def end(self):
+        if self.encoding == 'gzip':
+            return self.END + struct.pack('<II', self.checksum & 0xffffffff, self.size & 0xffffffff)
+        return self.END + struct.pack('>I', self.checksum & 0xffffffff)
+
+
+def compressPieces(pieces, encoding):
+    """
+        Returns the response made of the given pieces (see CompressedStream.write), in the given content coding
+    """
+    stream = CompressedStream(encoding)
+    return stream.header() + ''.join(stream.write(piece) for piece in pieces) + stream.end()
+
+def joinPieces(pieces):
+    """
+        Returns the uncompressed response made of the given pieces
+    """
+    return ''.join(piece[0] if isinstance(piece, tuple) else piece for piece in pieces)
@@ -1,51 +1,194 @@
-from json import load
+from json import dumps, load
 import os
 from random import random
-from time import sleep
+from time import time
+from src.LargeTopology import CompactTopology
 from src.simulator.RandomSimulator import RandomSimulator
 from src.simulator.BaseSimulator import BaseSimulator
+from src.simulator.ClusterView import SubtreeIndex
+from src.simulator.Clock import realClock
+from src.simulator.Instrumentation import SIZE_BUCKETS, instruments
+from src.simulator.MetricsHistory import MetricsHistory
+from src.simulator.Snapshot import EncodedTopology, Snapshot
+from src.simulator.SubtreeAggregates import SubtreeAggregates
+from src.simulator.TickFrame import TickFrame
 from src.simulator.mapReduce.MapReduceSimulator import MapReduceSimulator
 
 __author__ = 'Roman'
 
+TICK_PHASES = instruments.histogram('theius_tick_phase_seconds', 'Time spent in each phase of a simulator tick',
+                                    ('scenario', 'phase'))
+FRAME_BYTES = instruments.histogram('theius_frame_bytes', 'Size of the encoded frame of each tick', ('scenario',),
+                                    SIZE_BUCKETS)
+
 class DefaultSimulator(BaseSimulator):
-    def __init__(self, clusterSimulator, clusterTopology, mapReduceSimulator):
+
+    # Number of levels of a compact cluster topology sent to clients when they join
+    EXPANDED_LEVELS = 1
+
+    def __init__(self, clusterSimulator, clusterTopology, mapReduceSimulator, snapshotInterval=1, clock=realClock,
+                 historyCapacities=None):
         """
           Initialize the simulator
+
+            snapshotInterval:   number of ticks between snapshots (clients joining in between also receive the frames
+                                produced since the latest snapshot)
+            clock:              the clock to wait on between ticks, shared with the cluster & map reduce simulators
+            historyCapacities:  number of samples of the cluster's metrics kept at each resolution (see MetricsHistory)
         """
 
-        BaseSimulator.__init__(self)
+        # keep enough frames for clients to catch up from the previous snapshot
+        BaseSimulator.__init__(self, max(50, 2 * snapshotInterval))
 
         self.clusterSimulator = clusterSimulator
         self.clusterTopology = clusterTopology
         self.mapReduceSimulator = mapReduceSimulator
+        self.clock = clock
+
+        # the history of the metrics of the cluster's nodes (which do not change)
+        self.metricsHistory = MetricsHistory(clusterSimulator.metricNodes(), historyCapacities)
+
+        # the aggregates of every subtree of the cluster, for clients subscribed at a depth of its tree, and the index
+        # of its subtrees, for clients only watching parts of it
+        compactTopology = self.compactTopology()
+        self.subtreeIndex = SubtreeIndex(compactTopology)
+        self.aggregates = SubtreeAggregates(compactTopology, clusterSimulator.metricNodes(),
+                                            clusterSimulator.metricColumns(),
+                                            clusterSimulator.predictedFailureTimes(clusterSimulator.metricNodes()),
+                                            clusterSimulator.timeFormatter.format, clusterSimulator.precision)
+
+        # sequence number of the last tick produced
+        self.sequence = 0
+
+        # the topology encoded for the latest snapshot (see encodedTopology)
+        self.encodedTopologyCache = None
+
+        self.snapshotInterval = snapshotInterval
+        self.snapshot = self.takeSnapshot()
+
+        # seconds without any client after which onIdle(simulator) is called (None to pause forever), stopping the
+        # simulator thread if it returns True, and seconds without asking for updates after which a client is dropped
+        self.idleTimeout = None
+        self.onIdle = None
+        self.clientTimeout = 60
+
+        # appends every tick to a recording, while recording (see record)
+        self.recorder = None
 
     def tick(self):
         """
             How long to wait in between ticks
         """
-        sleep(2 * random())
+        self.clock.sleep(2 * random())
 
     def run(self):
         """
           Runs the simulator thread, at each tick updating all subscribed clients
         """
 
+        lastPruned = time()
         while True:
 
+            # Pause while nobody is watching, and give up the thread if nobody comes back for idleTimeout seconds
+            if not self.waitForClients(self.idleTimeout):
+                if self.onIdle is not None and self.onIdle(self):
+                    self.stopRecording()
+                    return
+                continue
+
             # Insert some random delay between 0 and 2 second
             self.tick()
 
-            clusterUpdates = self.clusterSimulator.updates()
-            mapReduceUpdates = self.mapReduceSimulator.updates()
+            self.step()
+
+            # Drop the clients that went away without unsubscribing, so the simulator can pause
+            if time() - lastPruned > self.clientTimeout:
+                self.removeIdleClients(self.clientTimeout)
+                lastPruned = time()
+
+    def step(self):
+        """
+          Produces the next tick, publishing it to all subscribed clients, and returns its frame
+        """
+
+        tickStarted = started = time()
+        clusterUpdates = self.clusterSimulator.updates()
+        started = self.timePhase('cluster', started)
+
+        columns = self.clusterSimulator.metricColumns()
+        self.metricsHistory.record(self.clock.time(), columns)
+        started = self.timePhase('history', started)
 
-            log = {
-                'cluster': clusterUpdates,
-                'mapReduce': mapReduceUpdates
-            }
+        locations = [event['location'] for event in clusterUpdates['events']]
+        aggregates = self.aggregates.update(columns, clusterUpdates['events'],
+                                            self.clusterSimulator.predictedFailureTimes(locations))
+        started = self.timePhase('aggregates', started)
 
-            # Add to the global list of logs
-            self.addLog(log)
+        mapReduceUpdates = self.mapReduceSimulator.updates()
+        started = self.timePhase('mapReduce', started)
+
+        log = {
+            'cluster': clusterUpdates,
+            'mapReduce': mapReduceUpdates
+        }
+
+        # Encode this tick once, and share the encoded frame between all clients
+        self.sequence += 1
+        frame = TickFrame(log, self.getTime(), self.sequence, aggregates=aggregates, subtreeIndex=self.subtreeIndex)
+        started = self.timePhase('encode', started)
+        FRAME_BYTES.labels(scenario=self.scenario).observe(len(frame.encoded))
+
+        # Periodically publish a snapshot for clients joining, taken here so it is consistent with the frames (and
+        # also record it as a keyframe, if one is due)
+        snapshot = None
+        keyframe = self.recorder is not None and self.recorder.needsKeyframe(self.sequence)
+        if self.sequence % self.snapshotInterval == 0 or keyframe:
+            snapshot = self.takeSnapshot()
+            started = self.timePhase('snapshot', started)
+
+        if self.recorder is not None:
+            self.recorder.addFrame(frame, self.clock.time())
+            if keyframe:
+                self.recorder.addKeyframe(snapshot, self.clock.time())
+            started = self.timePhase('record', started)
+
+        self.addLog(frame, snapshot)
+        self.timePhase('publish', started)
+        self.timePhase('tick', tickStarted)
+        return frame
+
+    def timePhase(self, phase, started):
+        """
+            Observes the time since 'started' as the duration of the given phase of the tick, and returns the time now
+        """
+        now = time()
+        TICK_PHASES.labels(scenario=self.scenario, phase=phase).observe(now - started)
+        return now
+
+    def record(self, recorder):
+        """
+            Starts appending every tick to the given Recorder, starting with a keyframe of the current state (must be
+            called from the simulator thread, or before it is started)
+        """
+        snapshot = self.snapshot if self.snapshot.version == self.sequence else self.takeSnapshot()
+        recorder.addKeyframe(snapshot, self.clock.time())
+        self.recorder = recorder
+
+    def stopRecording(self):
+        """
+            Stops recording, closing the recording
+        """
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+
+    def takeSnapshot(self):
+        """
+            Encodes the current state & topology of the simulator (must be called from the simulator thread, or before
+            it is started)
+        """
+        return Snapshot(self.sequence, self.getTime(), self.state(), self.encodedTopology(), self.aggregates.snapshot(),
+                        self.subtreeIndex)
 
     def getClusterSimulator(self):
         return self.clusterSimulator
@@ -55,19 +198,150 @@ class DefaultSimulator(BaseSimulator):
 
     def topology(self):
         return {
-            'cluster': self.clusterTopology,
+            'cluster': self.clusterStructure(),
             'mapReduce': self.mapReduceSimulator.topology()
         }
 
+    def encodedTopology(self):
+        """
+            Returns the current topology, encoded once per version (the cluster structure never changes, the map reduce
+            one changes as jobs start & end, see MapReduceSimulator.topologyVersion)
+        """
+        version = self.mapReduceSimulator.topologyVersion
+        encoded = self.encodedTopologyCache
+        if encoded is None or encoded.version != version:
+            cluster = encoded.cluster if encoded is not None else dumps(self.clusterStructure())
+            encoded = self.encodedTopologyCache = EncodedTopology(version, cluster, dumps(self.mapReduceSimulator.topology()))
+        return encoded
+
     def state(self):
         return {
             'cluster': self.clusterSimulator.state(),
             'mapReduce': self.mapReduceSimulator.state()
         }
 
+    def clusterStructure(self):
+        """
+            The nested structure of the cluster sent to clients. For compact topologies, only the top of the tree is
+            included, the rest is fetched with subtree as clients expand it.
+        """
+        if isinstance(self.clusterTopology, CompactTopology):
+            return self.clusterTopology.subtree(0, self.EXPANDED_LEVELS)
+        return self.clusterTopology
+
+    def compactTopology(self):
+        """
+            The cluster topology as a CompactTopology (numbering the nodes of nested topologies)
+        """
+        if isinstance(self.clusterTopology, CompactTopology):
+            return self.clusterTopology
+        return CompactTopology.fromStructure(self.clusterTopology)
+
+    def subtree(self, name, depth=1):
+        """
+            Returns the structure of the named node of the cluster, with its descendants up to 'depth' levels below it,
+            or None if there is no such node
+        """
+        if isinstance(self.clusterTopology, CompactTopology):
+            index = self.clusterTopology.index(name)
+            return self.clusterTopology.subtree(index, depth) if index is not None else None
+
+        nodes = [self.clusterTopology]
+        while nodes:
+            node = nodes.pop()
+            if node['name'] == name:
+                return node
+            nodes.extend(node.get('children') or node.get('_children') or [])
+        return None
+
+    def descendants(self, name):
+        """
+            Returns the names of the named node of the cluster and of all its descendants, or None if there is no such
+            node
+        """
+        if isinstance(self.clusterTopology, CompactTopology):
+            index = self.clusterTopology.index(name)
+            if index is None:
+                return None
+            prefix = self.clusterTopology.prefix
+            return [prefix + str(descendant) for descendant in self.clusterTopology.descendants(index).tolist()]
+
+        root = self.subtree(name)
+        if root is None:
+            return None
+
+        names = []
+        nodes = [root]
+        while nodes:
+            node = nodes.pop()
+            names.append(node['name'])
+            nodes.extend(node.get('children') or node.get('_children') or [])
+        return names
+
+    def metricsSeries(self, node=None, metrics=None, start=None, end=None, resolution=None):
+        """
+            Returns the history of the metrics of the named node of the cluster (of the whole cluster by default), with
+            its descendants, between the given clock times (defaults to the last hour), see MetricsHistory.series.
+            The resolution is picked to fit the time range unless one is given.
+
+            Returns the resolution, the sample times and the series, or None if there is no such node.
+        """
+        names = self.descendants(node) if node is not None else self.metricsHistory.nodeNames
+        if names is None:
+            return None
+
+        end = end if end is not None else self.clock.time()
+        start = start if start is not None else end - 3600
+        if resolution is None:
+            resolution = self.metricsHistory.chooseResolution(start, end)
+
+        times, series = self.metricsHistory.series(self.metricsHistory.rows(names), start, end, resolution, metrics)
+        return resolution, times, series
+
+    def metricsAt(self, timestamp, node=None, metrics=None):
+        """
+            Returns the metrics of the named node of the cluster (of the whole cluster by default) and its descendants
+            at the given clock time, as the time of the sample and a map from node name to its metrics (in the format
+            of the cluster state), or None if there is no such node or the history does not go back that far
+        """
+        names = self.descendants(node) if node is not None else self.metricsHistory.nodeNames
+        if names is None:
+            return None
+
+        rows = self.metricsHistory.rows(names)
+        sampleTime, values = self.metricsHistory.at(timestamp, rows, metrics)
+        if sampleTime is None:
+            return None
+
+        nodeNames = self.metricsHistory.nodeNames
+        nodes = dict((nodeNames[row], {}) for row in rows.tolist())
+        for metric, metricValues in values.iteritems():
+            for row, value in zip(rows.tolist(), metricValues):
+                node = nodes[nodeNames[row]]
+                if metric in MetricsHistory.SEVERITIES:
+                    node.setdefault('predictedSeverityProbabilities', {})[metric] = value
+                else:
+                    node[metric] = value
+        return sampleTime, nodes
+
+    def atRisk(self, ranking='predictedFailureTime', k=20):
+        """
+            Returns the k most at risk nodes of the cluster, see RandomSimulator.atRisk
+        """
+        return self.clusterSimulator.atRisk(ranking, k)
+
+    def queryEvents(self, node=None, severity=None, start=None, end=None, before=None, limit=100):
+        """
+            Pages through the cluster's log events, see EventStore.query
+        """
+        return self.clusterSimulator.eventStore.query(node, severity, start, end, before, limit)
+
     def getTime(self):
         return self.mapReduceSimulator.getTime()
 
+    def getSequence(self):
+        return self.sequence
+
 def main():
     STATIC_DIR = os.path.join(os.path.abspath('../../'), 'static')
     networkTopology = load(open(os.path.join(STATIC_DIR, 'data/topology.json')))
@@ -79,7 +353,7 @@ def main():
     mainSimulator.addClient(1)
 
     while True:
-        stuff = mainSimulator.getNextLog(1)
+        frame = mainSimulator.getNextLog(1)
         print mainSimulator.state()['mapReduce']
         print mainSimulator.topology()['mapReduce']
 
@@ -0,0 +1,97 @@
+import string
+import numpy
+
+__author__ = 'Roman'
+
+class EventGenerator(object):
+    """
+        Draws the random log events of a tick in one batch: locations, severities and facilities are drawn with numpy
+        from weighted categorical distributions, and messages are slices of a pre-generated pool of random letters.
+
+        Machines can be put in groups (see RandomSimulator.eventGroups), each of which logs events 'weight' times as
+        often as the other machines, with its own relative weights of severities & facilities (missing ones weigh 1).
+    """
+
+    # Messages are between 0 and MAX_MESSAGE_LENGTH - 1 letters long
+    MAX_MESSAGE_LENGTH = 50
+
+    # Number of random letters messages are sliced from
+    POOL_SIZE = 1 << 16
+
+    # The random letters, shared by all generators (generated on first use)
+    pool = None
+
+    def __init__(self, machineNames, severities, facilities, groups=()):
+        """
+            Builds the distributions of events over the given machines, severities & facilities
+        """
+
+        self.machineNames = list(machineNames)
+        self.severities = list(severities)
+        self.facilities = list(facilities)
+
+        # index of the group of each machine (0 for ungrouped machines) and cumulative machine weights
+        self.machineGroups = numpy.zeros(len(self.machineNames), dtype=numpy.int32)
+        machineWeights = numpy.ones(len(self.machineNames))
+
+        # cumulative severity & facility weights of each group, starting with the ungrouped machines
+        self.severityWeights = [numpy.cumsum(numpy.ones(len(self.severities)))]
+        self.facilityWeights = [numpy.cumsum(numpy.ones(len(self.facilities)))]
+
+        if groups:
+            positions = dict((name, position) for position, name in enumerate(self.machineNames))
+            for groupId, group in enumerate(groups, 1):
+                members = [positions[name] for name in group['machines'] if name in positions]
+                self.machineGroups[members] = groupId
+                machineWeights[members] = group.get('weight', 1)
+                self.severityWeights.append(self.cumulativeWeights(self.severities, group.get('severities', {})))
+                self.facilityWeights.append(self.cumulativeWeights(self.facilities, group.get('facilities', {})))
+
+        self.machineWeights = numpy.cumsum(machineWeights)
+
+        if EventGenerator.pool is None:
+            letters = numpy.array(list(string.ascii_letters))
+            EventGenerator.pool = ''.join(letters[numpy.random.randint(0, len(letters), self.POOL_SIZE + self.MAX_MESSAGE_LENGTH)])
+
+    def cumulativeWeights(self, values, weights):
+        return numpy.cumsum([weights.get(value, 1) for value in values])
+
+    def draw(self, cumulativeWeights, count):
+        """
+            Draws 'count' indices from the categorical distribution with the given cumulative weights
+        """
+        return numpy.searchsorted(cumulativeWeights, numpy.random.random(count) * cumulativeWeights[-1], side='right')
+
+    def generate(self, count, timestamp):
+        """
+            Returns 'count' random log events, all with the given timestamp
+        """
+        if count <= 0 or len(self.machineNames) == 0:
+            return []
+
+        machines = self.draw(self.machineWeights, count)
+        groups = self.machineGroups[machines]
+
+        severities = numpy.empty(count, dtype=numpy.int32)
+        facilities = numpy.empty(count, dtype=numpy.int32)
+        for groupId in xrange(len(self.severityWeights)):
+            inGroup = groups == groupId
+            groupCount = int(inGroup.sum())
+            if groupCount:
+                severities[inGroup] = self.draw(self.severityWeights[groupId], groupCount)
+                facilities[inGroup] = self.draw(self.facilityWeights[groupId], groupCount)
+
+        starts = numpy.random.randint(0, self.POOL_SIZE, count).tolist()
+        lengths = numpy.random.randint(0, self.MAX_MESSAGE_LENGTH, count).tolist()
+
+        pool = self.pool
+        machineNames = self.machineNames
+        severityNames = self.severities
+        facilityNames = self.facilities
+        return [{
+            'message': pool[start:start + length],
+            'severity': severityNames[severity],
+            'facility': facilityNames[facility],
+            'location': machineNames[machine],
+            'timestamp': timestamp
+        } for machine, severity, facility, start, length in zip(machines.tolist(), severities.tolist(), facilities.tolist(), starts, lengths)]
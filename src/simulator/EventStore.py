@@ -0,0 +1,119 @@
+from bisect import bisect_left, bisect_right
+import threading
+
+__author__ = 'jon'
+
+class EventStore(object):
+    """
+        Append-only store of every log event produced by a simulator, indexed by node and severity so older events can
+        be paged through without keeping them in the (bounded) per-node event history.
+
+        Events are identified by their position in the store. Once the store holds more than 'capacity' events, the
+        oldest ones are discarded.
+    """
+
+    # Bytes the events of a store may take, by default
+    MEMORY_BUDGET = 64 * 1024 * 1024
+
+    # Bytes each event takes: its dict, its time, and its entries in the three indexes
+    EVENT_SIZE = 520
+
+    def __init__(self, capacity=None):
+        """
+            Creates an empty store, holding at most 'capacity' events (by default, as many as fit in MEMORY_BUDGET)
+        """
+
+        self.capacity = capacity if capacity is not None else self.MEMORY_BUDGET // self.EVENT_SIZE
+
+        # id of the oldest event still held, the events and the time at which each of them was stored
+        self.firstId = 0
+        self.events = []
+        self.times = []
+
+        # map from index key (node name, severity or both) to the ids and times of the matching events
+        self.indexes = {}
+
+        # the simulator thread appends while server threads query
+        self.lock = threading.Lock()
+
+    def append(self, events, time):
+        """
+            Adds events, all produced at the given time (in seconds since the epoch)
+        """
+        self.lock.acquire()
+
+        for event in events:
+            eventId = self.firstId + len(self.events)
+            self.events.append(event)
+            self.times.append(time)
+
+            for key in (('location', event['location']), ('severity', event['severity']),
+                        ('both', event['location'], event['severity'])):
+                ids, times = self.indexes.setdefault(key, ([], []))
+                ids.append(eventId)
+                times.append(time)
+
+        # discard the oldest events in batches, so trimming cost is amortized
+        if len(self.events) > self.capacity + self.capacity // 4:
+            self.trim()
+
+        self.lock.release()
+
+    def trim(self):
+        """
+            Discards the oldest events, down to the capacity of the store (called with the lock held)
+        """
+        toDiscard = len(self.events) - self.capacity
+        self.firstId += toDiscard
+        del self.events[:toDiscard]
+        del self.times[:toDiscard]
+
+        for key in self.indexes.keys():
+            ids, times = self.indexes[key]
+            stale = bisect_left(ids, self.firstId)
+            del ids[:stale]
+            del times[:stale]
+            if len(ids) == 0:
+                del self.indexes[key]
+
+    def query(self, node=None, severity=None, start=None, end=None, before=None, limit=100):
+        """
+            Returns a page of at most 'limit' events (newest first), optionally only those of a node and/or severity,
+            stored between 'start' and 'end' (in seconds since the epoch), and older than the event id 'before'.
+
+            Returns the events, and the cursor to pass as 'before' to get the next (older) page, or None if there are
+            no more events.
+        """
+        self.lock.acquire()
+
+        if node is not None and severity is not None:
+            ids, times = self.indexes.get(('both', node, severity), ([], []))
+        elif node is not None:
+            ids, times = self.indexes.get(('location', node), ([], []))
+        elif severity is not None:
+            ids, times = self.indexes.get(('severity', severity), ([], []))
+        else:
+            ids, times = None, self.times
+
+        # find the range of matching positions by time, then by cursor
+        low = 0 if start is None else bisect_left(times, start)
+        high = len(times) if end is None else bisect_right(times, end)
+        if before is not None:
+            if ids is None:
+                high = min(high, max(before - self.firstId, 0))
+            else:
+                high = min(high, bisect_left(ids, before))
+
+        positions = xrange(high - 1, max(low, high - limit) - 1, -1)
+        if ids is None:
+            page = [self.events[position] for position in positions]
+            cursor = self.firstId + high - len(page)
+        else:
+            page = [self.events[ids[position] - self.firstId] for position in positions]
+            cursor = ids[high - len(page)] if len(page) > 0 else None
+
+        hasMore = high - len(page) > low
+
+        self.lock.release()
+
+        return page, (cursor if hasMore else None)
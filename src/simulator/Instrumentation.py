@@ -0,0 +1,237 @@
+from bisect import bisect_left
+import threading
+from time import time
+
+__author__ = 'Roman'
+
+# Upper bounds of the buckets of latency histograms, in seconds
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Upper bounds of the buckets of size histograms, in bytes
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+class Instrumentation(object):
+    """
+        The operational metrics of the server: counters, gauges and histograms, each a family of metrics told apart by
+        the values of their labels (e.g. the scenario of a simulator). Updating a metric takes a dictionary lookup
+        and a short lock, so they are cheap enough to stay on in the hot paths of the simulators & endpoints.
+
+        Exposed in the Prometheus text format (see text), and as JSON (see json).
+    """
+
+    def __init__(self):
+        # the metric families, in the order they were defined
+        self.families = []
+        self.familyMap = {}
+        self.instrumentationLock = threading.Lock()
+
+    def counter(self, name, help, labelNames=()):
+        return self.family(name, help, 'counter', labelNames)
+
+    def gauge(self, name, help, labelNames=()):
+        return self.family(name, help, 'gauge', labelNames)
+
+    def histogram(self, name, help, labelNames=(), buckets=LATENCY_BUCKETS):
+        return self.family(name, help, 'histogram', labelNames, buckets)
+
+    def family(self, name, help, kind, labelNames, buckets=None):
+        """
+            Returns the metric family with the given name, defining it if it is not defined yet
+        """
+        self.instrumentationLock.acquire()
+        family = self.familyMap.get(name)
+        if family is None:
+            family = self.familyMap[name] = MetricFamily(name, help, kind, tuple(labelNames), buckets)
+            self.families.append(family)
+        self.instrumentationLock.release()
+        return family
+
+    def text(self):
+        """
+            Returns all the metrics in the Prometheus text exposition format
+        """
+        lines = []
+        for family in self.families:
+            lines.append('# HELP %s %s' % (family.name, family.help))
+            lines.append('# TYPE %s %s' % (family.name, family.kind))
+            for labels, metric in family.metrics():
+                if family.kind == 'histogram':
+                    counts, total, count = metric.read()
+                    for bound, cumulative in zip(family.buckets + ('+Inf',), cumulativeCounts(counts)):
+                        lines.append('%s_bucket%s %d' % (family.name, formatLabels(labels + (('le', str(bound)),)), cumulative))
+                    lines.append('%s_sum%s %r' % (family.name, formatLabels(labels), total))
+                    lines.append('%s_count%s %d' % (family.name, formatLabels(labels), count))
+                else:
+                    lines.append('%s%s %r' % (family.name, formatLabels(labels), metric.value))
+        return '\n'.join(lines) + '\n'
+
+    def json(self):
+        """
+            Returns all the metrics, as a map from metric name to its type, help and the list of its metrics (their
+            labels, and their value, or the buckets, sum & count of histograms). The buckets of histograms are
+            cumulative, as in the text format: the number of values up to each bound.
+        """
+        result = {}
+        for family in self.families:
+            metrics = []
+            for labels, metric in family.metrics():
+                entry = {'labels': dict(labels)}
+                if family.kind == 'histogram':
+                    counts, total, count = metric.read()
+                    entry['buckets'] = [[bound, cumulative] for bound, cumulative in
+                                        zip(family.buckets + ('+Inf',), cumulativeCounts(counts))]
+                    entry['sum'] = total
+                    entry['count'] = count
+                else:
+                    entry['value'] = metric.value
+                metrics.append(entry)
+            result[family.name] = {'type': family.kind, 'help': family.help, 'metrics': metrics}
+        return result
+
+
+class MetricFamily(object):
+    """
+        The metrics of a given name, one for each combination of the values of its labels
+    """
+
+    def __init__(self, name, help, kind, labelNames, buckets):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labelNames = labelNames
+        self.buckets = tuple(buckets) if buckets is not None else None
+
+        # map from the values of the labels to their metric
+        self.children = {}
+        self.familyLock = threading.Lock()
+
+    def labels(self, **labels):
+        """
+            Returns the metric for the given values of the labels, creating it the first time
+        """
+        values = tuple(str(labels[name]) for name in self.labelNames)
+        metric = self.children.get(values)
+        if metric is None:
+            self.familyLock.acquire()
+            metric = self.children.get(values)
+            if metric is None:
+                metric = self.children[values] = Histogram(self.buckets) if self.kind == 'histogram' else Counter()
+            self.familyLock.release()
+        return metric
+
+    def metrics(self):
+        """
+            Returns the (name, value) pairs of the labels of each metric, and the metric
+        """
+        self.familyLock.acquire()
+        children = sorted(self.children.items())
+        self.familyLock.release()
+        return [(tuple(zip(self.labelNames, values)), metric) for values, metric in children]
+
+
+class Counter(object):
+    """
+        A value that only goes up (also used for gauges, which are set)
+    """
+
+    __slots__ = ('value', 'counterLock')
+
+    def __init__(self):
+        self.value = 0
+        self.counterLock = threading.Lock()
+
+    def increment(self, amount=1):
+        self.counterLock.acquire()
+        self.value += amount
+        self.counterLock.release()
+
+    def set(self, value):
+        self.value = value
+
+
+class Histogram(object):
+    """
+        The distribution of observed values, counted in fixed buckets
+    """
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count', 'histogramLock')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.histogramLock = threading.Lock()
+
+    def observe(self, value):
+        bucket = bisect_left(self.buckets, value)
+        self.histogramLock.acquire()
+        self.counts[bucket] += 1
+        self.sum += value
+        self.count += 1
+        self.histogramLock.release()
+
+    def read(self):
+        """
+            Returns the (non cumulative) counts of the buckets, the sum and the count of the observed values
+        """
+        self.histogramLock.acquire()
+        read = list(self.counts), self.sum, self.count
+        self.histogramLock.release()
+        return read
+
+
+class TimedLock(object):
+    """
+        A lock observing how long threads wait to acquire it in a histogram (acquiring it right away counts as no wait).
+        Can be used by conditions, like the lock it wraps.
+    """
+
+    def __init__(self, waits):
+        self.lock = threading.Lock()
+        self.waits = waits
+
+    def acquire(self, blocking=1):
+        if self.lock.acquire(0):
+            self.waits.observe(0.0)
+            return True
+        if not blocking:
+            return False
+
+        started = time()
+        self.lock.acquire()
+        self.waits.observe(time() - started)
+        return True
+
+    def release(self):
+        self.lock.release()
+
+    __enter__ = acquire
+
+    def __exit__(self, *exception):
+        self.release()
+
+
+def cumulativeCounts(counts):
+    """
+        Returns the number of values up to each bucket, given the number of values in each bucket
+    """
+    cumulative = []
+    total = 0
+    for count in counts:
+        total += count
+        cumulative.append(total)
+    return cumulative
+
+def formatLabels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                             for name, value in labels)
+
+
+# The metrics of this process
+instruments = Instrumentation()
+
+# How long threads wait for the locks of the server & simulators (see TimedLock)
+LOCK_WAITS = instruments.histogram('theius_lock_wait_seconds', 'Time spent waiting to acquire a lock', ('lock',))
@@ -0,0 +1,304 @@
+import threading
+import numpy
+
+__author__ = 'Roman'
+
+class MetricsHistory(object):
+    """
+        The recent history of the metrics of every node of a cluster, kept in fixed-size columnar rings: for each
+        metric, one row of the values of all nodes per sample. Samples are kept at several resolutions: every tick
+        (resolution 0), and the min, mean & max of each node over buckets of 10 seconds, 1 minute & 10 minutes, which
+        are maintained incrementally as ticks are recorded. Coarser resolutions keep history for longer in the same
+        space.
+
+        Values are stored as float16, which is precise enough for the quantized metrics (all between 0 and 1) and
+        keeps the history of large clusters small. Recorded by the simulator thread, queried by the server threads.
+    """
+
+    # Metrics kept for every node: usage statistics, health and the probability of events of each severity
+    USAGE_METRICS = ('cpuUsage', 'memoryUsage', 'contextSwitchRate', 'health')
+    SEVERITIES = ('FATAL', 'ERROR', 'WARN', 'INFO')
+    METRICS = USAGE_METRICS + SEVERITIES
+
+    # Resolutions samples are kept at, in seconds per sample (0 for every tick)
+    RESOLUTIONS = (0, 10, 60, 600)
+
+    # Map from resolution to the number of samples kept: about 10 minutes of ticks, an hour of 10 second buckets,
+    # 6 hours of 1 minute buckets and a day of 10 minute buckets
+    DEFAULT_CAPACITIES = {0: 600, 10: 360, 60: 360, 600: 144}
+
+    # Bytes the rings of a history may take, by default: the capacities of larger clusters are scaled down to fit
+    MEMORY_BUDGET = 64 * 1024 * 1024
+
+    # Fewest samples kept at each resolution, however large the cluster
+    MIN_CAPACITY = 2
+
+    def __init__(self, nodeNames, capacities=None):
+        """
+            Creates an empty history of the given nodes (in the order of the columns recorded, see record), keeping the
+            given number of samples at each resolution (by default, as many as fit in MEMORY_BUDGET, see
+            scaledCapacities)
+        """
+
+        self.nodeNames = list(nodeNames)
+        self.rowIndex = dict((name, row) for row, name in enumerate(self.nodeNames))
+
+        capacities = capacities or self.scaledCapacities(len(self.nodeNames))
+        self.levels = dict((resolution, HistoryLevel(resolution, capacity, len(self.nodeNames), self.METRICS))
+                           for resolution, capacity in capacities.iteritems())
+        self.resolutions = sorted(self.levels)
+
+        self.historyLock = threading.Lock()
+
+    @classmethod
+    def scaledCapacities(cls, nodeCount, memoryBudget=None):
+        """
+            Returns the DEFAULT_CAPACITIES, scaled down by the same factor at every resolution (so each still covers
+            the same share of its default time span) for the rings of the given number of nodes to fit in the memory
+            budget (MEMORY_BUDGET by default), but keeping at least MIN_CAPACITY samples
+        """
+        memoryBudget = memoryBudget or cls.MEMORY_BUDGET
+        size = sum(capacity * HistoryLevel.sampleSize(resolution, nodeCount, len(cls.METRICS))
+                   for resolution, capacity in cls.DEFAULT_CAPACITIES.iteritems())
+        if size <= memoryBudget:
+            return dict(cls.DEFAULT_CAPACITIES)
+
+        scale = float(memoryBudget) / size
+        return dict((resolution, max(cls.MIN_CAPACITY, int(capacity * scale)))
+                    for resolution, capacity in cls.DEFAULT_CAPACITIES.iteritems())
+
+    def record(self, timestamp, columns):
+        """
+            Records the metrics of every node at the given clock time, given a map from metric name to the array of
+            the values of all nodes
+        """
+        self.historyLock.acquire()
+        for level in self.levels.itervalues():
+            level.record(timestamp, columns)
+        self.historyLock.release()
+
+    def rows(self, nodeNames):
+        """
+            Returns the rows of the given nodes (nodes without history are left out)
+        """
+        rowIndex = self.rowIndex
+        return numpy.array([rowIndex[name] for name in nodeNames if name in rowIndex], dtype=numpy.int64)
+
+    def chooseResolution(self, start, end, maxPoints=1000):
+        """
+            Picks the finest resolution that holds the given time range in at most maxPoints samples (ticks are about
+            a second apart), preferring the resolutions that still go back to the start of the range
+        """
+        self.historyLock.acquire()
+
+        fitting = [resolution for resolution in self.resolutions if (end - start) / max(resolution, 1) <= maxPoints]
+        fitting = fitting or self.resolutions[-1:]
+
+        chosen = fitting[0]
+        for resolution in fitting:
+            oldest = self.levels[resolution].oldest()
+            if oldest is not None and oldest <= start:
+                chosen = resolution
+                break
+
+        self.historyLock.release()
+        return chosen
+
+    def series(self, rows, start, end, resolution, metrics=None):
+        """
+            Returns the samples of the given rows between the given clock times, at the given resolution: the times of
+            the samples, and for each metric the min, mean & max over the rows (and over each bucket's ticks)
+        """
+        self.historyLock.acquire()
+        times, series = self.levels[resolution].series(rows, start, end, metrics or self.METRICS)
+        self.historyLock.release()
+        return times, series
+
+    def at(self, timestamp, rows, metrics=None):
+        """
+            Returns the latest sample of each of the given rows at the given clock time, from the finest resolution
+            that still holds it: the time of the sample, and for each metric the array of the rows' values (the mean
+            over the bucket, for coarser resolutions). Returns (None, None) if the history does not go back that far.
+        """
+        self.historyLock.acquire()
+
+        sample = None, None
+        for resolution in self.resolutions:
+            level = self.levels[resolution]
+            oldest = level.oldest()
+            if oldest is not None and oldest <= timestamp:
+                sample = level.at(timestamp, rows, metrics or self.METRICS)
+                break
+
+        self.historyLock.release()
+        return sample
+
+
+class HistoryLevel(object):
+    """
+        The ring of samples of a MetricsHistory at one resolution, along with the bucket being filled (for coarse
+        resolutions). Not thread-safe, see MetricsHistory.
+    """
+
+    def __init__(self, resolution, capacity, nodeCount, metrics):
+        self.resolution = resolution
+        self.capacity = capacity
+
+        # the statistics kept for each sample (a single value per node at the finest resolution)
+        self.stats = self.sampleStats(resolution)
+
+        # clock time of each sample (the start of its bucket, for coarse resolutions), the slot of the next sample,
+        # and the number of samples ever written
+        self.times = numpy.zeros(capacity)
+        self.head = 0
+        self.count = 0
+
+        # map from metric to statistic to the (sample, node) array of values
+        self.data = dict((metric, dict((stat, numpy.zeros((capacity, nodeCount), dtype=numpy.float16))
+                                       for stat in self.stats)) for metric in metrics)
+
+        # the bucket being filled: its number (clock time / resolution), the ticks in it so far, and the running
+        # min, sum & max of each node
+        self.bucket = None
+        self.bucketTicks = 0
+        self.accumulators = dict((metric, {
+            'min': numpy.zeros(nodeCount),
+            'sum': numpy.zeros(nodeCount),
+            'max': numpy.zeros(nodeCount)
+        }) for metric in metrics) if resolution > 0 else None
+
+    @staticmethod
+    def sampleStats(resolution):
+        return ('value',) if resolution == 0 else ('min', 'mean', 'max')
+
+    @staticmethod
+    def sampleSize(resolution, nodeCount, metricCount):
+        """
+            Returns the number of bytes taken by a sample of the given number of nodes & metrics, at the given resolution
+        """
+        return len(HistoryLevel.sampleStats(resolution)) * nodeCount * metricCount * numpy.dtype(numpy.float16).itemsize
+
+    def record(self, timestamp, columns):
+        if self.resolution == 0:
+            slot = self.advance(timestamp)
+            for metric, statistics in self.data.iteritems():
+                statistics['value'][slot] = columns[metric]
+            return
+
+        bucket = int(timestamp // self.resolution)
+        if bucket != self.bucket:
+            self.flush()
+            self.bucket = bucket
+            self.bucketTicks = 0
+
+        for metric, accumulator in self.accumulators.iteritems():
+            values = columns[metric]
+            if self.bucketTicks == 0:
+                accumulator['min'][:] = values
+                accumulator['sum'][:] = values
+                accumulator['max'][:] = values
+            else:
+                numpy.minimum(accumulator['min'], values, accumulator['min'])
+                accumulator['sum'] += values
+                numpy.maximum(accumulator['max'], values, accumulator['max'])
+        self.bucketTicks += 1
+
+    def flush(self):
+        """
+            Moves the bucket being filled (if any) into the ring
+        """
+        if self.bucket is None or self.bucketTicks == 0:
+            return
+
+        slot = self.advance(self.bucket * self.resolution)
+        for metric, accumulator in self.accumulators.iteritems():
+            statistics = self.data[metric]
+            statistics['min'][slot] = accumulator['min']
+            statistics['mean'][slot] = accumulator['sum'] / self.bucketTicks
+            statistics['max'][slot] = accumulator['max']
+
+    def advance(self, timestamp):
+        """
+            Claims the slot of the next sample, overwriting the oldest one once the ring is full
+        """
+        slot = self.head
+        self.times[slot] = timestamp
+        self.head = (self.head + 1) % self.capacity
+        self.count += 1
+        return slot
+
+    def slots(self):
+        """
+            Returns the slots of the samples in the ring, oldest first
+        """
+        if self.count < self.capacity:
+            return numpy.arange(self.count)
+        return numpy.roll(numpy.arange(self.capacity), -self.head)
+
+    def oldest(self):
+        """
+            Returns the clock time of the oldest sample still held (None if there is none)
+        """
+        if self.count > 0:
+            return self.times[self.slots()[0]]
+        if self.bucket is not None:
+            return self.bucket * self.resolution
+        return None
+
+    def series(self, rows, start, end, metrics):
+        slots = self.slots()
+        times = self.times[slots]
+        slots = slots[numpy.searchsorted(times, start, 'left'):numpy.searchsorted(times, end, 'right')]
+        sampleTimes = self.times[slots].tolist()
+
+        # samples of the bucket being filled
+        bucketStart = self.bucket * self.resolution if self.bucket is not None and self.bucketTicks > 0 else None
+        partial = bucketStart is not None and start <= bucketStart <= end
+        if partial:
+            sampleTimes.append(bucketStart)
+
+        series = {}
+        for metric in metrics:
+            statistics = self.data[metric]
+            if self.resolution == 0:
+                values = statistics['value'][slots][:, rows].astype(numpy.float64)
+                minimums, means, maximums = values, values, values
+            else:
+                minimums = statistics['min'][slots][:, rows].astype(numpy.float64)
+                means = statistics['mean'][slots][:, rows].astype(numpy.float64)
+                maximums = statistics['max'][slots][:, rows].astype(numpy.float64)
+
+            if partial:
+                accumulator = self.accumulators[metric]
+                minimums = numpy.vstack((minimums, accumulator['min'][rows]))
+                means = numpy.vstack((means, accumulator['sum'][rows] / self.bucketTicks))
+                maximums = numpy.vstack((maximums, accumulator['max'][rows]))
+
+            series[metric] = {
+                'min': self.round(minimums.min(axis=1)) if len(rows) else [],
+                'mean': self.round(means.mean(axis=1)) if len(rows) else [],
+                'max': self.round(maximums.max(axis=1)) if len(rows) else []
+            }
+
+        return sampleTimes, series
+
+    def at(self, timestamp, rows, metrics):
+        stat = 'value' if self.resolution == 0 else 'mean'
+
+        # the bucket being filled holds the latest values, if it started by then
+        if self.resolution > 0 and self.bucketTicks > 0 and self.bucket * self.resolution <= timestamp:
+            accumulators = self.accumulators
+            return self.bucket * self.resolution, dict(
+                (metric, self.round(accumulators[metric]['sum'][rows] / self.bucketTicks)) for metric in metrics)
+
+        slots = self.slots()
+        position = numpy.searchsorted(self.times[slots], timestamp, 'right') - 1
+        if position < 0:
+            return None, None
+
+        slot = slots[position]
+        return self.times[slot], dict((metric, self.round(self.data[metric][stat][slot][rows])) for metric in metrics)
+
+    def round(self, values):
+        # float16 values only have about 3 significant digits, don't send clients more
+        return numpy.round(values.astype(numpy.float64), 3).tolist()
@@ -1,52 +1,124 @@
-from datetime import datetime, timedelta
-from random import random, choice
-import string
-from time import sleep
+from collections import deque
+from random import random
 import numpy
 from src.Utility import normalizeValue, getRandomElement
+from src.simulator.AtRiskIndex import AtRiskIndex
+from src.simulator.Clock import realClock
+from src.simulator.EventGenerator import EventGenerator
+from src.simulator.EventStore import EventStore
+from src.simulator.MetricsHistory import MetricsHistory
+from src.simulator.TimeFormat import TimeFormatter
+from src.simulator.VectorizedNodeState import VectorizedNodeState
 
 __author__ = 'jon'
 
 class RandomSimulator:
-    def __init__(self, machineNames):
+
+    # Node properties that are quantized, and whose small changes are suppressed
+    QUANTIZED_PROPERTIES = ('cpuUsage', 'memoryUsage', 'contextSwitchRate', 'health')
+
+    # Node properties holding times (kept in seconds since the epoch, and formatted as they are sent to clients)
+    TIME_PROPERTIES = ('lastFailureTime', 'predictedFailureTime')
+
+    def __init__(self, machineNames, precision=3, changeThreshold=0.005, vectorized=False, eventHistorySize=20,
+                 eventStoreCapacity=None, clock=realClock, timeFormat='legacy', eventsPerTick=None,
+                 deltaMap=None, rankAtRisk=True):
         """
           Initialize the simulator
+
+            precision:          number of decimal places usage/health/probability values are quantized to
+            changeThreshold:    changes smaller than this are suppressed (neither applied nor sent to clients)
+            vectorized:         keep the node state in numpy arrays (see VectorizedNodeState), and randomize the usage
+                                statistics of the whole cluster at once each tick, for very large clusters
+            eventHistorySize:   number of most recent events kept in (and sent with) each node's state
+            eventStoreCapacity: number of events kept in the event store, for paging through older events (by
+                                default, as many as fit in EventStore.MEMORY_BUDGET, 0 to keep no event store)
+            clock:              the clock log events are timestamped with (see Clock)
+            timeFormat:         how times are sent to clients: 'legacy' or 'iso' strings, or 'epoch' seconds
+                                (see TimeFormatter)
+            eventsPerTick:      number of log events generated each tick (defaults to between 1 and 4, at random)
+            deltaMap:           distributions of the random changes to node properties, to share them between
+                                simulators (see makeDeltaMap)
+            rankAtRisk:         whether to keep the nodes ranked by how at risk they are (see AtRiskIndex)
         """
 
         # names of all nodes
         self.machineNames = machineNames
 
+        self.clock = clock
+
+        # Controls how much of the state change is shipped to clients each tick
+        self.precision = precision
+        self.changeThreshold = changeThreshold
+
         # Possible severities, categories, error codes, and error locations of log events (error code denoted by index of list)
         self.severities =  ['FATAL', 'WARN', 'INFO', 'ERROR']
         self.facilities = ['MMCS', 'APP', 'KERNEL', 'LINKCARD', 'MONITOR', 'HARDWARE', 'DISCOVERY']
 
+        # Distributions of the random changes to node properties
+        self.deltaMap = deltaMap if deltaMap is not None else self.makeDeltaMap()
+
+        self.timeFormatter = TimeFormatter(timeFormat)
+
+        # Every node keeps its latest events, older ones are only available from the event store
+        self.eventHistorySize = eventHistorySize
+        self.eventStore = EventStore(eventStoreCapacity) if eventStoreCapacity != 0 else None
+
+        # Per-node random walk of the usage statistics for the vectorized state (built lazily, see randomWalkBiases)
+        self.vectorized = vectorized
+        self.walkBiases = None
+
+        # Draws the log events of each tick (built lazily, see eventGroups)
+        self.eventsPerTick = eventsPerTick
+        self.eventGenerator = None
+
+        self.nodeState = VectorizedNodeState(len(self.machineNames) or 1) if vectorized else {}
+        for name in self.machineNames:
+            self.nodeState[name] = self.initialNodeState(name)
+
+        # Nodes ranked by how at risk they are, kept up to date as changes are applied
+        self.atRiskIndex = AtRiskIndex() if rankAtRisk else None
+        if self.atRiskIndex is not None:
+            self.atRiskIndex.update(dict((name, self.nodeState[name]) for name in self.nodeState))
+
+
+    @staticmethod
+    def makeDeltaMap():
+        """
+            Creates the distributions the properties of nodes randomly change by (read-only, so they can be shared)
+        """
+
         # Create distributions for randomly increasing/decreasing predicted severity probabilities
-        self.deltaMap = {}
-        self.deltaMap['predictedFatal'] = numpy.random.normal(loc=0, scale=0.02, size=1000)
-        self.deltaMap['predictedError'] =  numpy.random.normal(loc=0, scale=0.05, size=1000)
-        self.deltaMap['predictedWarn']  =  self.deltaMap['predictedError']
-        self.deltaMap['predictedInfo']  =  self.deltaMap['predictedError']
+        deltaMap = {}
+        deltaMap['predictedFatal'] = numpy.random.normal(loc=0, scale=0.02, size=1000)
+        deltaMap['predictedError'] =  numpy.random.normal(loc=0, scale=0.05, size=1000)
+        deltaMap['predictedWarn']  =  deltaMap['predictedError']
+        deltaMap['predictedInfo']  =  deltaMap['predictedError']
 
         # Create distributions for randomly increasing/decreasing CPU/memory/context switch stats
-        self.deltaMap['cpuUsage'] =  numpy.random.normal(loc=0, scale=0.1, size=1000)
-        self.deltaMap['memoryUsage'] =  numpy.random.normal(loc=0, scale=0.05, size=1000)
-        self.deltaMap['contextSwitchRate'] =  self.deltaMap['memoryUsage']
+        deltaMap['cpuUsage'] =  numpy.random.normal(loc=0, scale=0.1, size=1000)
+        deltaMap['memoryUsage'] =  numpy.random.normal(loc=0, scale=0.05, size=1000)
+        deltaMap['contextSwitchRate'] =  deltaMap['memoryUsage']
 
-        self.deltaMap['health'] = {
+        deltaMap['health'] = {
             'FATAL' : -0.2,
             'ERROR': 0.05,
             'WARN': 0.1,
             'INFO': 0.15
         }
 
-        self.TIMESTAMP_FORMAT = '%d/%m/%y %H:%M'
-
-        self.nodeState = {}
-        for name in self.machineNames:
-            self.addMachine(name)
-
+        return deltaMap
 
     def addMachine(self, name):
+        if name not in self.nodeState:
+            self.machineNames.append(name)
+        self.walkBiases = None
+        self.eventGenerator = None
+        self.nodeState[name] = self.initialNodeState(name)
+        if self.atRiskIndex is not None:
+            self.atRiskIndex.update({name: self.nodeState[name]})
+
+    def initialNodeState(self, name):
         # Holds index of node information, including:
         #   - last failure time for each node (initially 'None' for each node),
         #   - CPU usage (initially 20% for each node)
@@ -55,29 +127,32 @@ class RandomSimulator:
         #   - predicted crash time
         #   - probability of events of each severity category
         #   - average time between two consecutive errors
-        if name not in self.machineNames:
-            self.machineNames.append(name)
-        self.nodeState[name] = {
+        averageMinutesBetweenFailures = self.averageMinutesBetweenFailures()
+        return {
             'name': name,
             'cpuUsage': 0.2,
             'memoryUsage': 0.3,
             'contextSwitchRate': 0.1, # What is this???
-            'events': [],
+            'events': deque(maxlen=self.eventHistorySize),
             'lastFailureTime': None,
-            'predictedFailureTime': datetime.strftime(datetime.now() + timedelta(minutes=self.averageMinutesBetweenFailures()), self.TIMESTAMP_FORMAT),
+            'predictedFailureTime': self.clock.time() + 60 * averageMinutesBetweenFailures,
             'predictedSeverityProbabilities': {
                 'FATAL' : 0.05,
                 'ERROR': 0.1,
                 'WARN': 0.2,
                 'INFO': 0.5
             },
-            'averageMinutesBetweenFailures': self.averageMinutesBetweenFailures(),
+            'averageMinutesBetweenFailures': averageMinutesBetweenFailures,
             'health': 0.9 # Scale of 0-1
         }
 
     def removeMachine(self, name):
         del self.nodeState[name]
+        if self.atRiskIndex is not None:
+            self.atRiskIndex.remove(name)
         self.machineNames.remove(name)
+        self.walkBiases = None
+        self.eventGenerator = None
 
     def averageMinutesBetweenFailures(self):
         # Statistical average time between failures for a node
@@ -91,20 +166,98 @@ class RandomSimulator:
         """
             returns the current state of the cluster
         """
-        return self.nodeState
+        if self.vectorized:
+            currentState = self.nodeState.toDict()
+        else:
+            # the state is kept by snapshots, so it must not share the dicts the next ticks change in place
+            currentState = {}
+            for nodeName, node in self.nodeState.iteritems():
+                currentState[nodeName] = node = dict(node)
+                node['predictedSeverityProbabilities'] = dict(node['predictedSeverityProbabilities'])
+
+        for node in currentState.itervalues():
+            node['events'] = list(node['events'])
+            self.formatTimes(node)
+        return currentState
+
+    def metricNodes(self):
+        """
+            returns the names of the nodes, in the order of the values returned by metricColumns
+        """
+        return self.nodeState.keys() if self.vectorized else list(self.machineNames)
+
+    def metricColumns(self):
+        """
+            returns the current metrics of all nodes (see MetricsHistory), as a map from metric name to the array of
+            the values of the nodes, in the order of metricNodes
+        """
+        if self.vectorized:
+            size = self.nodeState.size
+            columns = dict((metric, values[:size]) for metric, values in self.nodeState.metrics.iteritems())
+            columns.update((severity, values[:size]) for severity, values in self.nodeState.probabilities.iteritems())
+            return columns
+
+        nodes = [self.nodeState[nodeName] for nodeName in self.machineNames]
+        columns = dict((metric, numpy.array([node[metric] for node in nodes])) for metric in MetricsHistory.USAGE_METRICS)
+        columns.update((severity, numpy.array([node['predictedSeverityProbabilities'][severity] for node in nodes]))
+                       for severity in MetricsHistory.SEVERITIES)
+        return columns
+
+    def predictedFailureTimes(self, nodeNames):
+        """
+            returns the predicted failure times of the given nodes, in seconds since the epoch
+        """
+        return [self.nodeState[nodeName]['predictedFailureTime'] for nodeName in nodeNames]
+
+    def nodeSnapshot(self, nodeName):
+        """
+            returns a copy of the current state of a single node
+        """
+        node = self.nodeState[nodeName]
+        snapshot = node.toDict() if self.vectorized else dict(node)
+        snapshot['events'] = list(snapshot['events'])
+        return self.formatTimes(snapshot)
+
+    def formatTimes(self, node):
+        """
+            formats the times of a node's state (or state change) for clients, in place
+        """
+        for propertyName in self.TIME_PROPERTIES:
+            if propertyName in node:
+                node[propertyName] = self.timeFormatter.format(node[propertyName])
+        return node
+
+    def formatStateChange(self, stateChange):
+        """
+            formats the times of an (applied) state change for clients, in place
+        """
+        for nodeInfo in stateChange.itervalues():
+            if 'lastFailureTime' in nodeInfo or 'predictedFailureTime' in nodeInfo:
+                self.formatTimes(nodeInfo)
+        return stateChange
 
     def delay(self):
         """
             How long to wait in between ticks
         """
-        sleep(2 * random())
+        self.clock.sleep(2 * random())
 
     def numberOfLogEventsPerTick(self):
         """
-            Between 1 and 5 log events per tick
+            Between 1 and 5 log events per tick, unless configured otherwise
         """
+        if self.eventsPerTick is not None:
+            return self.eventsPerTick
         return int(4 * random()) + 1
 
+    def eventGroups(self):
+        """
+            Groups of machines whose log events are distributed differently from the others' (see EventGenerator), as
+            dicts of 'machines', 'weight' (how many times as often they log events), and relative weights of
+            'severities' & 'facilities'. Log events are evenly distributed by default.
+        """
+        return []
+
     def randomizeProperty(self, nodeName, propertyName, associatedData=None):
         """
             Randomizes a property for a given node, returning its new value
@@ -129,14 +282,11 @@ class RandomSimulator:
         if len(self.machineNames) <= 0:
             return {
                 'events': [],
-                'stateChange': []
+                'stateChange': {}
             }
 
         # Create some random log events (between 1 and 5)
-        numberOfLogEvents = self.numberOfLogEventsPerTick()
-        logEvents = []
-        for i in xrange(0, numberOfLogEvents):
-            logEvents.append(self.generateRandomLogEvent())
+        logEvents = self.generateLogEvents()
 
         # Gather updated node info based on each log event
         nodeStateChange = self.getStateChange(logEvents)
@@ -144,6 +294,12 @@ class RandomSimulator:
         # Apply the node info updates to the simulator's state
         self.applyChanges(nodeStateChange)
 
+        # Randomize the usage statistics of the rest of the cluster at once (these are applied as they are computed)
+        self.addVectorizedStateChanges(nodeStateChange)
+
+        # The state keeps times as numbers, clients get them in the configured format
+        self.formatStateChange(nodeStateChange)
+
         log = {
             'events': logEvents,
             'stateChange': nodeStateChange
@@ -151,6 +307,32 @@ class RandomSimulator:
 
         return log
 
+    def generateLogEvents(self):
+        """
+          Creates the random log events of the next tick, keeping them in the event store
+        """
+        if self.eventGenerator is None:
+            self.eventGenerator = EventGenerator(self.machineNames, self.severities, self.facilities, self.eventGroups())
+
+        timestamp = self.timeFormatter.format(self.clock.time())
+        logEvents = self.eventGenerator.generate(self.numberOfLogEventsPerTick(), timestamp)
+
+        # Keep every event in the event store, nodes only keep their latest ones
+        if self.eventStore is not None:
+            self.eventStore.append(logEvents, self.clock.time())
+
+        return logEvents
+
+    def addVectorizedStateChanges(self, stateChange):
+        """
+          For the vectorized state, randomly changes the usage statistics of the nodes not already in the given state
+          change, applying them and adding them to the state change (does nothing otherwise, see addRandomStateChanges)
+        """
+        if self.vectorized:
+            if self.walkBiases is None:
+                self.walkBiases = self.randomWalkBiases()
+            stateChange.update(self.nodeState.randomWalk(self.walkBiases, self.precision, self.changeThreshold, stateChange))
+
     def applyChanges(self, updates):
         """
           Apply the node info updates to the simulator thread's state
@@ -161,9 +343,37 @@ class RandomSimulator:
             for entryName in nodeDataToUpdate:
                 if entryName == 'events':
                     self.nodeState[nodeName][entryName].extend(nodeDataToUpdate[entryName])
+                elif entryName == 'predictedSeverityProbabilities':
+                    # only the severities that changed are sent
+                    self.nodeState[nodeName][entryName].update(nodeDataToUpdate[entryName])
                 else:
                     self.nodeState[nodeName][entryName] = nodeDataToUpdate[entryName]
 
+        # Re-rank the nodes whose risk changed
+        if self.atRiskIndex is None:
+            return
+        atRisk = {}
+        for nodeName, nodeDataToUpdate in updates.iteritems():
+            for entryName in AtRiskIndex.PROPERTIES:
+                if entryName in nodeDataToUpdate:
+                    atRisk[nodeName] = self.nodeState[nodeName]
+                    break
+        self.atRiskIndex.update(atRisk)
+
+    def atRisk(self, ranking='predictedFailureTime', k=20):
+        """
+            Returns the k most at risk nodes by the given ranking (see AtRiskIndex), with their predicted failure time,
+            health and probability of a FATAL event (none if the simulator does not rank them)
+        """
+        if self.atRiskIndex is None:
+            return []
+        return [{
+            'name': nodeName,
+            'predictedFailureTime': self.timeFormatter.format(keys['predictedFailureTime']),
+            'health': keys['health'],
+            'fatalProbability': -keys['fatalProbability']
+        } for nodeName, keys in self.atRiskIndex.top(ranking, k)]
+
 
     def getStateChange(self, logEvents):
         """
@@ -171,13 +381,58 @@ class RandomSimulator:
         """
 
         stateChange = {}
-        for name in self.machineNames:
-            stateChange[name] = {}
 
         self.getStateChangeFromLogs(logEvents, stateChange)
-        self.addRandomStateChanges(stateChange)
+        if not self.vectorized:
+            self.addRandomStateChanges(stateChange)
 
-        return stateChange
+        return self.compactStateChange(stateChange)
+
+    def quantize(self, value):
+        """
+            Rounds a usage/health/probability value to the configured precision
+        """
+        return round(value, self.precision)
+
+    def isSignificantChange(self, oldValue, newValue):
+        """
+            Whether a (quantized) value differs enough from the current one to be worth sending
+        """
+        return newValue != oldValue and abs(newValue - oldValue) >= self.changeThreshold
+
+    def compactStateChange(self, stateChange):
+        """
+            Quantizes the given state change and drops every field (and node) whose change is below the threshold,
+            so only the fields that actually changed are applied and shipped to clients
+        """
+
+        compactChange = {}
+        for nodeName in stateChange:
+            currentState = self.nodeState[nodeName]
+            nodeChange = {}
+
+            for entryName, value in stateChange[nodeName].iteritems():
+                if entryName in self.QUANTIZED_PROPERTIES:
+                    value = self.quantize(value)
+                    if self.isSignificantChange(currentState[entryName], value):
+                        nodeChange[entryName] = value
+
+                elif entryName == 'predictedSeverityProbabilities':
+                    changedProbabilities = {}
+                    for severity, probability in value.iteritems():
+                        probability = self.quantize(probability)
+                        if self.isSignificantChange(currentState[entryName][severity], probability):
+                            changedProbabilities[severity] = probability
+                    if len(changedProbabilities) > 0:
+                        nodeChange[entryName] = changedProbabilities
+
+                elif entryName != 'events' or len(value) > 0:
+                    nodeChange[entryName] = value
+
+            if len(nodeChange) > 0:
+                compactChange[nodeName] = nodeChange
+
+        return compactChange
 
     def addRandomStateChanges(self, stateChange):
         """
@@ -189,7 +444,7 @@ class RandomSimulator:
         numberOfMachinesToUpdate = len(self.machineNames)
         for nodeNum in xrange(0, numberOfMachinesToUpdate):
             nodeName = getRandomElement(self.machineNames)
-            nodeInfo = stateChange[nodeName]
+            nodeInfo = stateChange.setdefault(nodeName, {})
 
             # Update this node's cpu/memory/context-switch stats
             nodeInfo['cpuUsage'] = self.randomizeProperty(nodeName, 'cpuUsage')
@@ -197,24 +452,37 @@ class RandomSimulator:
             nodeInfo['contextSwitchRate'] = self.randomizeProperty(nodeName, 'contextSwitchRate')
 
 
+    def randomWalkBiases(self):
+        """
+            Describes the per-tick random walk of the usage statistics for the vectorized state, as the 'loc' and
+            'scale' of the normal step for each metric (scalars, or arrays with an entry per machine id of
+            self.nodeState), and optionally the 'base' metric the step is taken from.
+
+            Scenarios override this to bias parts of the cluster, using self.nodeState.mask to select nodes.
+        """
+        return {
+            'cpuUsage': {'loc': 0, 'scale': 0.1},
+            'memoryUsage': {'loc': 0, 'scale': 0.05},
+            'contextSwitchRate': {'loc': 0, 'scale': 0.05}
+        }
+
     def getStateChangeFromLogs(self, logEvents, stateChange):
         """
             returns the change in state of nodes based on the given log events
         """
 
+        # Log events are all generated at the start of the tick
+        eventTime = self.clock.time()
+
         # Definitely update everything (except performance/usage) for nodes associated with log events
         for logEvent in logEvents:
 
             # Add an entry if there isn't one already
             nodeName = logEvent['location']
-            if 'events' not in stateChange[nodeName]:
-                stateChange[nodeName] = {
-                    'events': []
-                }
-            stateChange[nodeName]['events'].append(logEvent)
-            nodeInfo = stateChange[nodeName]
+            nodeInfo = stateChange.setdefault(nodeName, {})
+            nodeInfo.setdefault('events', []).append(logEvent)
 
-            self.updateFailurePredictionMetrics(nodeName, nodeInfo, logEvent)
+            self.updateFailurePredictionMetrics(nodeName, nodeInfo, logEvent, eventTime)
 
             # Update other properties of this node
             nodeInfo['health'] = self.randomizeProperty(nodeName, 'health', logEvent)
@@ -225,48 +493,25 @@ class RandomSimulator:
 
         return stateChange
 
-    def updateFailurePredictionMetrics(self, nodeName, nodeInfo, logEvent):
+    def updateFailurePredictionMetrics(self, nodeName, nodeInfo, logEvent, eventTime):
         """
-            updates averageMinutesBetweenFailures, lastFailureTime and predictedFailureTime for this node
+            updates averageMinutesBetweenFailures, lastFailureTime and predictedFailureTime for this node (eventTime is
+            the time of the log event, in seconds since the epoch)
         """
+        node = self.nodeState[nodeName]
 
         # Update failure data if this log event was FATAL
         if logEvent['severity'] == 'FATAL':
 
-            if self.nodeState[nodeName]['lastFailureTime'] is not None:
-                lastFailureTime = datetime.strptime(self.nodeState[nodeName]['lastFailureTime'], self.TIMESTAMP_FORMAT)
+            if node['lastFailureTime'] is not None:
 
                 # Update average minutes between failures & last failure info
-                delta = datetime.strptime(logEvent['timestamp'], self.TIMESTAMP_FORMAT) - lastFailureTime
-                nodeInfo['averageMinutesBetweenFailures'] = (self.nodeState[nodeName]['averageMinutesBetweenFailures'] + (delta.seconds//3600))/2
+                minutesSinceLastFailure = (eventTime - node['lastFailureTime']) / 60.0
+                nodeInfo['averageMinutesBetweenFailures'] = (node['averageMinutesBetweenFailures'] + minutesSinceLastFailure) / 2
 
-            nodeInfo['lastFailureTime'] = logEvent['timestamp']
-            nodeInfo['predictedFailureTime'] = datetime.strftime(datetime.strptime(logEvent['timestamp'], self.TIMESTAMP_FORMAT) + timedelta(minutes=self.nodeState[nodeName]['averageMinutesBetweenFailures']), self.TIMESTAMP_FORMAT)
-
-        # Update predicted crash time if
-        elif datetime.strptime(self.nodeState[nodeName]['predictedFailureTime'], self.TIMESTAMP_FORMAT) < datetime.strptime(logEvent['timestamp'], self.TIMESTAMP_FORMAT):
-            nodeInfo['predictedFailureTime'] = datetime.strftime(datetime.strptime(logEvent['timestamp'], self.TIMESTAMP_FORMAT) + timedelta(minutes=self.nodeState[nodeName]['averageMinutesBetweenFailures']), self.TIMESTAMP_FORMAT)
-
-    def generateRandomLogEvent(self):
-        """
-          Creates some random event in the proper dictionary format for log events, and returns it.
-        """
-
-        # Get a random node, severity, and facility
-        machineName = getRandomElement(self.machineNames)
-        randomSeverity = getRandomElement(self.severities)
-        randomFacility = getRandomElement(self.facilities)
-
-        # Generate a random ascii string
-        randomLength = int(random() * 50)
-        randomString = ''.join(choice(string.ascii_letters) for x in range(randomLength))
-
-        logEvent = {
-            'message': randomString,
-            'severity': randomSeverity,
-            'facility': randomFacility,
-            'location': machineName,
-            'timestamp': datetime.strftime(datetime.now(), self.TIMESTAMP_FORMAT)
-        }
+            nodeInfo['lastFailureTime'] = eventTime
+            nodeInfo['predictedFailureTime'] = eventTime + 60 * node['averageMinutesBetweenFailures']
 
-        return logEvent
+        # Update predicted crash time if it has passed
+        elif node['predictedFailureTime'] < eventTime:
+            nodeInfo['predictedFailureTime'] = eventTime + 60 * node['averageMinutesBetweenFailures']
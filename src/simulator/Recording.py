@@ -0,0 +1,297 @@
+from json import dumps, load, loads
+import mmap
+import os
+import struct
+import zlib
+from src.simulator.Snapshot import Snapshot
+
+__author__ = 'Roman'
+
+# Version of the recording format
+RECORDING_VERSION = 1
+
+# Kinds of records: the full state & structure of the simulator (written every keyframeInterval ticks), or a tick
+KEYFRAME = 0
+FRAME = 1
+
+# Each record is a header (kind, sequence number, clock time and length of the payload), followed by its zlib-compressed
+# payload. The index holds an entry per keyframe: its sequence number, clock time, segment and offset in the segment.
+RECORD_HEADER = struct.Struct('<BIdI')
+INDEX_ENTRY = struct.Struct('<IdII')
+
+def segmentPath(directory, segment):
+    return os.path.join(directory, 'segment-%06d.dat' % segment)
+
+def indexPath(directory):
+    return os.path.join(directory, 'index.dat')
+
+def metadataPath(directory):
+    return os.path.join(directory, 'recording.json')
+
+
+class Recorder(object):
+    """
+        Appends the ticks produced by a simulator to a recording: a directory of append-only segment files of compressed
+        records, and a sparse index of the keyframes (full snapshots of the simulator, written every keyframeInterval
+        ticks). Segments always start with a keyframe, and a reader seeks to any time by finding the keyframe right
+        before it in the index, so it never has to decode more than keyframeInterval ticks.
+
+        Written by the simulator thread only (see DefaultSimulator.record).
+    """
+
+    def __init__(self, directory, keyframeInterval=100, segmentSize=64 << 20, compressionLevel=6, **metadata):
+        """
+            Creates a new recording in the given directory
+
+                keyframeInterval:   number of ticks between keyframes
+                segmentSize:        bytes after which the next keyframe starts a new segment file
+                compressionLevel:   zlib compression level of the records
+                metadata:           extra information about the recording (e.g. the scenario), stored with it
+        """
+        if os.path.exists(indexPath(directory)):
+            raise ValueError("There already is a recording in '%s'" % directory)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self.directory = directory
+        self.keyframeInterval = keyframeInterval
+        self.segmentSize = segmentSize
+        self.compressionLevel = compressionLevel
+
+        metadata.update(version=RECORDING_VERSION, keyframeInterval=keyframeInterval)
+        metadataFile = open(metadataPath(directory), 'w')
+        metadataFile.write(dumps(metadata))
+        metadataFile.close()
+
+        self.indexFile = open(indexPath(directory), 'ab')
+
+        # the segment being written, and the sequence number of the last keyframe (None before the first one)
+        self.segment = -1
+        self.segmentFile = None
+        self.lastKeyframe = None
+
+    def needsKeyframe(self, sequence):
+        """
+            Whether the snapshot of the simulator after the given tick should be written as a keyframe
+        """
+        return self.lastKeyframe is None or sequence - self.lastKeyframe >= self.keyframeInterval
+
+    def addKeyframe(self, snapshot, time):
+        """
+            Writes a snapshot of the simulator, taken at the given clock time, and indexes it
+        """
+
+        # segments start with a keyframe, so each of them can be read on its own
+        if self.segmentFile is None or self.segmentFile.tell() >= self.segmentSize:
+            self.startSegment()
+
+        offset = self.segmentFile.tell()
+        self.write(KEYFRAME, snapshot.version, time, '%s\n%s\n%s' % (dumps(snapshot.time), snapshot.state, snapshot.topology))
+        self.lastKeyframe = snapshot.version
+
+        # readers only see (and seek to) the ticks up to the latest indexed keyframe once they are on disk
+        self.segmentFile.flush()
+        self.indexFile.write(INDEX_ENTRY.pack(snapshot.version, time, self.segment, offset))
+        self.indexFile.flush()
+
+    def addFrame(self, frame, time):
+        """
+            Writes a tick, produced at the given clock time
+        """
+        self.write(FRAME, frame.sequence, time, frame.encoded)
+
+    def write(self, kind, sequence, time, payload):
+        payload = zlib.compress(payload, self.compressionLevel)
+        self.segmentFile.write(RECORD_HEADER.pack(kind, sequence, time, len(payload)))
+        self.segmentFile.write(payload)
+
+    def startSegment(self):
+        if self.segmentFile is not None:
+            self.segmentFile.close()
+        self.segment += 1
+        self.segmentFile = open(segmentPath(self.directory, self.segment), 'ab')
+
+    def close(self):
+        if self.segmentFile is not None:
+            self.segmentFile.close()
+            self.segmentFile = None
+        self.indexFile.close()
+
+
+class RecordedFrame(object):
+    """
+        A tick read back from a recording. It is sent to clients as it was recorded, so its log is only decoded if it
+        is needed (e.g. to coalesce it with other ticks, see TickFrame.coalesce)
+    """
+
+    __slots__ = ('sequence', 'timestamp', 'encoded', 'decoded', 'aggregates', 'subtreeIndex', 'chunks')
+
+    def __init__(self, sequence, timestamp, encoded):
+        self.sequence = sequence
+        self.timestamp = timestamp
+        self.encoded = encoded
+        self.decoded = None
+
+        # recordings keep neither subtree aggregates nor the subtree index (replays only serve the whole cluster)
+        self.aggregates = None
+        self.subtreeIndex = None
+
+        # the compressed response (see Compression.cachedChunk)
+        self.chunks = {}
+
+    def response(self):
+        if self.decoded is None:
+            self.decoded = loads(self.encoded)
+        return self.decoded
+
+    @property
+    def log(self):
+        return self.response()
+
+    @property
+    def time(self):
+        return self.response()['time']
+
+
+class RecordingReader(object):
+    """
+        Reads a recording written by a Recorder, possibly while it is still being written. The index and segments are
+        memory-mapped, so only the parts of large recordings actually read are loaded, and seeking to a time is a
+        binary search of the index.
+    """
+
+    def __init__(self, directory):
+        if not os.path.exists(indexPath(directory)):
+            raise ValueError("There is no recording in '%s'" % directory)
+
+        self.directory = directory
+        self.metadata = load(open(metadataPath(directory)))
+
+        # memory maps of the index and of the segments read so far (None for empty files)
+        self.index = None
+        self.segments = {}
+        self.refresh()
+
+    def refresh(self):
+        """
+            Maps the keyframes indexed since the recording was opened (or last refreshed)
+        """
+        self.index = self.remap(indexPath(self.directory), self.index)
+        self.keyframes = len(self.index) // INDEX_ENTRY.size if self.index is not None else 0
+
+    def remap(self, path, current):
+        """
+            Maps the given file, unless the current map of it is still up to date
+        """
+        size = os.path.getsize(path)
+        if current is not None and len(current) == size:
+            return current
+
+        if current is not None:
+            current.close()
+        if size == 0:
+            return None
+
+        fileHandle = open(path, 'rb')
+        mapped = mmap.mmap(fileHandle.fileno(), 0, access=mmap.ACCESS_READ)
+        fileHandle.close()
+        return mapped
+
+    def keyframe(self, position):
+        """
+            Returns the sequence number, clock time, segment and offset of the keyframe at the given position of the
+            index
+        """
+        return INDEX_ENTRY.unpack_from(self.index, position * INDEX_ENTRY.size)
+
+    def findKeyframe(self, timestamp=None, sequence=None):
+        """
+            Returns the position in the index of the last keyframe at or before the given clock time (or sequence
+            number), or of the first keyframe if there is none
+        """
+        field, target = (1, timestamp) if sequence is None else (0, sequence)
+
+        low, high = 0, self.keyframes
+        while low < high:
+            middle = (low + high) // 2
+            if self.keyframe(middle)[field] <= target:
+                low = middle + 1
+            else:
+                high = middle
+        return max(low - 1, 0)
+
+    def span(self):
+        """
+            Returns the clock times of the first and last keyframes of the recording (None if it has none yet)
+        """
+        if self.keyframes == 0:
+            return None, None
+        return self.keyframe(0)[1], self.keyframe(self.keyframes - 1)[1]
+
+    def records(self, position):
+        """
+            Iterates over the records of the recording, starting with the keyframe at the given position of the index,
+            as Snapshots (keyframes) and RecordedFrames (ticks). Stops at the end of what has been written so far.
+        """
+        sequence, timestamp, segment, offset = self.keyframe(position)
+
+        while True:
+            mapped = self.mappedSegment(segment)
+            if mapped is None:
+                return
+
+            while offset + RECORD_HEADER.size <= len(mapped):
+                kind, sequence, timestamp, length = RECORD_HEADER.unpack_from(mapped, offset)
+                start = offset + RECORD_HEADER.size
+                if start + length > len(mapped):
+                    break
+
+                payload = zlib.decompress(mapped[start:start + length])
+                offset = start + length
+
+                if kind == KEYFRAME:
+                    time, state, topology = payload.split('\n', 2)
+                    yield Snapshot.encoded(sequence, loads(time), state, topology), timestamp
+                else:
+                    yield RecordedFrame(sequence, timestamp, payload), timestamp
+
+            # read what was written to this segment since it was mapped, then move on to the next segment once the
+            # recorder has moved on to it
+            size = len(mapped)
+            if len(self.mappedSegment(segment)) > size:
+                continue
+            if not os.path.exists(segmentPath(self.directory, segment + 1)):
+                return
+            segment, offset = segment + 1, 0
+
+    def mappedSegment(self, segment):
+        path = segmentPath(self.directory, segment)
+        if not os.path.exists(path):
+            return None
+        self.segments[segment] = self.remap(path, self.segments.get(segment))
+        return self.segments[segment]
+
+    def close(self):
+        for mapped in [self.index] + self.segments.values():
+            if mapped is not None:
+                mapped.close()
+        self.index = None
+        self.segments = {}
+
+
+def listRecordings(directory):
+    """
+        Returns the name, metadata and span (clock times of the first and last keyframes) of each recording in the
+        given directory
+    """
+    recordings = []
+    if not os.path.isdir(directory):
+        return recordings
+
+    for name in sorted(os.listdir(directory)):
+        if os.path.exists(indexPath(os.path.join(directory, name))):
+            reader = RecordingReader(os.path.join(directory, name))
+            start, end = reader.span()
+            recordings.append({'name': name, 'metadata': reader.metadata, 'start': start, 'end': end})
+            reader.close()
+    return recordings
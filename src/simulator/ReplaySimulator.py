@@ -0,0 +1,255 @@
+from json import loads
+import threading
+from time import time
+from src.simulator.BaseSimulator import BaseSimulator
+from src.simulator.Recording import RecordingReader, RecordedFrame
+
+__author__ = 'Roman'
+
+class ReplaySimulator(BaseSimulator):
+    """
+        Streams a recording (see Recorder) back to its clients, just like the simulator that recorded it did: at the
+        recorded pace (speed 1), 'speed' times faster, or as fast as possible (speed None). Clients can seek to any
+        time of the recording, which restarts their stream from the keyframe right before that time.
+
+        Reaching the end of a recording that is still being written, the replay waits for more ticks to be recorded.
+    """
+
+    # Seconds between checks for newly recorded ticks, at the end of the recording
+    POLL_INTERVAL = 1
+
+    # Seconds a seek waits for the replay thread to jump
+    SEEK_TIMEOUT = 5
+
+    def __init__(self, directory, speed=1, start=None):
+        """
+            Opens the recording in the given directory, ready to replay it from the given clock time (in seconds since
+            the epoch, defaults to the start of the recording)
+        """
+        self.reader = RecordingReader(directory)
+        if self.reader.keyframes == 0:
+            raise ValueError("The recording in '%s' is empty" % directory)
+
+        # keep enough frames for clients to catch up from the previous keyframe
+        BaseSimulator.__init__(self, max(50, 2 * self.reader.metadata['keyframeInterval']))
+        self.scenario = 'replay'
+
+        self.speed = speed
+
+        # the records left to replay, and the clock time the replay is at
+        self.records = None
+        self.timestamp = None
+
+        # the latest frame sent out, the time it was recorded and when it was sent (to pace the next ones)
+        self.sequence = 0
+        self.paceRecorded = None
+        self.paceSent = None
+
+        # seeks & speed changes asked for by clients, applied by the simulator thread
+        self.controlLock = threading.Lock()
+        self.controlChanged = threading.Condition(self.controlLock)
+        self.pendingSeek = None
+
+        # seconds without any client after which onIdle(simulator) is called (None to pause forever), stopping the
+        # replay if it returns True
+        self.idleTimeout = None
+        self.onIdle = None
+
+        self.seekTo(start if start is not None else self.reader.span()[0])
+
+    def seek(self, timestamp):
+        """
+            Jumps to the given clock time (in seconds since the epoch) of the recording. Returns once the replay has
+            jumped (or after SEEK_TIMEOUT seconds), so the clients' next log is the Resync to the new time.
+        """
+        self.controlLock.acquire()
+
+        self.pendingSeek = timestamp
+        self.controlChanged.notifyAll()
+
+        deadline = time() + self.SEEK_TIMEOUT
+        while self.pendingSeek is not None and time() < deadline:
+            self.controlChanged.wait(deadline - time())
+
+        self.controlLock.release()
+
+    def setSpeed(self, speed):
+        """
+            Changes the speed of the replay (None to replay as fast as possible)
+        """
+        self.controlLock.acquire()
+        self.speed = speed
+        self.paceRecorded = None
+        self.controlChanged.notifyAll()
+        self.controlLock.release()
+
+    def run(self):
+        """
+            Runs the replay thread, sending each recorded tick to the clients when it is due
+        """
+        while True:
+
+            # Pause while nobody is watching, and give up the thread if nobody comes back for idleTimeout seconds
+            if not self.waitForClients(self.idleTimeout):
+                if self.onIdle is not None and self.onIdle(self):
+                    self.reader.close()
+                    return
+                self.paceRecorded = None
+                continue
+
+            self.controlLock.acquire()
+            timestamp = self.pendingSeek
+            self.controlLock.release()
+
+            if timestamp is not None:
+                self.seekTo(timestamp)
+
+                # let the seek return, unless another one came in meanwhile
+                self.controlLock.acquire()
+                if self.pendingSeek == timestamp:
+                    self.pendingSeek = None
+                self.controlChanged.notifyAll()
+                self.controlLock.release()
+
+            self.step()
+
+    def step(self):
+        """
+            Sends out the next recorded tick once it is due (publishing the keyframes on the way as snapshots), or
+            waits for more ticks to be recorded at the end of the recording
+        """
+        for record, timestamp in self.records:
+            if isinstance(record, RecordedFrame):
+                if self.wait(timestamp):
+                    self.addLog(record)
+                    self.sequence = record.sequence
+                    self.timestamp = timestamp
+                return
+            self.publishSnapshot(record)
+
+        # end of the recording, replay anything recorded after the latest keyframe once it has been written
+        self.controlLock.acquire()
+        if self.pendingSeek is None:
+            self.controlChanged.wait(self.POLL_INTERVAL)
+        self.controlLock.release()
+
+        self.reader.refresh()
+        self.records = self.recordsAfter(self.reader.findKeyframe(sequence=self.sequence), self.sequence)
+
+    def wait(self, timestamp):
+        """
+            Waits until the tick recorded at the given clock time is due. Returns False if a seek interrupted the wait,
+            in which case the tick is skipped.
+        """
+        self.controlLock.acquire()
+
+        while self.pendingSeek is None and self.speed is not None:
+            if self.paceRecorded is None:
+                self.paceRecorded, self.paceSent = self.timestamp or timestamp, time()
+
+            remaining = self.paceSent + (timestamp - self.paceRecorded) / self.speed - time()
+            if remaining <= 0:
+                break
+            self.controlChanged.wait(remaining)
+
+        interrupted = self.pendingSeek is not None
+        self.controlLock.release()
+        return not interrupted
+
+    def seekTo(self, timestamp):
+        """
+            Restarts every client from the keyframe right before the given clock time, and sends them the ticks from
+            that keyframe up to the time right away
+        """
+        self.reader.refresh()
+        position = self.reader.findKeyframe(timestamp)
+
+        self.records = self.reader.records(position)
+        snapshot, self.timestamp = next(self.records)
+        self.restart(snapshot)
+        self.sequence = snapshot.version
+        self.paceRecorded = None
+
+        for record, recordTimestamp in self.records:
+            if recordTimestamp > timestamp:
+                self.records = self.resume(record, recordTimestamp, self.records)
+                return
+
+            if isinstance(record, RecordedFrame):
+                self.addLog(record)
+                self.sequence = record.sequence
+                self.timestamp = recordTimestamp
+            else:
+                self.publishSnapshot(record)
+
+    def resume(self, record, timestamp, records):
+        """
+            Puts back a record read ahead of the records left
+        """
+        yield record, timestamp
+        for record, timestamp in records:
+            yield record, timestamp
+
+    def recordsAfter(self, position, sequence):
+        """
+            Iterates over the records after the tick with the given sequence number, starting from the keyframe at the
+            given position of the index
+        """
+        for record, timestamp in self.reader.records(position):
+            if isinstance(record, RecordedFrame):
+                if record.sequence > sequence:
+                    yield record, timestamp
+            elif record.version >= sequence:
+                yield record, timestamp
+
+    def state(self):
+        return loads(self.snapshot.state)
+
+    def topology(self):
+        return loads(self.snapshot.topology)
+
+    def subtree(self, name, depth=1):
+        """
+            Returns the structure of the named node of the cluster, as recorded (the parts of large topologies clients
+            had not expanded were not recorded), or None if there is no such node
+        """
+        nodes = [self.topology()['cluster']]
+        while nodes:
+            node = nodes.pop()
+            if node['name'] == name:
+                return node
+            nodes.extend(node.get('children') or node.get('_children') or [])
+        return None
+
+    def atRisk(self, ranking='predictedFailureTime', k=20):
+        """
+            Recordings only hold what was sent to clients, so there is no index of at risk nodes to query
+        """
+        return []
+
+    def queryEvents(self, node=None, severity=None, start=None, end=None, before=None, limit=100):
+        """
+            Recordings only hold what was sent to clients, so there is no store of log events to query
+        """
+        return [], None
+
+    def metricsSeries(self, node=None, metrics=None, start=None, end=None, resolution=None):
+        """
+            Recordings only hold what was sent to clients, so there is no metrics history to query
+        """
+        return None
+
+    def metricsAt(self, timestamp, node=None, metrics=None):
+        """
+            Recordings only hold what was sent to clients, so there is no metrics history to query
+        """
+        return None
+
+    def getTime(self):
+        return self.snapshot.time
+
+    def getTimestamp(self):
+        return self.timestamp
+
+    def getSequence(self):
+        return self.sequence
@@ -0,0 +1,104 @@
+from src.simulator.Instrumentation import LOCK_WAITS, TimedLock
+
+__author__ = 'Roman'
+
+class SimulatorRegistry(object):
+    """
+        Builds & starts the simulator of a scenario when its first client subscribes to it, and lets the simulator go
+        once nobody has watched it for a while. Simulators without clients pause on their own (see DefaultSimulator.run),
+        so only the scenarios actually being watched use any CPU.
+    """
+
+    def __init__(self, factories, idleTimeout=300):
+        """
+            Creates an empty registry
+
+                factories:      map from scenario name to the function building its simulator
+                idleTimeout:    seconds a simulator stays paused without clients before it is torn down
+        """
+
+        self.factories = factories
+        self.idleTimeout = idleTimeout
+
+        # map from scenario name to its running simulator
+        self.simulators = {}
+        self.registryLock = TimedLock(LOCK_WAITS.labels(lock='registry'))
+
+        # functions called with each simulator the registry lets go (see addRetireListener)
+        self.retireListeners = []
+
+    def addClient(self, name, clientId):
+        """
+            Subscribes the client to the named scenario, starting its simulator if it is not running. Returns the
+            simulator and the snapshot the client starts from, or (None, None) if there is no such scenario.
+        """
+        self.registryLock.acquire()
+
+        if name not in self.factories:
+            self.registryLock.release()
+            return None, None
+
+        simulator = self.simulators.get(name)
+        if simulator is None:
+            simulator = self.factories[name]()
+            simulator.scenario = name
+            simulator.idleTimeout = self.idleTimeout
+            simulator.onIdle = self.retire
+            simulator.setDaemon(True)
+            self.simulators[name] = simulator
+            simulator.start()
+
+        # subscribe under the registry lock, so the simulator cannot retire in between
+        snapshot = simulator.addClient(clientId)
+
+        self.registryLock.release()
+        return simulator, snapshot
+
+    def retire(self, simulator):
+        """
+            Called by a simulator that has been idle for idleTimeout seconds. Unregisters it and returns True (the
+            simulator then stops) unless a client subscribed to it in the meantime.
+        """
+        self.registryLock.acquire()
+
+        if simulator.hasClients():
+            self.registryLock.release()
+            return False
+
+        for name, registered in self.simulators.items():
+            if registered is simulator:
+                del self.simulators[name]
+        listeners = list(self.retireListeners)
+
+        self.registryLock.release()
+
+        for listener in listeners:
+            listener(simulator)
+        return True
+
+    def addRetireListener(self, listener):
+        """
+            adds a function to call (from the simulator's thread) with each simulator the registry retires, for the
+            servers to forget the clients they still map to it
+        """
+        self.registryLock.acquire()
+        self.retireListeners.append(listener)
+        self.registryLock.release()
+
+    def running(self):
+        """
+            Returns the names of the scenarios whose simulator is currently running
+        """
+        self.registryLock.acquire()
+        names = self.simulators.keys()
+        self.registryLock.release()
+        return names
+
+    def runningSimulators(self):
+        """
+            Returns the (scenario name, simulator) pairs of the running simulators
+        """
+        self.registryLock.acquire()
+        simulators = self.simulators.items()
+        self.registryLock.release()
+        return simulators
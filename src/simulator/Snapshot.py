@@ -0,0 +1,121 @@
+from hashlib import md5
+from json import dumps
+from time import time
+from src.simulator.TickFrame import VIEW_ENCODING
+
+__author__ = 'Roman'
+
+class Snapshot(object):
+    """
+        The full state and structure of a simulator as of a given tick, encoded once by the simulator thread and then
+        shared (read-only) by every client that joins, so joins never have to copy or lock the live simulator state
+    """
+
+    __slots__ = ('version', 'time', 'state', 'topology', 'mapReduceState', 'mapReduceTopology', 'clusterState',
+                 'aggregates', 'subtreeIndex', 'encodedTopology', 'views', 'chunks')
+
+    def __init__(self, version, time, state, topology, aggregates=None, subtreeIndex=None):
+        """
+            Encodes the state of the simulator, along with its already encoded topology (an EncodedTopology, shared by
+            all the snapshots taken while it does not change). The version is the sequence number of the last tick
+            included in the snapshot: clients joining with this snapshot should apply every tick after it.
+
+            The subtree aggregates of the cluster at that tick (see SubtreeAggregates.snapshot), its state (which must
+            not be changed afterwards) and SubtreeIndex are kept for the clients of views that need them.
+        """
+
+        self.version = version
+        self.time = time
+        self.clusterState = state['cluster']
+        self.aggregates = aggregates
+        self.subtreeIndex = subtreeIndex
+
+        # JSON encoded state & topology, whose map reduce parts are shared with the views of the snapshot
+        self.mapReduceState = dumps(state['mapReduce'])
+        self.state = '{"cluster": %s, "mapReduce": %s}' % (dumps(state['cluster']), self.mapReduceState)
+        self.encodedTopology = topology
+        self.mapReduceTopology = topology.mapReduce
+        self.topology = topology.encoded
+
+        # the encoded state & topology for each view of the cluster clients joined with, by view key, and their
+        # compressed versions (see Compression.cachedChunk)
+        self.views = {}
+        self.chunks = {}
+
+    def view(self, view):
+        """
+            Returns the encoded state & topology for the clients of the given view of the cluster (see ClusterView)
+        """
+        encoded = self.views.get(view.key)
+        if encoded is None:
+            started = time()
+
+            # the topology of a view only changes with the topology of the simulator, so it is shared by the snapshots
+            # taken while it does not change
+            topologies = self.encodedTopology.views
+            topology = topologies.get(view.key)
+            if topology is None:
+                topology = topologies[view.key] = view.encodeTopology(self)
+            encoded = self.views[view.key] = view.encodeState(self), topology
+            VIEW_ENCODING.labels(view=view.key[0], part='snapshot').observe(time() - started)
+        return encoded
+
+    @staticmethod
+    def encoded(version, time, state, topology):
+        """
+            Rebuilds a snapshot from its already encoded state & topology (e.g. read back from a recording)
+        """
+        snapshot = Snapshot.__new__(Snapshot)
+        snapshot.version = version
+        snapshot.time = time
+        snapshot.state = state
+        snapshot.topology = topology
+        snapshot.encodedTopology = EncodedTopology(None, encoded=topology)
+        snapshot.mapReduceState = None
+        snapshot.mapReduceTopology = None
+        snapshot.clusterState = None
+        snapshot.aggregates = None
+        snapshot.subtreeIndex = None
+        snapshot.views = {}
+        snapshot.chunks = {}
+        return snapshot
+
+
+class EncodedTopology(object):
+    """
+        The JSON encoded topology of a simulator (its cluster & map reduce structures), encoded once per version of the
+        topology: the version only changes when the structure does (machines added or removed, map reduce jobs started
+        or ended), and snapshots taken in between share the encoding, along with the encodings of each view of the
+        cluster and their compressed versions.
+
+        Each encoding is identified by a hash of its content (see tag), which clients can send back to only download
+        the topology again once it changed.
+    """
+
+    __slots__ = ('version', 'cluster', 'mapReduce', 'encoded', 'views', 'tags', 'chunks')
+
+    def __init__(self, version, cluster=None, mapReduce=None, encoded=None):
+        """
+            Wraps the encoded cluster & map reduce structures of the given version of the topology (or the encoded
+            topology as a whole, e.g. read back from a recording)
+        """
+        self.version = version
+        self.cluster = cluster
+        self.mapReduce = mapReduce
+        self.encoded = encoded if encoded is not None else '{"cluster": %s, "mapReduce": %s}' % (cluster, mapReduce)
+
+        # the encoded topology for each view of the cluster, their hashes, and their compressed versions, by view key
+        # (None for the whole topology)
+        self.views = {}
+        self.tags = {}
+        self.chunks = {}
+
+    def tag(self, key=None):
+        """
+            Returns the hash of the encoded topology for the view with the given key (which must have been encoded
+            already, see Snapshot.view), or of the whole topology
+        """
+        tag = self.tags.get(key)
+        if tag is None:
+            tag = self.tags[key] = md5(self.encoded if key is None else self.views[key]).hexdigest()
+        return tag
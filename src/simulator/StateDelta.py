@@ -0,0 +1,61 @@
+__author__ = 'jon'
+
+def mergeStateChanges(stateChanges):
+    """
+        Merges consecutive cluster state changes (oldest first) into a single one, equivalent to applying them in order
+    """
+
+    merged = {}
+    for stateChange in stateChanges:
+        for nodeName, nodeChange in stateChange.iteritems():
+            mergedNode = merged.get(nodeName)
+            if mergedNode is None:
+                mergedNode = merged[nodeName] = {}
+
+            for entryName, value in nodeChange.iteritems():
+                if entryName == 'events':
+                    mergedNode.setdefault(entryName, []).extend(value)
+                elif entryName == 'predictedSeverityProbabilities':
+                    mergedNode.setdefault(entryName, {}).update(value)
+                else:
+                    mergedNode[entryName] = value
+
+    return merged
+
+
+def mergeLogs(logs):
+    """
+        Merges the logs of consecutive ticks (oldest first) into the log of a single tick
+    """
+
+    events = []
+    for log in logs:
+        events.extend(log['cluster']['events'])
+
+    return {
+        'cluster': {
+            'events': events,
+            'stateChange': mergeStateChanges([log['cluster']['stateChange'] for log in logs])
+        },
+        'mapReduce': mergeMapReduce([log['mapReduce'] for log in logs])
+    }
+
+def mergeMapReduce(deltas):
+    """
+        Merges the map reduce deltas of consecutive ticks (oldest first). Job names are never reused, and clients apply
+        the jobs started before the progress and the jobs ended, so the lists can just be concatenated.
+    """
+
+    merged = {
+        'sequence': deltas[-1]['sequence'],
+        'tasksStarted': [],
+        'tasksCompleted': [],
+        'started': [],
+        'ended': []
+    }
+    for delta in deltas:
+        for key in ('tasksStarted', 'tasksCompleted', 'started', 'ended'):
+            merged[key].extend(delta[key])
+    merged['progress'] = mergeStateChanges([delta['progress'] for delta in deltas])
+
+    return merged
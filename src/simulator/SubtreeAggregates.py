@@ -0,0 +1,286 @@
+import numpy
+
+__author__ = 'Roman'
+
+class SubtreeAggregates(object):
+    """
+        Aggregates of the machines in the subtree of every node of a cluster (the node itself and all its descendants):
+        the mean & max CPU and memory usage, the mean context switch rate, the min health, the number of log events of
+        each severity and the earliest predicted failure. Clients watching huge clusters subscribe at a depth of the
+        tree, and see the nodes at that depth as single nodes holding the aggregates of their subtree (see DepthView).
+
+        Aggregates are maintained incrementally: each tick, only the ancestors of the machines that changed are
+        recomputed, a level of the tree at a time from the bottom up, each from its own machine's values and its
+        children's aggregates. In breadth-first order the children of a node are contiguous, so a whole level is
+        reduced with a few numpy calls. Updated by the simulator thread only.
+    """
+
+    SEVERITIES = ('FATAL', 'ERROR', 'WARN', 'INFO')
+
+    # Aggregates sent to clients, besides the machine & event counts. They are named after the machine properties they
+    # aggregate (the mean for usage statistics, the min for health), so clients can display a subtree like a machine.
+    FIELDS = ('cpuUsage', 'maxCpuUsage', 'memoryUsage', 'maxMemoryUsage', 'contextSwitchRate', 'health',
+              'predictedFailureTime')
+
+    # Machine metrics aggregated
+    METRICS = ('cpuUsage', 'memoryUsage', 'contextSwitchRate', 'health')
+
+    def __init__(self, topology, machineNames, columns, failureTimes, formatTime=None, precision=3):
+        """
+            Computes the aggregates of every node of the given CompactTopology
+
+                machineNames:   names of the machines, in the order of the metric columns
+                columns:        the current metrics of the machines (see update)
+                failureTimes:   predicted failure times of the machines, in the same order (in seconds since the epoch)
+                formatTime:     formats times for clients (see TimeFormatter)
+                precision:      number of decimal places the aggregates are rounded to
+        """
+
+        self.topology = topology
+        self.names = [topology.name(index) for index in xrange(len(topology))]
+        self.levelEnds = topology.levelEnds()
+        self.formatTime = formatTime or (lambda timestamp: timestamp)
+        self.precision = precision
+
+        size = len(topology)
+
+        # the metric column & node of each machine of the topology
+        rows, machines = [], []
+        for row, name in enumerate(machineNames):
+            index = topology.index(name)
+            if index is not None:
+                rows.append(row)
+                machines.append(index)
+        self.rows = numpy.array(rows, dtype=numpy.int64)
+        self.machines = numpy.array(machines, dtype=numpy.int64)
+        self.isMachine = numpy.zeros(size, dtype=bool)
+        self.isMachine[self.machines] = True
+
+        # the values of each node's own machine (if it is one)
+        self.own = dict((metric, numpy.zeros(size)) for metric in self.METRICS)
+        for metric, own in self.own.iteritems():
+            own[self.machines] = columns[metric][self.rows]
+        self.ownFailures = numpy.empty(size)
+        self.ownFailures.fill(numpy.inf)
+        self.ownFailures[self.machines] = numpy.array(failureTimes, dtype=numpy.float64)[self.rows]
+        self.ownEvents = numpy.zeros((size, len(self.SEVERITIES)), dtype=numpy.int64)
+
+        # the aggregates of each node's subtree
+        self.machineCounts = numpy.zeros(size, dtype=numpy.int64)
+        self.sums = dict((metric, numpy.zeros(size)) for metric in ('cpuUsage', 'memoryUsage', 'contextSwitchRate'))
+        self.maxima = dict((metric, numpy.zeros(size)) for metric in ('cpuUsage', 'memoryUsage'))
+        self.minHealth = numpy.zeros(size)
+        self.minFailures = numpy.zeros(size)
+        self.events = numpy.zeros((size, len(self.SEVERITIES)), dtype=numpy.int64)
+
+        # the aggregates as last sent to clients (rounded, NaN for subtrees without machines)
+        self.values = dict((field, numpy.zeros(size)) for field in self.FIELDS)
+        self.eventCounts = numpy.zeros((size, len(self.SEVERITIES)), dtype=numpy.int64)
+
+        self.recompute(numpy.arange(size))
+        self.publish(numpy.arange(size))
+
+    def update(self, columns, events, failureTimes):
+        """
+            Updates the aggregates with the current metrics of the machines (a map from metric name to the array of the
+            values of all machines, see RandomSimulator.metricColumns), and the log events of the tick with the
+            predicted failure times of their machines. Returns the aggregates that changed, as AggregateValues.
+        """
+        dirty = []
+
+        changed = numpy.zeros(len(self.machines), dtype=bool)
+        for metric, own in self.own.iteritems():
+            values = columns[metric][self.rows]
+            changed |= own[self.machines] != values
+            own[self.machines] = values
+        dirty.append(self.machines[changed])
+
+        severities = self.SEVERITIES
+        indices = []
+        for event, failureTime in zip(events, failureTimes):
+            index = self.topology.index(event['location'])
+            if index is not None:
+                self.ownEvents[index, severities.index(event['severity'])] += 1
+                self.ownFailures[index] = failureTime
+                indices.append(index)
+        dirty.append(numpy.array(indices, dtype=numpy.int64))
+
+        return self.select(self.publish(self.recompute(numpy.concatenate(dirty))))
+
+    def recompute(self, nodes):
+        """
+            Recomputes the aggregates of the given nodes and of all their ancestors, returning the (sorted) indices of
+            the nodes recomputed
+        """
+        nodes = numpy.unique(nodes)
+        parents = self.topology.parents
+
+        recomputed = []
+        below = None
+        for level in reversed(xrange(len(self.levelEnds))):
+            start = self.levelEnds[level - 1] if level > 0 else 0
+            levelNodes = nodes[numpy.searchsorted(nodes, start):numpy.searchsorted(nodes, self.levelEnds[level])]
+            if below is not None:
+                levelNodes = numpy.union1d(levelNodes, parents[below])
+            if len(levelNodes) == 0:
+                below = None
+                continue
+
+            self.aggregate(levelNodes)
+            recomputed.append(levelNodes)
+            below = levelNodes
+
+        if not recomputed:
+            return numpy.zeros(0, dtype=numpy.int64)
+        return numpy.concatenate(recomputed[::-1])
+
+    def aggregate(self, nodes):
+        """
+            Computes the aggregates of the given nodes (all at the same level of the tree), from their own values and
+            the aggregates of their children
+        """
+        isMachine = self.isMachine[nodes]
+
+        self.machineCounts[nodes] = isMachine
+        for metric, sums in self.sums.iteritems():
+            sums[nodes] = numpy.where(isMachine, self.own[metric][nodes], 0)
+        for metric, maxima in self.maxima.iteritems():
+            maxima[nodes] = numpy.where(isMachine, self.own[metric][nodes], -numpy.inf)
+        self.minHealth[nodes] = numpy.where(isMachine, self.own['health'][nodes], numpy.inf)
+        self.minFailures[nodes] = self.ownFailures[nodes]
+        self.events[nodes] = self.ownEvents[nodes]
+
+        # the children of each node with children, in one array, and where each node's children start in it
+        childCounts = self.topology.childCounts[nodes]
+        nodes = nodes[childCounts > 0]
+        childCounts = childCounts[childCounts > 0]
+        if len(nodes) == 0:
+            return
+        offsets = numpy.cumsum(childCounts) - childCounts
+        children = numpy.arange(childCounts.sum()) + numpy.repeat(self.topology.firstChildren[nodes] - offsets, childCounts)
+
+        self.machineCounts[nodes] += numpy.add.reduceat(self.machineCounts[children], offsets)
+        for sums in self.sums.itervalues():
+            sums[nodes] += numpy.add.reduceat(sums[children], offsets)
+        for maxima in self.maxima.itervalues():
+            maxima[nodes] = numpy.maximum(maxima[nodes], numpy.maximum.reduceat(maxima[children], offsets))
+        self.minHealth[nodes] = numpy.minimum(self.minHealth[nodes], numpy.minimum.reduceat(self.minHealth[children], offsets))
+        self.minFailures[nodes] = numpy.minimum(self.minFailures[nodes], numpy.minimum.reduceat(self.minFailures[children], offsets))
+        self.events[nodes] += numpy.add.reduceat(self.events[children], offsets)
+
+    def publish(self, nodes):
+        """
+            Rounds the aggregates of the given nodes for clients, returning the nodes whose rounded aggregates changed
+            since they were last published
+        """
+        counts = self.machineCounts[nodes]
+        hasMachines = counts > 0
+        divisor = numpy.maximum(counts, 1)
+
+        def rounded(values):
+            return numpy.where(hasMachines, numpy.round(values, self.precision), numpy.nan)
+
+        values = {
+            'cpuUsage': rounded(self.sums['cpuUsage'][nodes] / divisor),
+            'maxCpuUsage': rounded(self.maxima['cpuUsage'][nodes]),
+            'memoryUsage': rounded(self.sums['memoryUsage'][nodes] / divisor),
+            'maxMemoryUsage': rounded(self.maxima['memoryUsage'][nodes]),
+            'contextSwitchRate': rounded(self.sums['contextSwitchRate'][nodes] / divisor),
+            'health': rounded(self.minHealth[nodes]),
+            'predictedFailureTime': numpy.where(numpy.isfinite(self.minFailures[nodes]), self.minFailures[nodes], numpy.nan)
+        }
+
+        changed = (self.eventCounts[nodes] != self.events[nodes]).any(axis=1)
+        for field, fieldValues in values.iteritems():
+            published = self.values[field][nodes]
+            changed |= (published != fieldValues) & ~(numpy.isnan(published) & numpy.isnan(fieldValues))
+            self.values[field][nodes] = fieldValues
+        self.eventCounts[nodes] = self.events[nodes]
+
+        return nodes[changed]
+
+    def select(self, nodes):
+        """
+            Returns a copy of the published aggregates of the given (sorted) nodes
+        """
+        return AggregateValues(self, nodes, dict((field, values[nodes]) for field, values in self.values.iteritems()),
+                               self.eventCounts[nodes], self.machineCounts[nodes])
+
+    def snapshot(self):
+        """
+            Returns a copy of the published aggregates of every node
+        """
+        return self.select(numpy.arange(len(self.names)))
+
+
+class AggregateValues(object):
+    """
+        The published aggregates of some nodes of a cluster, in breadth-first order (so the nodes up to any depth of the
+        tree come first). Read-only once built: frames hold the aggregates that changed at their tick, and snapshots
+        those of every node.
+    """
+
+    def __init__(self, aggregates, nodes, values, eventCounts, machineCounts):
+        self.aggregates = aggregates
+        self.nodes = nodes
+        self.values = values
+        self.eventCounts = eventCounts
+        self.machineCounts = machineCounts
+
+    @staticmethod
+    def merge(aggregateValues):
+        """
+            Merges the aggregates that changed over consecutive ticks (oldest first), keeping the latest ones
+        """
+        if len(aggregateValues) == 1:
+            return aggregateValues[0]
+
+        # the latest aggregates of each node: the first of its occurrences, newest first
+        nodes = numpy.concatenate([values.nodes for values in reversed(aggregateValues)])
+        nodes, positions = numpy.unique(nodes, return_index=True)
+
+        def merged(arrays):
+            return numpy.concatenate(arrays[::-1])[positions]
+
+        fields = aggregateValues[-1].values.keys()
+        return AggregateValues(aggregateValues[-1].aggregates, nodes,
+                               dict((field, merged([values.values[field] for values in aggregateValues])) for field in fields),
+                               merged([values.eventCounts for values in aggregateValues]),
+                               merged([values.machineCounts for values in aggregateValues]))
+
+    def records(self, depth):
+        """
+            Returns the aggregates of the nodes up to the given depth of the tree, as a map from node name to its
+            aggregates (in the format of the cluster state)
+        """
+        aggregates = self.aggregates
+        levelEnds = aggregates.levelEnds
+        count = numpy.searchsorted(self.nodes, levelEnds[min(depth, len(levelEnds) - 1)])
+
+        names = aggregates.names
+        nodes = self.nodes[:count].tolist()
+        columns = dict((field, values[:count].tolist()) for field, values in self.values.iteritems())
+        eventCounts = self.eventCounts[:count].tolist()
+        machineCounts = self.machineCounts[:count].tolist()
+
+        records = {}
+        for position, node in enumerate(nodes):
+            record = {
+                'name': names[node],
+                'machineCount': machineCounts[position],
+                'eventCounts': dict(zip(aggregates.SEVERITIES, eventCounts[position]))
+            }
+            for field, values in columns.iteritems():
+                value = values[position]
+                record[field] = None if value != value else value
+            if record['predictedFailureTime'] is not None:
+                record['predictedFailureTime'] = aggregates.formatTime(record['predictedFailureTime'])
+            records[names[node]] = record
+        return records
+
+    def structure(self, depth):
+        """
+            Returns the nested structure of the cluster down to the given depth (the nodes at that depth stand for their
+            whole subtree, see CompactTopology.subtree)
+        """
+        return self.aggregates.topology.subtree(0, depth, expanded=True)
@@ -0,0 +1,98 @@
+from json import dumps
+from time import time
+from src.simulator.Instrumentation import instruments
+from src.simulator.StateDelta import mergeLogs
+from src.simulator.SubtreeAggregates import AggregateValues
+
+__author__ = 'Roman'
+
+# Version of the tick frame format: sparse, quantized and sequence-numbered cluster state changes
+PROTOCOL_VERSION = 2
+
+VIEW_ENCODING = instruments.histogram('theius_view_encode_seconds',
+                                      'Time spent encoding frames & snapshots for a view of the cluster', ('view', 'part'))
+
+class TickFrame(object):
+    """
+        A single tick produced by a simulator, encoded once and shared (read-only) by every subscribed client
+    """
+
+    __slots__ = ('log', 'time', 'sequence', 'firstSequence', 'aggregates', 'subtreeIndex', 'partitioned', 'encoded', 'views',
+                 'chunks')
+
+    def __init__(self, log, time, sequence, firstSequence=None, aggregates=None, subtreeIndex=None):
+        """
+            Builds the frame from a tick's log, the simulator time at which it was produced, and the (monotonically
+            increasing) sequence number of the tick, which clients use to detect missed or duplicate frames.
+
+            A frame merging several ticks also has the sequence number of the first of them. The subtree aggregates
+            that changed at the tick (see SubtreeAggregates) are only sent to the clients of views that need them, and the
+            cluster's SubtreeIndex is used to slice the tick for the clients of filtered views.
+        """
+
+        self.log = log
+        self.time = time
+        self.sequence = sequence
+        self.firstSequence = firstSequence
+        self.aggregates = aggregates
+        self.subtreeIndex = subtreeIndex
+        self.partitioned = None
+
+        # The JSON response sent to clients for this tick, and the responses for each view of the cluster clients
+        # subscribed with (by view key), encoded the first time a client of the view needs them
+        self.encoded = self.encode(log['cluster'])
+        self.views = {}
+
+        # the compressed responses, by view key (see Compression.cachedChunk)
+        self.chunks = {}
+
+    def encode(self, cluster):
+        """
+            Encodes the response for this tick, with the given cluster updates
+        """
+        response = {
+            'cluster': cluster,
+            'mapReduce': self.log['mapReduce'],
+            'time': self.time,
+            'sequence': self.sequence,
+            'protocolVersion': PROTOCOL_VERSION,
+            'successful': True
+        }
+        if self.firstSequence is not None and self.firstSequence != self.sequence:
+            response['firstSequence'] = self.firstSequence
+        return dumps(response)
+
+    def partition(self):
+        """
+            Returns the cluster state changes of this tick sorted by subtree (see SubtreeIndex.partition), sorting them
+            the first time a filtered view needs them
+        """
+        if self.partitioned is None:
+            self.partitioned = self.subtreeIndex.partition(self.log['cluster']['stateChange'])
+        return self.partitioned
+
+    def view(self, view):
+        """
+            Returns the response for this tick for the clients of the given view of the cluster (see ClusterView)
+        """
+        encoded = self.views.get(view.key)
+        if encoded is None:
+            started = time()
+            encoded = self.views[view.key] = view.encodeFrame(self)
+            VIEW_ENCODING.labels(view=view.key[0], part='frame').observe(time() - started)
+        return encoded
+
+    @staticmethod
+    def coalesce(frames):
+        """
+            Merges consecutive frames (oldest first) into a single frame
+        """
+        if len(frames) == 1:
+            return frames[0]
+
+        aggregates = None
+        if all(frame.aggregates is not None for frame in frames):
+            aggregates = AggregateValues.merge([frame.aggregates for frame in frames])
+
+        return TickFrame(mergeLogs([frame.log for frame in frames]), frames[-1].time, frames[-1].sequence,
+                         frames[0].sequence, aggregates, frames[-1].subtreeIndex)
@@ -0,0 +1,77 @@
+from time import time
+
+__author__ = 'Roman'
+
+class TickRing(object):
+    """
+        Fixed-capacity ring of the latest tick frames of a simulator, addressed by sequence number. Shared by all the
+        clients of the simulator, each of which only keeps a cursor into it (not thread-safe, see BaseSimulator).
+    """
+
+    def __init__(self, capacity):
+        """
+            Creates an empty ring, holding at most 'capacity' frames
+        """
+
+        self.capacity = capacity
+        self.frames = [None] * capacity
+
+        # sequence numbers of the first frame ever added, and of the latest one (frames are added in sequence)
+        self.firstSequence = None
+        self.lastSequence = 0
+
+    def append(self, frame):
+        """
+            Adds the next frame, overwriting the oldest one once the ring is full
+        """
+        if self.firstSequence is None:
+            self.firstSequence = frame.sequence
+        self.frames[frame.sequence % self.capacity] = frame
+        self.lastSequence = frame.sequence
+
+    def oldestSequence(self):
+        """
+            Returns the sequence number of the oldest frame still in the ring (lastSequence + 1 if it is empty)
+        """
+        if self.firstSequence is None:
+            return self.lastSequence + 1
+        return max(self.firstSequence, self.lastSequence - self.capacity + 1)
+
+    def contains(self, sequence):
+        """
+            Whether the frame with the given sequence number is in the ring
+        """
+        return self.oldestSequence() <= sequence <= self.lastSequence
+
+    def get(self, sequence):
+        """
+            Returns the frame with the given sequence number
+        """
+        return self.frames[sequence % self.capacity]
+
+
+class ClientCursor(object):
+    """
+        A client's position in its simulator's TickRing: the sequence number of the last frame it received, when it last
+        read from the ring, and how many of its requests are currently waiting for frames
+    """
+
+    __slots__ = ('sequence', 'lastSeen', 'waiting')
+
+    def __init__(self, sequence):
+        self.sequence = sequence
+        self.lastSeen = time()
+        self.waiting = 0
+
+
+class Resync(object):
+    """
+        Sent instead of the next frame to a client that fell so far behind that the frames it needs are no longer in
+        the ring: the number of ticks it skipped, and the latest snapshot to start over from
+    """
+
+    __slots__ = ('skipped', 'snapshot')
+
+    def __init__(self, skipped, snapshot):
+        self.skipped = skipped
+        self.snapshot = snapshot
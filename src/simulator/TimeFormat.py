@@ -0,0 +1,47 @@
+from datetime import datetime
+
+__author__ = 'Roman'
+
+# strftime patterns of the wire formats that send times as strings (at minute resolution)
+TIME_PATTERNS = {
+    'legacy': '%d/%m/%y %H:%M',
+    'iso': '%Y-%m-%dT%H:%M'
+}
+
+class TimeFormatter(object):
+    """
+        Formats the times simulators keep internally (in seconds since the epoch) as they are sent to clients: either as
+        strings ('legacy' or 'iso'), or as whole seconds since the epoch ('epoch', left for clients to format). Strings
+        only change once a minute, so they are cached per minute instead of being formatted for every event.
+    """
+
+    def __init__(self, wireFormat='legacy', cacheSize=1024):
+        """
+            Creates a formatter for the given wire format, caching up to cacheSize formatted minutes
+        """
+        if wireFormat != 'epoch' and wireFormat not in TIME_PATTERNS:
+            raise ValueError("Unknown time format '%s'" % wireFormat)
+
+        self.wireFormat = wireFormat
+        self.pattern = TIME_PATTERNS.get(wireFormat)
+
+        # map from minute (since the epoch) to its formatted string
+        self.cache = {}
+        self.cacheSize = cacheSize
+
+    def format(self, seconds):
+        """
+            Formats a time for the wire (None stays None)
+        """
+        if seconds is None:
+            return None
+        if self.pattern is None:
+            return int(seconds)
+
+        minute = int(seconds // 60)
+        formatted = self.cache.get(minute)
+        if formatted is None:
+            if len(self.cache) >= self.cacheSize:
+                self.cache.clear()
+            formatted = self.cache[minute] = datetime.fromtimestamp(minute * 60).strftime(self.pattern)
+        return formatted
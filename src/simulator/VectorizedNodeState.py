@@ -0,0 +1,259 @@
+import numpy
+
+__author__ = 'jon'
+
+class VectorizedNodeState(object):
+    """
+        Struct-of-arrays storage for the state of every node in a cluster.
+
+        Usage statistics, health and the predicted severity probabilities are kept in contiguous float arrays indexed
+        by machine id, so the per-tick random walk can be done for the whole cluster at once. Everything else (events,
+        failure times) is kept in a small record per node.
+
+        Behaves like the dict of per-node dicts used by RandomSimulator: indexing by node name returns a NodeView that
+        reads and writes through to the arrays, so per-node code works unchanged against either representation.
+    """
+
+    # Per-node properties stored in arrays
+    METRICS = ('cpuUsage', 'memoryUsage', 'contextSwitchRate', 'health')
+    SEVERITIES = ('FATAL', 'ERROR', 'WARN', 'INFO')
+
+    def __init__(self, capacity=1024):
+        """
+            Creates an empty state, with room for 'capacity' nodes before the arrays need to grow
+        """
+
+        # number of nodes, and the map from node name to machine id (index into the arrays)
+        self.size = 0
+        self.index = {}
+        self.names = []
+
+        # the non-numeric properties of each node, indexed by machine id
+        self.records = []
+
+        self.metrics = {}
+        for name in self.METRICS:
+            self.metrics[name] = numpy.zeros(capacity)
+        self.probabilities = {}
+        for severity in self.SEVERITIES:
+            self.probabilities[severity] = numpy.zeros(capacity)
+
+    def arrays(self):
+        """
+            Returns all the arrays of this state (metrics & severity probabilities)
+        """
+        return self.metrics.values() + self.probabilities.values()
+
+    def grow(self):
+        """
+            Doubles the capacity of all arrays
+        """
+        for arrays in (self.metrics, self.probabilities):
+            for name in arrays:
+                arrays[name] = numpy.concatenate((arrays[name], numpy.zeros(len(arrays[name]))))
+
+    def __setitem__(self, name, nodeState):
+        """
+            Adds (or replaces) a node, given its state in the per-node dict format
+        """
+        if name in self.index:
+            del self[name]
+
+        if self.size == len(self.metrics['health']):
+            self.grow()
+
+        machineId = self.size
+        self.size += 1
+        self.index[name] = machineId
+        self.names.append(name)
+
+        record = {}
+        for entryName in nodeState:
+            if entryName in self.METRICS:
+                self.metrics[entryName][machineId] = nodeState[entryName]
+            elif entryName == 'predictedSeverityProbabilities':
+                for severity in self.SEVERITIES:
+                    self.probabilities[severity][machineId] = nodeState[entryName][severity]
+            else:
+                record[entryName] = nodeState[entryName]
+        self.records.append(record)
+
+    def __delitem__(self, name):
+        """
+            Removes a node, moving the last node into its slot to keep the arrays contiguous
+        """
+        machineId = self.index.pop(name)
+        lastId = self.size - 1
+
+        if machineId != lastId:
+            for array in self.arrays():
+                array[machineId] = array[lastId]
+            self.records[machineId] = self.records[lastId]
+            self.names[machineId] = self.names[lastId]
+            self.index[self.names[machineId]] = machineId
+
+        self.records.pop()
+        self.names.pop()
+        self.size -= 1
+
+    def __getitem__(self, name):
+        return NodeView(self, self.index[name])
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __iter__(self):
+        return iter(list(self.names))
+
+    def __len__(self):
+        return self.size
+
+    def keys(self):
+        return list(self.names)
+
+    def mask(self, predicate):
+        """
+            Returns a boolean array selecting the nodes whose name satisfies the given predicate
+        """
+        return numpy.array([predicate(name) for name in self.names], dtype=bool)
+
+    def toDict(self):
+        """
+            Returns the state of the cluster in the per-node dict format (as sent to clients)
+        """
+
+        metrics = {}
+        for name in self.METRICS:
+            metrics[name] = self.metrics[name][:self.size].tolist()
+        probabilities = {}
+        for severity in self.SEVERITIES:
+            probabilities[severity] = self.probabilities[severity][:self.size].tolist()
+
+        nodeState = {}
+        for machineId, name in enumerate(self.names):
+            node = dict(self.records[machineId])
+            for metric in self.METRICS:
+                node[metric] = metrics[metric][machineId]
+            node['predictedSeverityProbabilities'] = dict(
+                (severity, probabilities[severity][machineId]) for severity in self.SEVERITIES
+            )
+            nodeState[name] = node
+
+        return nodeState
+
+    def randomWalk(self, biases, precision, changeThreshold, exclude=()):
+        """
+            Randomly moves the usage statistics of a random subset of the cluster, applying the changes and returning
+            them in the sparse state change format.
+
+            biases maps each metric to its random walk: 'loc' and 'scale' of the normal step (scalars, or arrays with
+            one entry per machine id), and optionally the 'base' metric the step is taken from (defaults to the metric
+            itself). Nodes named in 'exclude' are left untouched.
+        """
+
+        size = self.size
+        stateChange = {}
+        if size == 0:
+            return stateChange
+
+        # Pick as many random nodes (with replacement) as there are nodes in the cluster
+        touched = numpy.zeros(size, dtype=bool)
+        touched[numpy.random.randint(0, size, size)] = True
+        for name in exclude:
+            if name in self.index:
+                touched[self.index[name]] = False
+
+        # Compute all new values from the current state, before applying any of them
+        changes = []
+        for metric in biases:
+            bias = biases[metric]
+            base = self.metrics[bias.get('base', metric)][:size]
+            current = self.metrics[metric][:size]
+
+            proposed = numpy.round(numpy.clip(base + numpy.random.normal(bias['loc'], bias['scale'], size), 0, 1), precision)
+            difference = numpy.abs(proposed - current)
+            changed = touched & (difference > 0) & (difference >= changeThreshold)
+            changes.append((metric, changed, proposed))
+
+        for metric, changed, proposed in changes:
+            self.metrics[metric][:size][changed] = proposed[changed]
+
+            names = self.names
+            for machineId, value in zip(numpy.nonzero(changed)[0].tolist(), proposed[changed].tolist()):
+                name = names[machineId]
+                if name in stateChange:
+                    stateChange[name][metric] = value
+                else:
+                    stateChange[name] = {metric: value}
+
+        return stateChange
+
+
+class NodeView(object):
+    """
+        The state of a single node of a VectorizedNodeState, accessed like the per-node dict it replaces
+    """
+
+    __slots__ = ('nodeState', 'machineId')
+
+    def __init__(self, nodeState, machineId):
+        self.nodeState = nodeState
+        self.machineId = machineId
+
+    def __getitem__(self, entryName):
+        if entryName in VectorizedNodeState.METRICS:
+            return float(self.nodeState.metrics[entryName][self.machineId])
+        elif entryName == 'predictedSeverityProbabilities':
+            return ProbabilityView(self.nodeState, self.machineId)
+        return self.nodeState.records[self.machineId][entryName]
+
+    def __setitem__(self, entryName, value):
+        if entryName in VectorizedNodeState.METRICS:
+            self.nodeState.metrics[entryName][self.machineId] = value
+        elif entryName == 'predictedSeverityProbabilities':
+            ProbabilityView(self.nodeState, self.machineId).update(value)
+        else:
+            self.nodeState.records[self.machineId][entryName] = value
+
+    def __contains__(self, entryName):
+        return entryName in VectorizedNodeState.METRICS or entryName == 'predictedSeverityProbabilities' or \
+               entryName in self.nodeState.records[self.machineId]
+
+    def toDict(self):
+        node = dict(self.nodeState.records[self.machineId])
+        for metric in VectorizedNodeState.METRICS:
+            node[metric] = self[metric]
+        node['predictedSeverityProbabilities'] = self['predictedSeverityProbabilities'].toDict()
+        return node
+
+    def items(self):
+        return self.toDict().items()
+
+
+class ProbabilityView(object):
+    """
+        The predicted severity probabilities of a single node of a VectorizedNodeState
+    """
+
+    __slots__ = ('nodeState', 'machineId')
+
+    def __init__(self, nodeState, machineId):
+        self.nodeState = nodeState
+        self.machineId = machineId
+
+    def __getitem__(self, severity):
+        return float(self.nodeState.probabilities[severity][self.machineId])
+
+    def __setitem__(self, severity, value):
+        self.nodeState.probabilities[severity][self.machineId] = value
+
+    def update(self, probabilities):
+        for severity in probabilities:
+            self[severity] = probabilities[severity]
+
+    def iteritems(self):
+        for severity in VectorizedNodeState.SEVERITIES:
+            yield severity, self[severity]
+
+    def toDict(self):
+        return dict(self.iteritems())
@@ -0,0 +1,32 @@
+__author__ = 'Roman'
+
+class JobCalendar(object):
+    """
+        The upcoming job starts & ends of all the tasks of a MapReduceSimulator, bucketed by the tick they happen at, so
+        each tick only touches the jobs starting or ending at that tick
+    """
+
+    START = 'start'
+    END = 'end'
+
+    def __init__(self):
+
+        # map from tick to the (kind, task simulator, job) entries due at that tick, and the next tick to be processed
+        self.buckets = {}
+        self.nextTick = 0
+
+    def schedule(self, tick, kind, taskSimulator, job):
+        """
+            Schedules a job of a task to start or end at the given tick (at the next tick, if that one has passed)
+        """
+        self.buckets.setdefault(max(tick, self.nextTick), []).append((kind, taskSimulator, job))
+
+    def due(self, tick):
+        """
+            Removes & returns the entries due up to the given tick, in the order they were scheduled
+        """
+        entries = []
+        for dueTick in xrange(self.nextTick, tick + 1):
+            entries.extend(self.buckets.pop(dueTick, ()))
+        self.nextTick = max(self.nextTick, tick + 1)
+        return entries
@@ -1,44 +1,91 @@
 from random import random
+from src.simulator.Clock import realClock
+from src.simulator.RandomSimulator import RandomSimulator
+from src.simulator.mapReduce.JobCalendar import JobCalendar
 from src.simulator.mapReduce.MapReduceTaskSimulator import MapReduceTaskSimulator
 
 __author__ = 'Roman'
 
 class MapReduceSimulator:
-    def __init__(self, machineNames):
+    def __init__(self, machineNames, clock=realClock, timeFormat='legacy', taskRate=0.025, jobsPerPhase=10):
+        """
+            Initialize the simulator
+
+                taskRate:       average number of tasks started per tick
+                jobsPerPhase:   number of map jobs, and of reduce jobs, of each task
+        """
         self.machineNames = machineNames
+        self.clock = clock
+        self.timeFormat = timeFormat
+        self.taskRate = taskRate
+        self.jobsPerPhase = jobsPerPhase
         self.mapReduceTasks = {}
         self.tasksCreated = 0
         self.time = 0
 
+        # version of the topology, only changed when tasks or jobs start or end (see topology)
+        self.topologyVersion = 0
+
+        # map from the name of each running job to the task simulator running it
+        self.jobs = {}
+
+        # upcoming job starts & ends of all tasks, and the distributions all tasks randomly change their jobs by
+        self.calendar = JobCalendar()
+        self.deltaMap = RandomSimulator.makeDeltaMap()
+
     def updates(self):
+        """
+            Runs the next tick of every task, returning what changed: the tasks started & completed, the jobs started
+            (with their full state) & ended, and the state changes of the running jobs ('progress'). Clients apply
+            them in that order, on top of the full state & topology they joined with (see StateDelta.mergeMapReduce).
+        """
         self.time += 1
 
-        if random() < .025:
-            self.startNewMapReduceTask()
+        delta = {
+            'sequence': self.time,
+            'tasksStarted': [],
+            'tasksCompleted': [],
+            'started': [],
+            'ended': [],
+            'progress': {}
+        }
 
-        updates = {}
-        toRemove = []
-        for taskName in self.mapReduceTasks:
-            taskSimulator = self.mapReduceTasks[taskName]
-            updates[taskName] = taskSimulator.updates()
-            if taskSimulator.isCompleted():
-                toRemove.append(taskName)
-                updates[taskName]['complete'] = True
+        newTasks = int(self.taskRate) + (1 if random() < self.taskRate - int(self.taskRate) else 0)
+        for i in xrange(newTasks):
+            delta['tasksStarted'].append(self.startNewMapReduceTask())
 
-        for taskName in toRemove:
-            del self.mapReduceTasks[taskName]
+        # randomly change the state of the running jobs
+        for taskSimulator in self.mapReduceTasks.itervalues():
+            delta['progress'].update(taskSimulator.updates()['stateChange'])
 
-        return {
-            'state': self.state(),
-            'topology': self.topology()
-        }
+        # start & end the jobs due at this tick
+        for kind, taskSimulator, job in self.calendar.due(self.time):
+            if kind == JobCalendar.START:
+                taskSimulator.startJob(job)
+                self.jobs[job['name']] = taskSimulator
+                delta['started'].append(taskSimulator.jobState(job['name']))
+            else:
+                taskSimulator.endJob(job)
+                del self.jobs[job['name']]
+                delta['ended'].append(job['name'])
+
+                if taskSimulator.isCompleted():
+                    del self.mapReduceTasks[taskSimulator.taskName]
+                    delta['tasksCompleted'].append(taskSimulator.taskName)
+
+        if delta['tasksStarted'] or delta['started'] or delta['ended']:
+            self.topologyVersion += 1
+
+        return delta
 
     def startNewMapReduceTask(self):
         taskName = "%s%d" % ("task", self.tasksCreated)
         self.tasksCreated += 1
 
-        self.mapReduceTasks[taskName] = MapReduceTaskSimulator(self.machineNames, taskName, self.time)
+        self.mapReduceTasks[taskName] = MapReduceTaskSimulator(self.machineNames, taskName, self.time, self.calendar,
+                                                               self.clock, self.timeFormat, self.deltaMap, self.jobsPerPhase)
         print "started new map task: ", taskName
+        return taskName
 
     def topology(self):
         currentTopology = {
@@ -53,9 +100,8 @@ class MapReduceSimulator:
 
     def state(self):
         currentState = {}
-        for taskName in self.mapReduceTasks:
-            taskSimulator = self.mapReduceTasks[taskName]
-            currentState = dict(taskSimulator.state().items() + currentState.items())
+        for jobName, taskSimulator in self.jobs.iteritems():
+            currentState[jobName] = taskSimulator.jobState(jobName)
 
         return currentState
 
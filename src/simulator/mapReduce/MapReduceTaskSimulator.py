@@ -1,16 +1,25 @@
 import numpy
 from src.Utility import getRandomElement
+from src.simulator.Clock import realClock
 from src.simulator.RandomSimulator import RandomSimulator
+from src.simulator.mapReduce.JobCalendar import JobCalendar
 
 __author__ = 'Roman'
 
 class MapReduceTaskSimulator(RandomSimulator):
-    def __init__(self, machineNames, taskName, time):
-        RandomSimulator.__init__(self, [])
+    def __init__(self, machineNames, taskName, time, calendar, clock=realClock, timeFormat='legacy', deltaMap=None,
+                 jobsPerPhase=10):
+        """
+            Creates the map & reduce jobs of a task started at the given tick, scheduling their starts & ends in the
+            calendar shared by all tasks (see JobCalendar). Tasks share the delta distributions of their simulator, and
+            keep neither an event store nor an at-risk index (nothing queries the events or nodes of a task).
+        """
+        RandomSimulator.__init__(self, [], clock=clock, timeFormat=timeFormat, deltaMap=deltaMap, eventStoreCapacity=0,
+                                 rankAtRisk=False)
 
         self.taskName = taskName
 
-        numberOfMapJobs = 10
+        numberOfMapJobs = jobsPerPhase
         self.map = []
         for i in xrange(0, numberOfMapJobs):
             mapJob = {
@@ -25,13 +34,13 @@ class MapReduceTaskSimulator(RandomSimulator):
             mapJob['end'] = int(mapJob['start'] + mapJob['duration'])
             self.map.append(mapJob)
 
-        numberOfReduceJobs = 10
+        numberOfReduceJobs = jobsPerPhase
         self.reduce = []
         for i in xrange(0, numberOfReduceJobs):
             reduceJob = {
                 'id': numberOfMapJobs + i,
                 'name': "%s%s%d" % (self.taskName, "-reduceJob", i),
-                'start': time + int(numpy.random.normal(loc=60, scale=5)),
+                'start': time + max(int(numpy.random.normal(loc=60, scale=5)), 0),
                 'duration': int(numpy.random.normal(loc=60, scale=5)),
                 'location': getRandomElement(machineNames)
             }
@@ -40,45 +49,34 @@ class MapReduceTaskSimulator(RandomSimulator):
             reduceJob['end'] = int(reduceJob['start'] + reduceJob['duration'])
             self.reduce.append(reduceJob)
 
+        # map from job name to job, for the jobs of both phases
+        self.jobs = dict((job['name'], job) for job in self.map + self.reduce)
+
+        # jobs that have not ended yet
+        self.pendingJobs = len(self.jobs)
+        for job in self.map + self.reduce:
+            calendar.schedule(job['start'], JobCalendar.START, self, job)
+            calendar.schedule(job['end'], JobCalendar.END, self, job)
+
         self.time = time
 
     def updates(self):
+        """
+            Randomly changes the state of the running jobs
+        """
         updates = RandomSimulator.updates(self)
-
-        updates['start'] = []
-        updates['end'] = []
-
-        for mapTask in self.map:
-            if mapTask['start'] == self.time:
-                updates['start'].append(mapTask)
-                self.addMachine(mapTask['name'])
-            elif mapTask['end'] == self.time:
-                updates['end'].append(mapTask)
-                self.removeMachine(mapTask['name'])
-
-        for reduceTask in self.reduce:
-            if reduceTask['start'] == self.time:
-                updates['start'].append(reduceTask)
-                self.addMachine(reduceTask['name'])
-            elif reduceTask['end'] == self.time:
-                updates['end'].append(reduceTask)
-                self.removeMachine(reduceTask['name'])
-
         self.time += 1
-
         return updates
 
+    def startJob(self, job):
+        self.addMachine(job['name'])
 
-    def isCompleted(self):
-        for mapTask in self.map:
-            if self.time <= mapTask['end']:
-                return False
-
-        for reduceTask in self.reduce:
-            if self.time <= reduceTask['end']:
-                return False
+    def endJob(self, job):
+        self.removeMachine(job['name'])
+        self.pendingJobs -= 1
 
-        return True
+    def isCompleted(self):
+        return self.pendingJobs == 0
 
     def topology(self):
         currentTopology = {
@@ -95,13 +93,18 @@ class MapReduceTaskSimulator(RandomSimulator):
 
     def state(self):
         currentState = {}
-        for mapTask in self.map:
-            if mapTask['name'] in self.nodeState:
-                currentState[mapTask['name']] = dict(self.nodeState[mapTask['name']].items() + mapTask.items())
-        for reduceTask in self.reduce:
-            if reduceTask['name'] in self.nodeState:
-                currentState[reduceTask['name']] = dict(self.nodeState[reduceTask['name']].items() + reduceTask.items())
+        for jobName in self.nodeState:
+            currentState[jobName] = self.jobState(jobName)
         return currentState
 
+    def jobState(self, jobName):
+        """
+            returns the state of a running job: the state of its node, and the job's description
+        """
+        jobState = self.nodeSnapshot(jobName)
+        jobState.update(self.jobs[jobName])
+        jobState['task'] = self.taskName
+        return jobState
+
     def getTime(self):
         return self.time
\ No newline at end of file
@@ -1,7 +1,3 @@
-from copy import deepcopy
-from random import random, choice
-import string
-from datetime import datetime
 from src.Utility import normalizeValue, getRandomElement
 from src.simulator.RandomSimulator import RandomSimulator
 
@@ -13,11 +9,11 @@ __author__ = 'Roman'
 
 
 class IndividualMachineFailureSimulator(RandomSimulator):
-    def __init__(self, machineNames):
+    def __init__(self, machineNames, **options):
         """
             constructor
         """
-        RandomSimulator.__init__(self, machineNames)
+        RandomSimulator.__init__(self, machineNames, **options)
 
         self.badMachines = ["machine1-3", "machine2-6", "machine2-7", "machine3-1"]
 
@@ -27,22 +23,6 @@ class IndividualMachineFailureSimulator(RandomSimulator):
 
         self.badNodeMemoryDelta = numpy.random.normal(loc=0.02, scale=0.05, size=1000)
 
-        self.weightedMachineNamesList = deepcopy(self.machineNames)
-        for name in self.badMachines:
-            for i in xrange(0,3):
-                self.weightedMachineNamesList.append(name)
-
-        self.weightedSeverities = deepcopy(self.severities)
-        for i in xrange(0,4):
-            self.weightedSeverities.append("FATAL")
-        for i in xrange(0,3):
-            self.weightedSeverities.append("ERROR")
-
-        self.weightedFacilities = deepcopy(self.facilities)
-        for i in xrange(0,4):
-            self.weightedFacilities.append("KERNEL")
-
-
 
     def randomizeProperty(self, nodeName, propertyName, associatedData=None):
         """
@@ -61,31 +41,28 @@ class IndividualMachineFailureSimulator(RandomSimulator):
 
         return RandomSimulator.randomizeProperty(self, nodeName, propertyName, associatedData)
 
-    def generateRandomLogEvent(self):
+    def eventGroups(self):
+        """
+            Bad machines log 4 times as many events as the others, mostly FATAL & ERROR, often from the KERNEL
+        """
+        return [{
+            'machines': self.badMachines,
+            'weight': 4,
+            'severities': {'FATAL': 5, 'ERROR': 4},
+            'facilities': {'KERNEL': 5}
+        }]
+
+    def randomWalkBiases(self):
         """
-          Creates some random event in the proper dictionary format for log events, and returns it.
+            Same biases as randomizeProperty, as per-node arrays for the vectorized state
         """
+        biases = RandomSimulator.randomWalkBiases(self)
 
-        # Get a random node, severity, and facility
-        machineName = getRandomElement(self.weightedMachineNamesList)
-
-        if machineName in self.badMachines:
-            randomSeverity = getRandomElement(self.weightedSeverities)
-            randomFacility = getRandomElement(self.weightedFacilities)
-        else:
-            randomSeverity = getRandomElement(self.severities)
-            randomFacility = getRandomElement(self.facilities)
-
-        # Generate a random ascii string
-        randomLength = int(random() * 50)
-        randomString = ''.join(choice(string.ascii_letters) for x in range(randomLength))
-
-        logEvent = {
-            'message': randomString,
-            'severity': randomSeverity,
-            'facility': randomFacility,
-            'location': machineName,
-            'timestamp': datetime.strftime(datetime.now(), self.TIMESTAMP_FORMAT)
+        badMachines = set(self.badMachines)
+        badNodes = self.nodeState.mask(lambda nodeName: nodeName in badMachines)
+        biases['memoryUsage'] = {
+            'loc': numpy.where(badNodes, 0.02, -0.025),
+            'scale': 0.05
         }
 
-        return logEvent
\ No newline at end of file
+        return biases
@@ -6,11 +6,11 @@ __author__ = 'Roman'
 
 
 class RackFailureSimulator(IndividualMachineFailureSimulator):
-    def __init__(self, machineNames):
+    def __init__(self, machineNames, **options):
         """
             constructor
         """
-        IndividualMachineFailureSimulator.__init__(self, machineNames)
+        IndividualMachineFailureSimulator.__init__(self, machineNames, **options)
 
         self.badMachines = []
         for name in self.machineNames:
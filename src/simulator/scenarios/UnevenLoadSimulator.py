@@ -6,14 +6,14 @@ __author__ = 'Roman'
 
 
 class UnevenLoadSimulator(RandomSimulator):
-    def __init__(self, machineNames):
+    def __init__(self, machineNames, **options):
         """
             constructor
         """
         self.lowCpuUsageDelta = numpy.random.normal(loc=-0.025, scale=0.05, size=1000)
         self.highCpuUsageDelta = numpy.random.normal(loc=0.025, scale=0.05, size=1000)
 
-        RandomSimulator.__init__(self, machineNames)
+        RandomSimulator.__init__(self, machineNames, **options)
 
     def randomizeProperty(self, nodeName, propertyName, associatedData=None):
         """
@@ -33,3 +33,21 @@ class UnevenLoadSimulator(RandomSimulator):
 
         else:
             return RandomSimulator.randomizeProperty(self, nodeName, propertyName, associatedData)
+
+    def randomWalkBiases(self):
+        """
+            Same biases as randomizeProperty, as per-node arrays for the vectorized state
+        """
+        biases = RandomSimulator.randomWalkBiases(self)
+
+        lowLoad = self.nodeState.mask(lambda nodeName: "machine1" in nodeName)
+        highLoad = self.nodeState.mask(lambda nodeName: "machine3" in nodeName) & ~lowLoad
+        biases['cpuUsage'] = {
+            'loc': numpy.where(lowLoad, -0.025, numpy.where(highLoad, 0.025, 0)),
+            'scale': numpy.where(lowLoad | highLoad, 0.05, 0.1)
+        }
+
+        # context switch rate follows the CPU usage
+        biases['contextSwitchRate'] = {'loc': 0, 'scale': 0.10, 'base': 'cpuUsage'}
+
+        return biases
@@ -3,12 +3,15 @@ var clientId;
 
 // The state of the entire cluster & the selected node
 var clusterState;
-var clusterStateHistory;
 var selectedNodeState;
 
 // The structure of the cluster
 var clusterStructure;
 
+// the tag of the structure of the cluster & map reduce tasks we have: snapshots only embed the structure again once it
+//  changed
+var topologyTag = null;
+
 // the cumulative logs of the cluster
 var clusterLogs = [];
 
@@ -21,6 +24,35 @@ var mapReduceStructure = {};
 // current time, used for map reduce tasks
 var currentTime = 0;
 
+// number of most recent events kept for each node (older ones can be paged in from the server)
+var maxNodeEvents = 20;
+
+// sequence number of the last tick applied to clusterState, and the simulator it came from
+var lastSequence = 0;
+var currentSimulator = 'random';
+
+// the recording being replayed (null when watching a live simulator)
+var currentRecording = null;
+
+// depth of the cluster tree we subscribe at (null for every node): the nodes at that depth stand for their whole
+//  subtree, and only hold its aggregates (mean & max usage, min health, event counts, earliest predicted failure)
+var subscribeDepth = null;
+
+// the parts of the cluster we subscribe to (comma separated subtree roots & nodes, and severities & facilities of the
+//  log events shown), e.g. for a wall display watching a single rack, given in the query string of the page
+var subscribeFilter = queryFilter();
+
+// the format of the updates we get: 'columnar' sends the metrics of the nodes changed at each tick as typed arrays
+//  (see decodeColumns), when the browser supports them
+var frameFormat = queryParameter('format') || (window.Float32Array && window.atob ? 'columnar' : 'json');
+
+// the names of the nodes, by the ids used in columnar updates
+var nodeNames = [];
+
+// the stream of updates from the server, when the browser supports server-sent events (otherwise, we long-poll)
+var streaming = !!window.EventSource;
+var eventSource = null;
+
 // The macro & micro visualizations (cluster & node)
 var visualization = null;
 var nodeVisualization = null;
@@ -38,6 +70,40 @@ function update(data) {
     // Only update if successful
     if(data['successful']) {
 
+        // We fell too far behind, and were sent a fresh snapshot of the simulator to start over from
+        if(data['resync']) {
+            console.log('Skipped ' + data['skipped'] + ' ticks, reloading the cluster state');
+            loadSnapshot(data);
+            if(!streaming) {
+                requestUpdate();
+            }
+            return;
+        }
+
+        // Ticks are sparse deltas, so they can only be applied in order: skip duplicates, and resynchronize
+        //  with a fresh snapshot of the simulator if we missed one (several ticks may be merged into one update)
+        var firstSequence = data.hasOwnProperty('firstSequence') ? data['firstSequence'] : data['sequence'];
+        if(data['sequence'] <= lastSequence) {
+            if(!streaming) {
+                requestUpdate();
+            }
+            return;
+        } else if(firstSequence > lastSequence + 1) {
+            console.log('Missed ' + (firstSequence - lastSequence - 1) + ' ticks, resynchronizing');
+            if(currentRecording != null) {
+                // restart the replay where it is, the next update is then a fresh snapshot
+                seekReplay(null);
+                if(!streaming) {
+                    requestUpdate();
+                }
+            } else {
+                stopUpdates();
+                changeDataCharacteristics(currentSimulator);
+            }
+            return;
+        }
+        lastSequence = data['sequence'];
+
         // Collect all new log entries
         var clusterData = data['cluster'];
         var updateData = clusterData['events'];
@@ -51,19 +117,20 @@ function update(data) {
             }
         }
 
-        // Update the global cluster state
+        // Update the global cluster state (with the metrics sent as columns, if any)
         var stateChange = clusterData['stateChange'];
+        if(clusterData.hasOwnProperty('columns')) {
+            decodeColumns(clusterData['columns'], stateChange);
+        }
         updateClusterState(stateChange);
         updateNodePopovers(stateChange);
 
-        //store history of cluster state
-        clusterStateHistory.push(deepCopy(clusterState));
-        if (clusterStateHistory.length > 50) {
-            clusterStateHistory.shift();
+        // Subscribed at a depth of the tree, we get the subtree aggregates that changed instead
+        if(clusterData.hasOwnProperty('aggregates')) {
+            updateClusterState(clusterData['aggregates']);
         }
 
-        mapReduceState = data['mapReduce']['state'];
-        mapReduceStructure = data['mapReduce']['topology'];
+        updateMapReduceState(data['mapReduce']);
 
         currentTime = data['time'];
 
@@ -83,38 +150,163 @@ function update(data) {
         }
 
         // Get next update
-        $.ajax({
-            url: '/update',
-            data: {
-                clientId: clientId
-            },
-            success: update,
-            error: logError,
-            dataType: 'json'
-        });
+        if(!streaming) {
+            requestUpdate();
+        }
 
+    } else if(data['message'] === 'Not subscribed') {
+        // the server forgot us (e.g. we did not ask for updates for a while)
+        resubscribe();
     } else {
         logError('Update failed: ' + data['message']);
     }
 }
 
+/**
+ * Start receiving updates from the server, streamed if possible
+ */
+function startUpdates() {
+    if(streaming) {
+        openStream();
+    } else {
+        requestUpdate();
+    }
+}
+
+/**
+ * Stop receiving streamed updates from the server
+ */
+function stopUpdates() {
+    if(eventSource != null) {
+        eventSource.close();
+        eventSource = null;
+    }
+}
+
+/**
+ * Open a stream of updates from the server (the browser reconnects on its own, resuming from the last tick received)
+ */
+function openStream() {
+    stopUpdates();
+    eventSource = new EventSource('/stream?clientId=' + clientId);
+
+    eventSource.onmessage = function(event) {
+        update(JSON.parse(event.data));
+    };
+
+    // we were too far behind to resume, start over from a fresh snapshot
+    eventSource.addEventListener('snapshot', function(event) {
+        loadSnapshot(JSON.parse(event.data));
+    });
+
+    // we moved to another simulator, or the server forgot us (e.g. we did not read the stream for a while)
+    eventSource.addEventListener('unsubscribed', function(event) {
+        stopUpdates();
+        if(!JSON.parse(event.data)['subscribed']) {
+            resubscribe();
+        }
+    });
+
+    // the server refused to resume the stream (it forgot us while we were disconnected)
+    eventSource.onerror = function() {
+        if(this === eventSource && this.readyState === EventSource.CLOSED) {
+            resubscribe();
+        }
+    };
+}
+
+/**
+ * Request the next ticks from the server (all the ticks available, merged into one update)
+ */
+function requestUpdate() {
+    $.ajax({
+        url: '/update',
+        data: {
+            clientId: clientId,
+            maxEvents: 50,
+            coalesce: true,
+            topologyTag: topologyTag
+        },
+        success: update,
+        error: logError,
+        dataType: 'json'
+    });
+}
+
+/**
+ * Decodes the metrics of the nodes sent as columns into a state change: for each metric, the base64 encoded ids of the
+ *  nodes changed (as uint32) and their new values (as float32)
+ * @param columns       the columns of each metric
+ * @param stateChange   the rest of the state change, to add the metrics to
+ */
+function decodeColumns(columns, stateChange) {
+    var severities = ['FATAL', 'ERROR', 'WARN', 'INFO'];
+    for(var metric in columns) {
+        if(columns.hasOwnProperty(metric)) {
+            var ids = new Uint32Array(decodeBase64(columns[metric]['nodes']));
+            var values = new Float32Array(decodeBase64(columns[metric]['values']));
+            for(var i = 0; i < ids.length; i++) {
+                var nodeName = nodeNames[ids[i]];
+                var nodeChange = stateChange[nodeName] || (stateChange[nodeName] = {});
+                if(severities.indexOf(metric) >= 0) {
+                    nodeChange['predictedSeverityProbabilities'] = nodeChange['predictedSeverityProbabilities'] || {};
+                    nodeChange['predictedSeverityProbabilities'][metric] = values[i];
+                } else {
+                    nodeChange[metric] = values[i];
+                }
+            }
+        }
+    }
+}
+
+
+/**
+ * Decodes a base64 string into the buffer of its bytes
+ */
+function decodeBase64(text) {
+    var binary = window.atob(text);
+    var bytes = new Uint8Array(binary.length);
+    for(var i = 0; i < binary.length; i++) {
+        bytes[i] = binary.charCodeAt(i);
+    }
+    return bytes.buffer;
+}
+
+
 /**
  * Update the cluster state based on the state change provided by the simulator
  */
 function updateClusterState(stateChange) {
+    applyStateChange(clusterState, stateChange);
+}
+
+
+/**
+ * Applies a state change to the given state (of the cluster, or of the map reduce jobs)
+ * @param state         the state to update
+ * @param stateChange   the changed properties of each node
+ */
+function applyStateChange(state, stateChange) {
     for(var nodeName in stateChange) {
-        if(stateChange.hasOwnProperty(nodeName)) {
+        if(stateChange.hasOwnProperty(nodeName) && state.hasOwnProperty(nodeName)) {
             for(var nodeProperty in stateChange[nodeName]) {
                 if(stateChange[nodeName].hasOwnProperty(nodeProperty)) {
                     var newNodeData = stateChange[nodeName][nodeProperty];
                     if(nodeProperty === 'events') {
+                        var nodeEvents = state[nodeName][nodeProperty];
                         for(var i in newNodeData) {
                             if(newNodeData.hasOwnProperty(i)) {
-                                clusterState[nodeName][nodeProperty].push(newNodeData[i]);
+                                nodeEvents.push(newNodeData[i]);
                             }
                         }
+                        if(nodeEvents.length > maxNodeEvents) {
+                            nodeEvents.splice(0, nodeEvents.length - maxNodeEvents);
+                        }
+                    } else if(nodeProperty === 'predictedSeverityProbabilities') {
+                        // only the changed severities are sent
+                        $.extend(state[nodeName][nodeProperty], newNodeData);
                     } else {
-                        clusterState[nodeName][nodeProperty] = newNodeData;
+                        state[nodeName][nodeProperty] = newNodeData;
                     }
                 }
             }
@@ -123,6 +315,185 @@ function updateClusterState(stateChange) {
 }
 
 
+/**
+ * Applies the map reduce tasks & jobs started, changed and ended since the last update to the map reduce state and
+ * structure
+ * @param delta the changes, see MapReduceSimulator.updates
+ */
+function updateMapReduceState(delta) {
+
+    // the children of collapsed nodes of the tree are kept in '_children'
+    var children = function(node) {
+        return (!node['children'] && node['_children']) ? '_children' : 'children';
+    };
+    var without = function(nodes, name) {
+        return $.grep(nodes, function(node) { return node['name'] !== name; });
+    };
+    var findTask = function(taskName) {
+        var tasks = mapReduceStructure[children(mapReduceStructure)] || [];
+        for (var i = 0; i < tasks.length; i++) {
+            if (tasks[i]['name'] === taskName) {
+                return tasks[i];
+            }
+        }
+        return null;
+    };
+    var i, task;
+
+    for (i = 0; i < delta['tasksStarted'].length; i++) {
+        mapReduceStructure[children(mapReduceStructure)].push({name: delta['tasksStarted'][i], children: []});
+    }
+
+    for (i = 0; i < delta['started'].length; i++) {
+        var job = delta['started'][i];
+        mapReduceState[job['name']] = job;
+        task = findTask(job['task']);
+        if (task != null) {
+            task[children(task)].push({name: job['name'], id: job['id'], start: job['start'], duration: job['duration'],
+                end: job['end'], location: job['location']});
+        }
+    }
+
+    applyStateChange(mapReduceState, delta['progress']);
+
+    for (i = 0; i < delta['ended'].length; i++) {
+        var jobName = delta['ended'][i];
+        if (mapReduceState.hasOwnProperty(jobName)) {
+            task = findTask(mapReduceState[jobName]['task']);
+            if (task != null) {
+                task[children(task)] = without(task[children(task)], jobName);
+            }
+            delete mapReduceState[jobName];
+        }
+    }
+
+    for (i = 0; i < delta['tasksCompleted'].length; i++) {
+        var key = children(mapReduceStructure);
+        mapReduceStructure[key] = without(mapReduceStructure[key], delta['tasksCompleted'][i]);
+    }
+}
+
+
+/**
+ * Fetch a page of older log events from the server, newest first
+ * @param query     the node, severity, start & end (seconds since the epoch) to filter by, and the 'before' cursor
+ *                  returned with the previous page
+ * @param callback  called with the events and the cursor for the next page (null when there are no more events)
+ */
+function fetchEvents(query, callback) {
+    $.ajax({
+        url: '/events',
+        data: $.extend({clientId: clientId}, query),
+        success: function(data) {
+            if(data['successful']) {
+                callback(data['events'], data['before']);
+            } else {
+                logError('Fetching events failed: ' + data['message']);
+            }
+        },
+        error: logError,
+        dataType: 'json'
+    });
+}
+
+
+/**
+ * Fetches the most at risk nodes of the cluster, as ranked by the server
+ * @param ranking   'predictedFailureTime', 'health' or 'fatalProbability'
+ * @param k         the number of nodes to fetch
+ * @param callback  called with the nodes, most at risk first
+ */
+function fetchAtRisk(ranking, k, callback) {
+    $.ajax({
+        url: '/atRisk',
+        data: {clientId: clientId, ranking: ranking, k: k},
+        success: function(data) {
+            if(data['successful']) {
+                callback(data['nodes']);
+            } else {
+                logError('Fetching at risk nodes failed: ' + data['message']);
+            }
+        },
+        error: logError,
+        dataType: 'json'
+    });
+}
+
+
+/**
+ * Fetches the history of the metrics of the cluster (or of a node and its descendants), kept by the server
+ * @param query     the node, comma separated metrics, start & end (seconds since the epoch) and resolution (seconds per
+ *                  sample, picked by the server by default)
+ * @param callback  called with the resolution, the times of the samples and the min, mean & max of each metric
+ */
+function fetchHistory(query, callback) {
+    $.ajax({
+        url: '/history',
+        data: $.extend({clientId: clientId}, query),
+        success: function(data) {
+            if(data['successful']) {
+                callback(data['resolution'], data['times'], data['series']);
+            } else {
+                logError('Fetching the history failed: ' + data['message']);
+            }
+        },
+        error: logError,
+        dataType: 'json'
+    });
+}
+
+
+/**
+ * Fetches the metrics of every node of the cluster at a past time, as kept by the server
+ * @param time      the time, in seconds since the epoch
+ * @param callback  called with the time of the closest sample before it, and the metrics of each node
+ */
+function fetchHistoryAt(time, callback) {
+    $.ajax({
+        url: '/historyAt',
+        data: {clientId: clientId, time: time},
+        success: function(data) {
+            if(data['successful']) {
+                callback(data['time'], data['nodes']);
+            } else {
+                logError('Fetching the cluster state at ' + time + ' failed: ' + data['message']);
+            }
+        },
+        error: logError,
+        dataType: 'json'
+    });
+}
+
+
+/**
+ * Fetches the children of a node of a large cluster, which are only sent when the node is first expanded
+ * @param name      the name of the node
+ * @param callback  called with the node's children
+ */
+function fetchSubtree(name, callback) {
+
+    // the nodes at the depth we subscribed at stand for their whole subtree, go one level deeper instead
+    if(subscribeDepth != null) {
+        changeLevelOfDetail(subscribeDepth + 1);
+        return;
+    }
+
+    $.ajax({
+        url: '/subtree',
+        data: {clientId: clientId, node: name},
+        success: function(data) {
+            if(data['successful']) {
+                callback(data['structure']['_children']);
+            } else {
+                logError('Fetching the children of ' + name + ' failed: ' + data['message']);
+            }
+        },
+        error: logError,
+        dataType: 'json'
+    });
+}
+
+
 /**
  * Changes the data characteristics represented by using a different simulator.
  * This requires a call to the server to ask to switch.
@@ -130,19 +501,37 @@ function updateClusterState(stateChange) {
  */
 function changeDataCharacteristics(simulatorName) {
 
+    currentSimulator = simulatorName;
+    currentRecording = null;
+
+    var data = subscriptionParameters();
+    data['clientId'] = clientId;
+    data['simulator'] = simulatorName;
+
     // Trigger an ajax call to the simulator server
     $.ajax({
         url: '/changeSimulator',
-        data: {
-            clientId: clientId,
-            simulator: simulatorName
-        },
+        data: data,
         success: changeDataCharacteristicsSuccess,
         error: logError,
         dataType: 'json'
     });
 }
 
+/**
+ * Changes the depth of the cluster tree we subscribe at, starting over from a fresh snapshot of the simulator
+ * @param depth the depth (null for every node)
+ */
+function changeLevelOfDetail(depth) {
+    subscribeDepth = depth;
+    if(depth != null) {
+        // the server sends either the aggregates at a depth, or the filtered nodes
+        subscribeFilter = {};
+    }
+    stopUpdates();
+    changeDataCharacteristics(currentSimulator);
+}
+
 /**
  * Called after successfully changing the simulator.
  * @param data the data sent back from the server
@@ -150,42 +539,132 @@ function changeDataCharacteristics(simulatorName) {
 function changeDataCharacteristicsSuccess(data) {
 
     if (data.hasOwnProperty("successful") && data['successful']) {
-        clusterState = data['currentState']['cluster'];
-        clusterStateHistory = [deepCopy(clusterState)];
-        clusterStructure = data['structure']['cluster'];
-        mapReduceState = data['currentState']['mapReduce'];
-        mapReduceStructure = data['structure']['mapReduce'];
-        clusterLogs = [];
+        loadSnapshot(data);
 
-        buildRacksData();
-        updateRightSideBar();
+        // Start receiving updates
+        startUpdates();
+    }
+    else {
+        logError(data);
+    }
+}
 
-        // Reload the current visualization with the new data
-        if (visualization instanceof SplomVisualization) {
-            var predictionMatrix = $("#theiusNavBar .active").attr("id") === "predictionMatrixLink";
-            var navItem = predictionMatrix ? 'predictionMatrixLink' : 'usageMatrixLink';
-            changeVisualization(new SplomVisualization(clusterStructure, clusterState, predictionMatrix), navItem);
-        }
-        else {
-            visualization.setStructure(clusterStructure);
-            visualization.setState(clusterState);
-            visualization.update();
-        }
+/**
+ * Fetches the recordings of past simulations that can be replayed
+ * @param callback  called with the recordings (name, and clock times of their start & end, in seconds since the epoch)
+ */
+function fetchRecordings(callback) {
+    $.ajax({
+        url: '/recordings',
+        success: function(data) {
+            if(data['successful']) {
+                callback(data['recordings']);
+            } else {
+                logError('Fetching recordings failed: ' + data['message']);
+            }
+        },
+        error: logError,
+        dataType: 'json'
+    });
+}
+
+/**
+ * Replaces the simulator with the replay of a recording
+ * @param recording the name of the recording
+ * @param speed     the speed of the replay, as a multiple of the recorded pace (or 'max')
+ * @param time      the clock time to start replaying from, in seconds since the epoch (null for the start)
+ */
+function replayRecording(recording, speed, time) {
+
+    currentRecording = recording;
+
+    var data = {clientId: clientId, recording: recording, speed: speed};
+    if(time != null) {
+        data['time'] = time;
+    }
+
+    stopUpdates();
+    $.ajax({
+        url: '/replay',
+        data: data,
+        success: changeDataCharacteristicsSuccess,
+        error: logError,
+        dataType: 'json'
+    });
+}
+
+/**
+ * Jumps the replay to another time. The updates then start over from a fresh snapshot.
+ * @param time  the clock time to jump to, in seconds since the epoch (null to stay where the replay is)
+ */
+function seekReplay(time) {
+    controlReplay('/seek', time != null ? {time: time} : {});
+}
+
+/**
+ * Changes the speed of the replay
+ * @param speed the speed, as a multiple of the recorded pace (or 'max')
+ */
+function setReplaySpeed(speed) {
+    controlReplay('/replaySpeed', {speed: speed});
+}
+
+function controlReplay(url, data) {
+    $.ajax({
+        url: url,
+        data: $.extend({clientId: clientId}, data),
+        success: function(data) {
+            if(!data['successful']) {
+                logError('Controlling the replay failed: ' + data['message']);
+            }
+        },
+        error: logError,
+        dataType: 'json'
+    });
+}
+
+
+/**
+ * Replace the state of the cluster with a snapshot sent by the server
+ * @param data the snapshot sent by the server
+ */
+function loadSnapshot(data) {
+
+    clusterState = data['currentState']['cluster'];
+    nodeNames = data['currentState']['nodeNames'] || [];
+    lastSequence = data['sequence'];
+    currentTime = data['time'];
+    mapReduceState = data['currentState']['mapReduce'];
+    clusterLogs = [];
+    loadStructure(data);
 
-        // Start calling the AJAX update loop
-        $.ajax({
-            url: '/update',
-            data: {
-                clientId: clientId
-            },
-            success: update,
-            error: logError,
-            dataType: 'json'
-        });
+    buildRacksData();
+    updateRightSideBar();
+
+    // Reload the current visualization with the new data
+    if (visualization instanceof SplomVisualization) {
+        var predictionMatrix = $("#theiusNavBar .active").attr("id") === "predictionMatrixLink";
+        var navItem = predictionMatrix ? 'predictionMatrixLink' : 'usageMatrixLink';
+        changeVisualization(new SplomVisualization(clusterStructure, clusterState, predictionMatrix), navItem);
     }
     else {
-        logError(data);
+        visualization.setStructure(clusterStructure);
+        visualization.setState(clusterState);
+        visualization.update();
+    }
+}
+
+
+/**
+ * Keeps the structure sent with a snapshot (which leaves it out if the one we have did not change)
+ * @param data the snapshot sent by the server
+ */
+function loadStructure(data) {
+    if(data.hasOwnProperty('structure')) {
+        clusterStructure = data['structure']['cluster'];
+        mapReduceStructure = data['structure']['mapReduce'];
     }
+    topologyTag = data['topologyTag'];
 }
 
 
@@ -197,7 +676,7 @@ function subscribe() {
     // Trigger an ajax call to the simulator server
     $.ajax({
         url: '/subscribe',
-        data: {},
+        data: subscriptionParameters(),
         success: subscribeSuccess,
         error: logError,
         dataType: 'json'
@@ -205,6 +684,90 @@ function subscribe() {
 }
 
 
+/**
+ * Subscribe again once the server forgot us, to the simulator we were watching, starting over from a fresh snapshot
+ */
+function resubscribe() {
+    console.log('No longer subscribed, subscribing again');
+    stopUpdates();
+
+    $.ajax({
+        url: '/subscribe',
+        data: subscriptionParameters(),
+        success: function(data) {
+            if(!data.hasOwnProperty('clientId')) {
+                logError('Subscribing again failed: ' + data['message']);
+                return;
+            }
+            clientId = data['clientId'];
+
+            // new clients watch the random simulator
+            if(currentSimulator != 'random') {
+                changeDataCharacteristics(currentSimulator);
+            } else {
+                currentRecording = null;
+                loadSnapshot(data);
+                startUpdates();
+            }
+        },
+        error: logError,
+        dataType: 'json'
+    });
+}
+
+
+/**
+ * Builds the parameters of our subscription: the depth of the cluster tree, or the parts of the cluster we subscribe to
+ */
+function subscriptionParameters() {
+    var parameters = {};
+    for(var name in subscribeFilter) {
+        if(subscribeFilter.hasOwnProperty(name)) {
+            parameters[name] = subscribeFilter[name];
+        }
+    }
+    if(subscribeDepth != null) {
+        parameters['depth'] = subscribeDepth;
+    }
+    parameters['format'] = frameFormat;
+    if(topologyTag != null) {
+        parameters['topologyTag'] = topologyTag;
+    }
+    return parameters;
+}
+
+
+/**
+ * Reads the parts of the cluster to subscribe to from the query string of the page (e.g. '?roots=rack1&severities=FATAL')
+ */
+function queryFilter() {
+    var filter = {};
+    var names = ['roots', 'nodes', 'severities', 'facilities'];
+    for(var i = 0; i < names.length; i++) {
+        var value = queryParameter(names[i]);
+        if(value) {
+            filter[names[i]] = value;
+        }
+    }
+    return filter;
+}
+
+
+/**
+ * Reads a parameter from the query string of the page (null if it is not there)
+ */
+function queryParameter(name) {
+    var query = window.location.search.substring(1).split('&');
+    for(var i = 0; i < query.length; i++) {
+        var pair = query[i].split('=');
+        if(pair[0] === name && pair[1]) {
+            return decodeURIComponent(pair[1]);
+        }
+    }
+    return null;
+}
+
+
 /**
  * Build a list of the racks
  */
@@ -245,11 +808,12 @@ function subscribeSuccess(data) {
     // Get info returned from simulator on subscribe
     clientId = data['clientId'];
     clusterState = data['currentState']['cluster'];
-    clusterStateHistory = [deepCopy(clusterState)];
-    clusterStructure = data['structure']['cluster'];
+    nodeNames = data['currentState']['nodeNames'] || [];
+    lastSequence = data['sequence'];
+    currentTime = data['time'];
     mapReduceState = data['currentState']['mapReduce'];
-    mapReduceStructure = data['structure']['mapReduce'];
     clusterLogs = [];
+    loadStructure(data);
 
     // Add the 'rack' to each node
     buildRacksData();
@@ -260,16 +824,8 @@ function subscribeSuccess(data) {
     // Build the default visualization
     changeVisualization(new TreeVisualization(clusterStructure, clusterState), 'treeLink')  ;
 
-    // Start calling the AJAX update loop
-    $.ajax({
-        url: '/update',
-        data: {
-            clientId: clientId
-        },
-        success: update,
-        error: logError,
-        dataType: 'json'
-    });
+    // Start receiving updates
+    startUpdates();
 }
 
 
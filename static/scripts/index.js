@@ -134,12 +134,26 @@ function generateNodePopoverContent(node, skipStyling) {
     var style1 = skipStyling ? '' : "style='width:220px;'";
     var style2 = skipStyling ? '' : "style='width:90px;'";
 
+    // nodes standing for a subtree (see subscribeDepth) hold the aggregates of its machines
+    if(node.hasOwnProperty('machineCount')) {
+        return "<table>" +
+            "<tr><td" + style1 + "><b>Machines:&nbsp;&nbsp;</b></td><td" + style2 + ">" + node['machineCount'] + "</td></tr>" +
+            "<tr><td><b>Mean / Max CPU Usage:&nbsp;&nbsp;</b></td><td>" + formatNum(node['cpuUsage']) + " / " + formatNum(node['maxCpuUsage']) + "</td></tr>" +
+            "<tr><td><b>Mean / Max Memory Usage:&nbsp;&nbsp;</b></td><td>" + formatNum(node['memoryUsage']) + " / " + formatNum(node['maxMemoryUsage']) + "</td></tr>" +
+            "<tr><td><b>Mean Context Switch Rate:&nbsp;&nbsp;</b></td><td>" + formatNum(node['contextSwitchRate']) + "</td></tr>" +
+            "<tr><td><b>Earliest Predicted Failure:&nbsp;&nbsp;</b></td><td>" + formatTime(node['predictedFailureTime']) + "</td></tr>" +
+            "<tr><td><b>FATAL / ERROR Events:&nbsp;&nbsp;</b></td><td>" + node['eventCounts']['FATAL'] + " / " + node['eventCounts']['ERROR'] + "</td></tr>" +
+            "<tr><td><b>WARN / INFO Events:&nbsp;&nbsp;</b></td><td>" + node['eventCounts']['WARN'] + " / " + node['eventCounts']['INFO'] + "</td></tr>" +
+            "<tr><td><b>Worst Health:&nbsp;&nbsp;</b></td><td>" + formatNum(node['health']) + "</td></tr>" +
+            "</table>";
+    }
+
     return "<table>" +
         "<tr><td" + style1 + "><b>CPU Usage:&nbsp;&nbsp;</b></td><td" + style2 + ">" + formatNum(node['cpuUsage']) + "</td></tr>" +
         "<tr><td><b>Memory Usage:&nbsp;&nbsp;</b></td><td>" + formatNum(node['memoryUsage']) + "</td></tr>" +
         "<tr><td><b>Context Switch Rate:&nbsp;&nbsp;</b></td><td>" + formatNum(node['contextSwitchRate']) + "</td></tr>" +
-        "<tr><td><b>Last Failure Time:&nbsp;&nbsp;</b></td><td>" + node['lastFailureTime'] + "</td></tr>" +
-        "<tr><td><b>Predicted Failure Time:&nbsp;&nbsp;</b></td><td>" + node['predictedFailureTime'] + "</td></tr>" +
+        "<tr><td><b>Last Failure Time:&nbsp;&nbsp;</b></td><td>" + formatTime(node['lastFailureTime']) + "</td></tr>" +
+        "<tr><td><b>Predicted Failure Time:&nbsp;&nbsp;</b></td><td>" + formatTime(node['predictedFailureTime']) + "</td></tr>" +
         "<tr><td><b>Prob of FATAL Event:&nbsp;&nbsp;</b></td><td>" + formatNum(node['predictedSeverityProbabilities']['FATAL']) + "</td></tr>" +
         "<tr><td><b>Prob of ERROR Event:&nbsp;&nbsp;</b></td><td>" + formatNum(node['predictedSeverityProbabilities']['ERROR']) + "</td></tr>" +
         "<tr><td><b>Prob of WARN Event:&nbsp;&nbsp;</b></td><td>" + formatNum(node['predictedSeverityProbabilities']['WARN']) + "</td></tr>" +
@@ -33,10 +33,26 @@ function updateRankings(state) {
     var key = $("#rankings-data li.active").attr("name");
     var ascending = $("#rankings-order li.active").text() === "Ascending";
 
-    // put state into array first, and sort
+    // the server keeps the least healthy machines of the whole cluster ranked, no need to sort it (clients of parts of
+    //  the cluster, or of a depth of its tree, rank the nodes they have instead, see subscribeFilter & subscribeDepth)
+    var wholeCluster = subscribeDepth == null && !subscribeFilter['roots'] && !subscribeFilter['nodes'];
+    if (key === 'health' && ascending && wholeCluster) {
+        fetchAtRisk('health', 10, function(nodes) {
+            var stateArray = [];
+            for (var i = 0; i < nodes.length; i++) {
+                if (state.hasOwnProperty(nodes[i]['name'])) {
+                    stateArray.push(state[nodes[i]['name']]);
+                }
+            }
+            showRankings(stateArray, key);
+        });
+        return;
+    }
+
+    // put state into array first, and sort (at a depth of the tree, each node stands for its subtree)
     var stateArray = [];
     for (var i in state) {
-        if (state.hasOwnProperty(i) && i.search("machine") != -1) {
+        if (state.hasOwnProperty(i) && (subscribeDepth != null || i.search("machine") != -1)) {
             stateArray.push(state[i]);
         }
     }
@@ -53,12 +69,29 @@ function updateRankings(state) {
     });
 
     //only take first 10 sorted elements
-    stateArray = stateArray.slice(0,10);
+    showRankings(stateArray.slice(0,10), key);
+}
 
+/**
+ * Shows the given (ranked) nodes in the Rankings tab
+ * @param stateArray    the state of the nodes to show
+ * @param key           the property the nodes are ranked by
+ */
+function showRankings(stateArray, key) {
     //helper functions for D3
     var text = function(d) { return d.name + ": " + (d[key] * 100).toFixed(0) + "%"};
     var linkedTitle = function(d) { return "<a href='javascript:createNodeVisualization(\"" + d.name + "\")'>Node '" + d.name + "'</a>";};
     var probabilitiesData = function(d) {
+        // nodes standing for a subtree (see subscribeDepth) hold its event counts instead
+        if (d.hasOwnProperty('eventCounts')) {
+            return "<h4>Events (" + d.machineCount + " machines):</h4><br/>" +
+                "<div style='margin-left:10px;'>" +
+                    "FATAL: " + d.eventCounts.FATAL + "<br/>" +
+                    "ERROR: " + d.eventCounts.ERROR + "<br/>" +
+                    "WARN: " + d.eventCounts.WARN + "<br/>" +
+                    "INFO: " + d.eventCounts.INFO + "<br/>" +
+                "</div><br/>";
+        }
         return "<h4>Probabilities of Events:</h4><br/>" +
             "<div style='margin-left:10px;'>" +
                 "FATAL: " + d.predictedSeverityProbabilities.FATAL.toFixed(2) + "<br/>" +
@@ -67,8 +100,8 @@ function updateRankings(state) {
                 "INFO: " + d.predictedSeverityProbabilities.INFO.toFixed(2) + "<br/>" +
             "</div><br/>";
     };
-    var predictedFailureTime = function(d) { return "<b>Predicted Failure:</b><br/><br/>&nbsp;&nbsp;&nbsp;" + d.predictedFailureTime + "<br/><br/>"; };
-    var lastFailureTime = function(d) { return "<b>Last Failure:</b><br/><br/>&nbsp;&nbsp;&nbsp;" + d.lastFailureTime; };
+    var predictedFailureTime = function(d) { return "<b>Predicted Failure:</b><br/><br/>&nbsp;&nbsp;&nbsp;" + formatTime(d.predictedFailureTime) + "<br/><br/>"; };
+    var lastFailureTime = function(d) { return d.hasOwnProperty('lastFailureTime') ? "<b>Last Failure:</b><br/><br/>&nbsp;&nbsp;&nbsp;" + formatTime(d.lastFailureTime) : ""; };
 
     $('#rankingsData').children().remove();
 
@@ -135,7 +168,7 @@ function updateEvents(logs) {
     // grab last ten logs
     var lastLogs = logs.slice(-20).reverse();
 
-    var header = function(d) { return d.timestamp + " " + d.severity };
+    var header = function(d) { return formatTime(d.timestamp) + " " + d.severity };
     var h1 = function(d) { return "Log #" + d.id; };
     var div1 = function(d) { return "Facility : " + d.facility; };
     var div2 = function(d) { return "Location : " + d.location; };
@@ -230,9 +263,19 @@ function updateGeneralTab(state, logs) {
 
     // Tally the total logs associated with all nodes
     var logsCollected = 0;
-    for(var name in clusterState) {
-        if(clusterState.hasOwnProperty(name)) {
-            logsCollected += clusterState[name].events.length;
+    var root = clusterState[clusterStructure.name];
+    if(root && root.hasOwnProperty('eventCounts')) {
+        // subscribed at a depth of the tree (see subscribeDepth), the root holds the event counts of the whole cluster
+        for(var severity in root.eventCounts) {
+            if(root.eventCounts.hasOwnProperty(severity)) {
+                logsCollected += root.eventCounts[severity];
+            }
+        }
+    } else {
+        for(var name in clusterState) {
+            if(clusterState.hasOwnProperty(name)) {
+                logsCollected += clusterState[name].events.length;
+            }
         }
     }
 
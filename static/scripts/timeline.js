@@ -9,9 +9,11 @@
 function showTimeline() {
     var dataSet = $("#sizeDataSetSelector option:selected").val();
     $("#timelineDiv").fadeIn();
-    var history = deepCopy(clusterStateHistory);
-    var data = getData(clusterStateHistory, dataSet);
-    drawTimeline(data, history, dataSet);
+
+    // the history of the last hour is kept by the server, at a resolution that fits it (the mean over the cluster)
+    fetchHistory({metrics: dataSet}, function(resolution, times, series) {
+        drawTimeline(series[dataSet]['mean'], times, dataSet);
+    });
 }
 
 function hideTimeline() {
@@ -20,31 +22,11 @@ function hideTimeline() {
     visualization.update();
 }
 
-function getData(history, dataSet) {
-    var data = [];
-    for (var i in history) {
-        if (history.hasOwnProperty(i)) {
-            var point = history[i],
-                result = 0,
-                count = 0;
-
-            for (var j in point) {
-                if (point.hasOwnProperty(j)) {
-                    var node = point[j];
-                    var datum = node[dataSet];
-                    result += datum;
-                    count += 1;
-                }
-            }
+function drawTimeline(data, times, dataSet) {
 
-            data.push(result / count);
-        }
+    if (data.length == 0) {
+        return;
     }
-    //data.push(0);
-    return data;
-}
-
-function drawTimeline(data, history, dataSet) {
 
     var width = $("#timeline").width();
     var height = $("#timeline").height();
@@ -147,9 +129,24 @@ function drawTimeline(data, history, dataSet) {
         $(".background").hide();
     }
 
+    var shownIndex = null;
     function updateDataSets(index) {
-        visualization.setState(history[index]);
-        visualization.update();
+        index = Math.max(0, Math.min(index, times.length - 1));
+        if (index === shownIndex) {
+            return;
+        }
+        shownIndex = index;
+
+        // show the metrics of the cluster at that time, as kept by the server
+        fetchHistoryAt(times[index], function(time, nodes) {
+            var state = deepCopy(clusterState);
+            for (var nodeName in nodes) {
+                if (nodes.hasOwnProperty(nodeName) && state.hasOwnProperty(nodeName)) {
+                    $.extend(true, state[nodeName], nodes[nodeName]);
+                }
+            }
+            visualization.setState(state);
+            visualization.update();
+        });
     }
 }
-
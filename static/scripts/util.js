@@ -15,4 +15,19 @@ function getCompoundKeyFromDict(dictionary, key) {
 
 function deepCopy(obj) {
     return jQuery.extend(true, {}, obj);
-}
\ No newline at end of file
+}
+
+/**
+ * Formats a time sent by the server for display. Servers sending times as strings have already formatted them, times
+ * sent as seconds since the epoch are formatted like the server's default ('dd/mm/yy HH:MM')
+ */
+function formatTime(time) {
+    if (typeof time !== 'number') {
+        return time;
+    }
+
+    var date = new Date(time * 1000);
+    var pad = function(value) { return (value < 10 ? '0' : '') + value; };
+    return pad(date.getDate()) + '/' + pad(date.getMonth() + 1) + '/' + pad(date.getFullYear() % 100) + ' ' +
+        pad(date.getHours()) + ':' + pad(date.getMinutes());
+}
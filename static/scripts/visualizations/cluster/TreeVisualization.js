@@ -331,6 +331,17 @@ function TreeVisualization(structure, state, mapReduce) {
             .attr("class", "treeVisualizationNode")
             .on("click", function(d) {
                 if(d.hasOwnProperty('children')) {
+
+                    // children of large clusters are only fetched when the node is first expanded
+                    if (!d.children && !d._children && d.childCount) {
+                        fetchSubtree(d.name, function(children) {
+                            d._children = children;
+                            toggle(d);
+                            redrawGraph(d);
+                        });
+                        return;
+                    }
+
                     toggle(d);
                     redrawGraph(d);
                 } else if (!mapReduce) {
@@ -0,0 +1,43 @@
+import unittest
+from src.Scenarios import randomSimulator
+from src.simulator.AtRiskIndex import AtRiskIndex
+from src.simulator.Clock import VirtualClock
+
+__author__ = 'Roman'
+
+class AtRiskIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        # times are sent as seconds since the epoch, so the state can be ranked as the index ranks the raw times
+        self.simulator = randomSimulator(VirtualClock(0, 1), timeFormat='epoch')
+        for i in xrange(0, 300):
+            self.simulator.tick()
+            self.simulator.step()
+        self.clusterSimulator = self.simulator.clusterSimulator
+
+    def bruteForceKeys(self, ranking):
+        """
+            Returns the key of each node of the state for the given ranking, as formatted in the state
+        """
+        keyFunction = AtRiskIndex.RANKINGS[ranking]
+        return dict((nodeName, keyFunction(node)) for nodeName, node in self.clusterSimulator.state().iteritems())
+
+    def formatKey(self, ranking, key):
+        return self.clusterSimulator.timeFormatter.format(key) if ranking == 'predictedFailureTime' else key
+
+    def testTopMatchesBruteForce(self):
+        nodeCount = len(self.clusterSimulator.machineNames)
+        for ranking in AtRiskIndex.RANKINGS:
+            keys = self.bruteForceKeys(ranking)
+            for k in (1, 20, nodeCount):
+                top = self.clusterSimulator.atRiskIndex.top(ranking, k)
+
+                # nodes with the same key may be ranked in any order, so compare the keys of the nodes rank by rank
+                self.assertEqual([self.formatKey(ranking, rankingKeys[ranking]) for nodeName, rankingKeys in top],
+                                 sorted(keys.itervalues())[:k])
+                for nodeName, rankingKeys in top:
+                    self.assertEqual(self.formatKey(ranking, rankingKeys[ranking]), keys[nodeName])
+                self.assertEqual(len(set(nodeName for nodeName, rankingKeys in top)), len(top))
+
+if __name__ == '__main__':
+    unittest.main()
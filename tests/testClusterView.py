@@ -0,0 +1,71 @@
+from base64 import b64decode
+from json import loads
+import unittest
+import numpy
+from src.Scenarios import randomSimulator
+from src.simulator import ClusterView
+from src.simulator.Clock import VirtualClock
+
+__author__ = 'Roman'
+
+class SubtreeIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.subtreeIndex = randomSimulator(VirtualClock(0, 1)).subtreeIndex
+
+    def testUnknownNodesAreNotCached(self):
+        root = self.subtreeIndex.selection((), ())
+        for i in xrange(0, 1000):
+            self.assertEqual(self.subtreeIndex.selection(('unknown%d' % i,), ()), ([0], [1]))
+        self.assertEqual(self.subtreeIndex.selection(('rack1', 'unknown'), ()), self.subtreeIndex.selection(('rack1',), ()))
+        self.assertEqual(len(self.subtreeIndex.selections), 3)
+        self.assertEqual(root, ([0], [len(self.subtreeIndex.names)]))
+
+    def testSelectionsAreBounded(self):
+        names = self.subtreeIndex.names
+        for i in xrange(0, ClusterView.MAX_SELECTIONS + 50):
+            self.subtreeIndex.selection((), (names[i % len(names)], names[i // len(names) % len(names)]))
+        self.assertEqual(len(self.subtreeIndex.selections), ClusterView.MAX_SELECTIONS)
+
+
+class ColumnarViewTest(unittest.TestCase):
+
+    def setUp(self):
+        self.simulator = randomSimulator(VirtualClock(0, 1))
+
+    def decodeColumns(self, view, ticks):
+        """
+            Returns the names of the nodes of the view, and map from node name to the cpuUsage sent for it by the view
+            over the given number of ticks
+        """
+        nodeNames = loads(self.simulator.takeSnapshot().view(view)[0])['nodeNames']
+        usages = {}
+        for i in xrange(0, ticks):
+            self.simulator.tick()
+            column = loads(self.simulator.step().view(view))['cluster']['columns'].get('cpuUsage')
+            if column is not None:
+                ids = numpy.frombuffer(b64decode(column['nodes']), dtype='<u4')
+                values = numpy.frombuffer(b64decode(column['values']), dtype='<f4')
+                for nodeId, value in zip(ids.tolist(), values.tolist()):
+                    usages[nodeNames[nodeId]] = value
+        return nodeNames, usages
+
+    def testFilteredNodeNames(self):
+        nodeNames, usages = self.decodeColumns(ClusterView.ColumnarView(ClusterView.FilterView(roots=('rack2',))), 20)
+
+        self.assertEqual(nodeNames[:2], ['master', 'rack2'])
+        self.assertTrue(all(name.startswith('machine2-') for name in nodeNames[2:]))
+        self.assertTrue(len(usages) > 0)
+        for name, usage in usages.iteritems():
+            self.assertAlmostEqual(usage, self.simulator.clusterSimulator.nodeState[name]['cpuUsage'], places=5)
+
+    def testWholeClusterNodeNames(self):
+        nodeNames, usages = self.decodeColumns(ClusterView.ColumnarView(), 20)
+
+        self.assertEqual(nodeNames, self.simulator.subtreeIndex.names)
+        self.assertTrue(len(usages) > 0)
+        for name, usage in usages.iteritems():
+            self.assertAlmostEqual(usage, self.simulator.clusterSimulator.nodeState[name]['cpuUsage'], places=5)
+
+if __name__ == '__main__':
+    unittest.main()
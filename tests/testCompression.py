@@ -0,0 +1,65 @@
+import unittest
+import zlib
+from src.Scenarios import randomSimulator
+from src.SimulatorInterface import framePiece, snapshotPieces
+from src.simulator.Clock import VirtualClock
+from src.simulator.Compression import CompressedStream, compressPieces, joinPieces
+
+__author__ = 'Roman'
+
+# window bits zlib decodes each content coding with
+WINDOW_BITS = {'gzip': 16 + zlib.MAX_WBITS, 'deflate': zlib.MAX_WBITS}
+
+class CompressionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.simulator = randomSimulator(VirtualClock(0, 1))
+        self.frames = []
+        for i in xrange(0, 5):
+            self.simulator.tick()
+            self.frames.append(self.simulator.step())
+
+    def assertRoundTrip(self, pieces):
+        for encoding, windowBits in WINDOW_BITS.iteritems():
+            self.assertEqual(zlib.decompress(compressPieces(pieces, encoding), windowBits), joinPieces(pieces))
+
+    def testSharedChunksRoundTrip(self):
+        snapshot = self.simulator.snapshot
+        pieces = snapshotPieces(snapshot, clientId=1)
+        self.assertRoundTrip(pieces)
+
+        # the shared pieces are compressed once, then reused by every response they are part of
+        chunks = dict(snapshot.chunks)
+        self.assertTrue(chunks)
+        self.assertRoundTrip(snapshotPieces(snapshot, successful=True, resync=True, skipped=3))
+        self.assertEqual(snapshot.chunks, chunks)
+
+        batch = ['{"successful": true, "batch": true, "frames": [']
+        for frame in reversed(self.frames):
+            if len(batch) > 1:
+                batch.append(', ')
+            batch.append(framePiece(frame, None))
+        batch.append(']}')
+        self.assertRoundTrip(batch)
+        self.assertRoundTrip([framePiece(self.frames[0], None)] * 3)
+
+    def testEmptyResponseRoundTrips(self):
+        self.assertRoundTrip([])
+        self.assertRoundTrip([''])
+
+    def testStreamDecodesEachEventAsItArrives(self):
+        for encoding, windowBits in WINDOW_BITS.iteritems():
+            stream = CompressedStream(encoding)
+            decompressor = zlib.decompressobj(windowBits)
+            self.assertEqual(decompressor.decompress(stream.header()), '')
+
+            for frame in self.frames:
+                event = ['id: %d\ndata: ' % frame.sequence, framePiece(frame, None), '\n\n']
+                compressed = ''.join(stream.write(piece) for piece in event)
+                self.assertEqual(decompressor.decompress(compressed), joinPieces(event))
+
+            self.assertEqual(decompressor.decompress(stream.end()) + decompressor.flush(), '')
+            self.assertTrue(decompressor.unused_data == '')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,23 @@
+import unittest
+from src.simulator.Instrumentation import Instrumentation
+
+__author__ = 'Roman'
+
+class InstrumentationTest(unittest.TestCase):
+
+    def testJsonAndTextBucketsAgree(self):
+        instruments = Instrumentation()
+        histogram = instruments.histogram('test_seconds', 'Test', ('kind',), buckets=(1, 2))
+        for value in (0.5, 1.5, 1.5, 3):
+            histogram.labels(kind='a').observe(value)
+
+        metric = instruments.json()['test_seconds']['metrics'][0]
+        self.assertEqual(metric['buckets'], [[1, 1], [2, 3], ['+Inf', 4]])
+        self.assertEqual(metric['count'], 4)
+
+        text = instruments.text()
+        for bound, cumulative in metric['buckets']:
+            self.assertIn('test_seconds_bucket{kind="a",le="%s"} %d\n' % (bound, cumulative), text)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,23 @@
+import unittest
+from src.simulator.MetricsHistory import MetricsHistory
+
+__author__ = 'Roman'
+
+class MetricsHistoryTest(unittest.TestCase):
+
+    def size(self, history):
+        return sum(values.nbytes for level in history.levels.itervalues()
+                   for statistics in level.data.itervalues() for values in statistics.itervalues())
+
+    def testSmallClusterKeepsDefaultCapacities(self):
+        history = MetricsHistory(['machine%d' % i for i in xrange(0, 100)])
+        self.assertEqual(dict((resolution, level.capacity) for resolution, level in history.levels.iteritems()),
+                         MetricsHistory.DEFAULT_CAPACITIES)
+
+    def testLargeClusterFitsInMemoryBudget(self):
+        history = MetricsHistory(['machine%d' % i for i in xrange(0, 100000)])
+        self.assertLessEqual(self.size(history), MetricsHistory.MEMORY_BUDGET)
+        self.assertTrue(all(level.capacity >= MetricsHistory.MIN_CAPACITY for level in history.levels.itervalues()))
+
+if __name__ == '__main__':
+    unittest.main()
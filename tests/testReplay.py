@@ -0,0 +1,114 @@
+import shutil
+import tempfile
+import unittest
+from src.Scenarios import randomSimulator
+from src.simulator.Clock import VirtualClock
+from src.simulator.ReplaySimulator import ReplaySimulator
+from src.simulator.TickRing import Resync
+
+__author__ = 'Roman'
+
+class ReplaySimulatorTest(unittest.TestCase):
+
+    # ticks recorded, with a keyframe every 100 of them (see Recorder)
+    TICKS = 250
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+        # the frames produced, and the clock time at which each was recorded
+        simulator = randomSimulator(VirtualClock(0, 1), recordTo=self.directory)
+        self.frames = []
+        self.times = []
+        for i in xrange(0, self.TICKS):
+            simulator.tick()
+            self.frames.append(simulator.step())
+            self.times.append(simulator.clock.time())
+        simulator.stopRecording()
+
+        self.replay = None
+
+    def tearDown(self):
+        if self.replay is not None:
+            self.replay.reader.close()
+        shutil.rmtree(self.directory)
+
+    def replayed(self, clientId):
+        """
+            Reads every log available to the client (a Resync first, if it has to start over)
+        """
+        logs = []
+        while True:
+            read = self.replay.pollLogs(clientId, self.replay.ring.capacity)
+            if read == []:
+                return logs
+            logs.extend([read] if isinstance(read, Resync) else read)
+
+    def testReplaysEveryFrame(self):
+        self.replay = ReplaySimulator(self.directory, speed=None)
+        snapshot = self.replay.addClient(1)
+        self.assertEqual(snapshot.version, 0)
+
+        # step through the recording (as the replay thread would), reading along so the client never falls behind
+        frames = []
+        while self.replay.getSequence() < self.TICKS:
+            self.replay.step()
+            frames.extend(self.replayed(1))
+
+        self.assertEqual([frame.sequence for frame in frames], range(1, self.TICKS + 1))
+        self.assertEqual([frame.encoded for frame in frames], [frame.encoded for frame in self.frames])
+        self.assertEqual(self.replay.getTimestamp(), self.times[-1])
+
+    def seekTo(self, timestamp):
+        """
+            Seeks a new replay to the given clock time, and returns what its client reads next
+        """
+        self.replay = ReplaySimulator(self.directory, speed=None)
+        self.replay.addClient(1)
+        self.replay.seekTo(timestamp)
+        return self.replayed(1)
+
+    def testSeekBetweenKeyframes(self):
+        logs = self.seekTo(self.times[149])
+
+        # back to the keyframe after tick 100, then every tick up to the time sought
+        self.assertTrue(isinstance(logs[0], Resync))
+        self.assertEqual(logs[0].snapshot.version, 100)
+        self.assertEqual([frame.sequence for frame in logs[1:]], range(101, 151))
+        self.assertEqual(self.replay.getTimestamp(), self.times[149])
+
+    def testSeekToKeyframe(self):
+        logs = self.seekTo(self.times[199])
+
+        self.assertEqual(len(logs), 1)
+        self.assertEqual(logs[0].snapshot.version, 200)
+
+    def testSeekBeforeStart(self):
+        logs = self.seekTo(0)
+
+        self.assertEqual(len(logs), 1)
+        self.assertEqual(logs[0].snapshot.version, 0)
+
+    def testSeek(self):
+        # replayed at a crawl, so the replay thread stays at the time sought
+        self.replay = ReplaySimulator(self.directory, speed=1e-9)
+        self.replay.addClient(1)
+        self.replay.setDaemon(True)
+        self.replay.start()
+
+        self.replay.seek(self.times[149])
+        logs = self.replayed(1)
+        self.assertEqual(logs[0].snapshot.version, 100)
+        self.assertEqual([frame.sequence for frame in logs[1:]], range(101, 151))
+
+        # let the replay run to the end of the recording, and stop once its client left
+        self.replay.idleTimeout = 0
+        self.replay.onIdle = lambda replay: True
+        self.replay.removeClient(1)
+        self.replay.setSpeed(None)
+        self.replay.join(10)
+        self.assertFalse(self.replay.isAlive())
+        self.replay = None
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+from copy import deepcopy
+from json import loads
+import unittest
+from src.Scenarios import randomSimulator
+from src.SimulatorInterface import snapshotPieces
+from src.simulator.Clock import VirtualClock
+from src.simulator.Compression import joinPieces
+
+__author__ = 'Roman'
+
+class SnapshotTest(unittest.TestCase):
+
+    def testSnapshotStateIsImmutable(self):
+        simulator = randomSimulator(VirtualClock(0, 1))
+        snapshot = simulator.snapshot
+        clusterState = deepcopy(snapshot.clusterState)
+
+        for i in xrange(0, 200):
+            simulator.tick()
+            simulator.step()
+
+        self.assertEqual(snapshot.clusterState, clusterState)
+
+    def testStructureLeftOutForKnownTopology(self):
+        snapshot = randomSimulator(VirtualClock(0, 1)).snapshot
+        response = loads(joinPieces(snapshotPieces(snapshot, successful=True)))
+        self.assertEqual(response['structure'], loads(snapshot.topology))
+
+        known = loads(joinPieces(snapshotPieces(snapshot, None, response['topologyTag'], successful=True)))
+        self.assertNotIn('structure', known)
+        self.assertEqual(known['topologyTag'], response['topologyTag'])
+        self.assertEqual(known['currentState'], response['currentState'])
+
+        stale = loads(joinPieces(snapshotPieces(snapshot, None, 'stale', successful=True)))
+        self.assertEqual(stale['structure'], response['structure'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import shutil
+import tempfile
+import unittest
+from src.Scenarios import randomSimulator
+from src.simulator.Clock import VirtualClock
+from src.simulator.Recording import RecordedFrame, RecordingReader
+from src.simulator.TickFrame import TickFrame
+
+__author__ = 'Roman'
+
+class TickFrameTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def record(self, ticks):
+        """
+            Runs a simulator for the given number of ticks, recording them, and returns the frames it produced
+        """
+        simulator = randomSimulator(VirtualClock(0, 1), recordTo=self.directory)
+        frames = []
+        for i in xrange(0, ticks):
+            simulator.tick()
+            frames.append(simulator.step())
+        simulator.stopRecording()
+        return frames
+
+    def testCoalesceRecordedFrames(self):
+        frames = self.record(3)
+        recorded = [record for record, timestamp in RecordingReader(self.directory).records(0)
+                    if isinstance(record, RecordedFrame)]
+        self.assertEqual([frame.sequence for frame in recorded], [frame.sequence for frame in frames])
+
+        coalesced = TickFrame.coalesce(recorded)
+        self.assertEqual(coalesced.sequence, frames[-1].sequence)
+        self.assertEqual(coalesced.firstSequence, frames[0].sequence)
+        self.assertEqual(coalesced.log, TickFrame.coalesce(frames).log)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+from time import time
+import unittest
+from src.Scenarios import randomSimulator
+from src.simulator.Clock import VirtualClock
+from src.simulator.TickRing import Resync, TickRing
+
+__author__ = 'Roman'
+
+class Frame(object):
+    """
+        The only part of a frame the ring looks at
+    """
+
+    def __init__(self, sequence):
+        self.sequence = sequence
+
+
+class TickRingTest(unittest.TestCase):
+
+    def testEmptyRing(self):
+        ring = TickRing(4)
+        self.assertEqual(ring.oldestSequence(), 1)
+        self.assertFalse(ring.contains(0))
+        self.assertFalse(ring.contains(1))
+
+    def testWraparound(self):
+        ring = TickRing(4)
+        for sequence in xrange(1, 11):
+            ring.append(Frame(sequence))
+
+        self.assertEqual(ring.lastSequence, 10)
+        self.assertEqual(ring.oldestSequence(), 7)
+        self.assertEqual([sequence for sequence in xrange(0, 13) if ring.contains(sequence)], [7, 8, 9, 10])
+        self.assertEqual([ring.get(sequence).sequence for sequence in xrange(7, 11)], [7, 8, 9, 10])
+
+    def testStartsPastFirstSequence(self):
+        ring = TickRing(4)
+        for sequence in xrange(21, 24):
+            ring.append(Frame(sequence))
+
+        self.assertEqual(ring.oldestSequence(), 21)
+        self.assertFalse(ring.contains(20))
+        self.assertTrue(ring.contains(23))
+
+
+class BaseSimulatorTest(unittest.TestCase):
+
+    def setUp(self):
+        # keeps max(50, 2 * 5) frames, and publishes a snapshot every 5 ticks
+        self.simulator = randomSimulator(VirtualClock(0, 1), snapshotInterval=5)
+
+    def produce(self, ticks):
+        for i in xrange(0, ticks):
+            self.simulator.tick()
+            self.simulator.step()
+
+    def testReadsEveryFrameInOrder(self):
+        self.simulator.addClient(1)
+        self.produce(3)
+
+        self.assertEqual([self.simulator.getNextLog(1).sequence for i in xrange(0, 3)], [1, 2, 3])
+        self.assertEqual(self.simulator.pollLogs(1, 10), [])
+
+    def testResyncOnceBehind(self):
+        snapshot = self.simulator.addClient(1)
+        self.assertEqual(snapshot.version, 0)
+        self.produce(self.simulator.ring.capacity + 10)
+
+        log = self.simulator.getNextLog(1)
+        self.assertTrue(isinstance(log, Resync))
+        self.assertEqual(log.snapshot.version, 60)
+        self.assertEqual(log.skipped, 60)
+
+        # the client then reads on from the snapshot
+        self.produce(1)
+        self.assertEqual(self.simulator.getNextLog(1).sequence, 61)
+
+    def testResyncSkipsToLatestSnapshot(self):
+        self.simulator.addClient(1)
+        self.produce(self.simulator.ring.capacity + 12)
+
+        logs = self.simulator.getNextLogs(1, 10)
+        self.assertTrue(isinstance(logs, Resync))
+        self.assertEqual(logs.snapshot.version, 60)
+        self.assertEqual(logs.skipped, 60)
+
+        # the ticks after the snapshot are still in the ring
+        self.assertEqual([frame.sequence for frame in self.simulator.getNextLogs(1, 10)], [61, 62])
+
+    def testResumeAtLastSequence(self):
+        self.produce(3)
+        self.assertEqual(self.simulator.resumeClient(1, self.simulator.ring.lastSequence), None)
+        self.assertEqual(self.simulator.pollLogs(1, 10), [])
+
+        self.produce(1)
+        self.assertEqual([frame.sequence for frame in self.simulator.pollLogs(1, 10)], [4])
+
+    def testResumeInRing(self):
+        self.produce(5)
+        self.assertEqual(self.simulator.resumeClient(1, 2), None)
+        self.assertEqual([frame.sequence for frame in self.simulator.pollLogs(1, 10)], [3, 4, 5])
+
+    def testResumeOutOfRing(self):
+        self.produce(self.simulator.ring.capacity + 12)
+        self.assertFalse(self.simulator.ring.contains(2))
+
+        snapshot = self.simulator.resumeClient(1, 1)
+        self.assertEqual(snapshot.version, 60)
+        self.assertEqual([frame.sequence for frame in self.simulator.pollLogs(1, 10)], [61, 62])
+
+    def testRestart(self):
+        self.simulator.addClient(1)
+        self.simulator.addClient(2)
+        self.produce(3)
+        self.simulator.getNextLog(1)
+
+        snapshot = self.simulator.takeSnapshot()
+        self.simulator.restart(snapshot)
+
+        first = self.simulator.getNextLog(1)
+        second = self.simulator.pollLogs(2, 10)
+        for log in (first, second):
+            self.assertTrue(isinstance(log, Resync))
+            self.assertTrue(log.snapshot is snapshot)
+            self.assertEqual(log.skipped, snapshot.version + 1)
+
+        # both clients then read on from the snapshot
+        self.produce(1)
+        self.assertEqual(self.simulator.getNextLog(1).sequence, snapshot.version + 1)
+        self.assertEqual([frame.sequence for frame in self.simulator.pollLogs(2, 10)], [snapshot.version + 1])
+
+    def testGetNextLogsReturnsAfterMaxWait(self):
+        self.simulator.addClient(1)
+        self.produce(2)
+
+        started = time()
+        logs = self.simulator.getNextLogs(1, 10, 0.05)
+        self.assertGreaterEqual(time() - started, 0.05)
+        self.assertEqual([frame.sequence for frame in logs], [1, 2])
+
+    def testGetNextLogsReturnsOnceMaxLogsAvailable(self):
+        self.simulator.addClient(1)
+        self.produce(3)
+
+        started = time()
+        logs = self.simulator.getNextLogs(1, 2, 10)
+        self.assertLess(time() - started, 1)
+        self.assertEqual([frame.sequence for frame in logs], [1, 2])
+
+    def testRemovedClient(self):
+        self.simulator.addClient(1)
+        self.simulator.removeClient(1)
+
+        self.assertEqual(self.simulator.getNextLog(1), None)
+        self.assertEqual(self.simulator.getNextLogs(1, 10), None)
+        self.assertEqual(self.simulator.pollLogs(1, 10), None)
+
+if __name__ == '__main__':
+    unittest.main()